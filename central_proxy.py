@@ -3,13 +3,22 @@
 import jamulus
 
 import argparse
+import collections
+import concurrent.futures
 import signal
+import statistics
 import sys
 
-from time import time
+from time import monotonic, time
 
 
 DEFAULT_INTERVAL = 300
+DEFAULT_TIMEOUT = 5
+RESOLVER_POLL_INTERVAL = 1
+ENCODE_POLL_INTERVAL = 0.005  # seconds between checks for finished server list encodings
+DEFAULT_ENCODE_WORKERS = 1
+RESPONSE_TIMES = 10000  # number of server list response times kept for the percentiles
+RESPONSE_REPORT_INTERVAL = 60
 
 
 class ServerList(dict):
@@ -45,7 +54,7 @@ class ServerList(dict):
 
     def add_single(self, source_host, server):
         server["ip"] = source_host[0]
-        key = (server["ip"], server["port"])
+        key = jamulus.normalize_address((server["ip"], server["port"]))
         self.create_or_update_server(key, server)
         print(ServerList.format_server(self[key]))
 
@@ -55,7 +64,7 @@ class ServerList(dict):
                 # central servers first (own) entry
                 server["ip"], server["port"] = source_host
             server["source_host"] = source_host
-            key = (server["ip"], server["port"])
+            key = jamulus.normalize_address((server["ip"], server["port"]))
             self.create_or_update_server(key, server)
 
     def remove_server(self, key):
@@ -64,7 +73,8 @@ class ServerList(dict):
             del self[key]
 
     def get_list(self, add_dummy=True):
-        server_list = list(self.values())
+        # servers only known by an IPv6 address can't be listed (IPv4 address field)
+        server_list = [server for server in self.values() if jamulus.is_ipv4(server["ip"])]
         if add_dummy:
             server_list.insert(
                 0,
@@ -92,29 +102,199 @@ class ServerList(dict):
 
 
 class ActionScheduler:
-    def __init__(self, jamulus, central_servers, interval):
+    def __init__(self, jamulus, resolver, central_servers, interval, timeout=DEFAULT_TIMEOUT, on_change=None):
         self.jamulus = jamulus
+        self.resolver = resolver
         self.central_servers = central_servers
         self.interval = interval
+        self.timeout = timeout
+        self.on_change = on_change
         self.next_action = time()
+        # central server -> address in use
+        self.addresses = {}
+        # central server -> (time requested, addresses tried) of unanswered requests
+        self.requests = {}
+        for server in central_servers:
+            resolver.add(server)
+            self.addresses[server] = resolver.address(server)
+
+    def received(self, addr):
+        # server list received, the central server using the address answered
+        for server, server_addr in self.addresses.items():
+            if server_addr == addr:
+                self.requests.pop(server, None)
+
+    def change_address(self, server, addr):
+        old_addr = self.addresses[server]
+        if addr != old_addr:
+            print("central server {} changed from {} to {}".format(server.host, old_addr, addr))
+            self.addresses[server] = addr
+            if self.on_change is not None:
+                self.on_change(old_addr, addr)
+
+    def request(self, server, now, tried=1):
+        self.jamulus.sendto(self.addresses[server], "CLM_REQ_SERVER_LIST")
+        self.requests[server] = (now, tried)
 
     def run(self):
+        now = time()
+
+        # follow DNS changes, host names are resolved again in the background
+        for server in self.central_servers:
+            self.change_address(server, self.resolver.address(server))
+
+        # fail over to the next address of central servers that did not answer
+        for server, (requested, tried) in list(self.requests.items()):
+            if requested + self.timeout <= now:
+                del self.requests[server]
+                if tried < len(self.resolver.addresses(server)):
+                    print("no server list from {}, failing over".format(self.addresses[server]))
+                    self.change_address(server, self.resolver.failover(server))
+                    self.request(server, now, tried + 1)
+
         # request server lists
-        if self.next_action <= time():
+        if self.next_action <= now:
             print("request server lists")
 
-            for addr in self.central_servers:
-                self.jamulus.sendto(addr, "CLM_REQ_SERVER_LIST")
+            for server in self.central_servers:
+                self.request(server, now)
 
             self.next_action += self.interval
 
         # return maximum time after which the scheduler needs to run again
-        return self.next_action - time()
+        timeout = self.next_action - now
+        if len(self.requests) > 0:
+            timeout = min(timeout, min(requested for requested, tried in self.requests.values()) + self.timeout - now)
+        if self.resolver.pending:
+            timeout = min(timeout, RESOLVER_POLL_INTERVAL)
+        return timeout
+
+
+def encode_server_lists(servers, country_ids):
+    # get, filter and encode the server list (runs in a worker thread / process)
+    server_list_send = ServerList(servers)
+    server_list_send.filter(country_ids)
+    print("encoding {} servers\n{}".format(len(server_list_send), server_list_send))
+
+    # encode as many servers as fit into a single message
+    jc = jamulus.JamulusConnector(port=None, log=False)
+    values = server_list_send.get_list()
+    encoded = {}
+    for key, key_values in [
+        ("CLM_RED_SERVER_LIST", map(jamulus.reduced_server, values)),
+        ("CLM_SERVER_LIST", values),
+    ]:
+        data, servers = next(jc.main_pack_pages(key, key_values))
+        if servers < len(values):
+            print("server list too long, sending {} of {} servers".format(servers, len(values)))
+        encoded[key] = (data, servers)
+    return encoded
+
+
+class ListEncoder:
+    # encodes server lists in a worker pool, requests wait for the encoding in progress
+    def __init__(self, jamulus, country_ids, workers, processes=False, metrics=None):
+        self.jamulus = jamulus
+        self.country_ids = country_ids
+        self.metrics = metrics
+        if workers == 0:
+            self.executor = None
+        elif processes:
+            self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+        else:
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+
+        # encoded (reduced) server list messages, cleared when the server list changes
+        self.cache = {}
+        self.version = 0
+        self.future = None
+        self.future_version = None
+        # (addr, time requested) of requests waiting for the encoding
+        self.waiting = []
+        self.response_times = collections.deque(maxlen=RESPONSE_TIMES)
+
+    def invalidate(self):
+        self.cache = {}
+        self.version += 1
+
+    def request(self, addr, server_list):
+        if len(self.cache) > 0:
+            self.send(self.cache, addr, monotonic())
+            return
+
+        self.waiting.append((addr, monotonic()))
+        if self.future is None:
+            # copy the servers, the list is updated while the encoding runs
+            servers = {key: dict(server) for key, server in server_list.items()}
+            if self.executor is None:
+                self.complete(encode_server_lists(servers, self.country_ids), self.version)
+            else:
+                self.future = self.executor.submit(encode_server_lists, servers, self.country_ids)
+                self.future_version = self.version
+
+    def poll(self):
+        # send finished encodings, return maximum time after which to poll again
+        if self.future is None:
+            return None
+        if not self.future.done():
+            return ENCODE_POLL_INTERVAL
+
+        future, self.future = self.future, None
+        try:
+            encoded = future.result()
+        except Exception as error:
+            print("error encoding server lists: {}".format(error))
+            self.waiting.clear()
+            return None
+        self.complete(encoded, self.future_version)
+        return None
+
+    def complete(self, encoded, version):
+        waiting, self.waiting = self.waiting, []
+        for addr, requested in waiting:
+            self.send(encoded, addr, requested)
+        # lists of servers that changed in the meantime are encoded again on the next request
+        if version == self.version:
+            self.cache = encoded
+
+    def send(self, encoded, addr, requested):
+        # send reduced (filtered) server list first, followed by the full list
+        for key in ["CLM_RED_SERVER_LIST", "CLM_SERVER_LIST"]:
+            data, servers = encoded[key]
+            print("sending {} servers".format(servers))
+            self.jamulus.send_data(addr, key, data, count=0)
+
+        response_time = monotonic() - requested
+        self.response_times.append(response_time)
+        if self.metrics is not None:
+            self.metrics.observe("jamulus_server_list_response_seconds", response_time)
+
+    def report(self):
+        output = "{} server list responses".format(len(self.response_times))
+        if len(self.response_times) > 1:
+            percentiles = statistics.quantiles(self.response_times, n=100, method="inclusive")
+            output += ", response time ms p50 {:.2f} p90 {:.2f} p99 {:.2f} max {:.2f}".format(
+                percentiles[49] * 1000,
+                percentiles[89] * 1000,
+                percentiles[98] * 1000,
+                max(self.response_times) * 1000,
+            )
+        self.response_times.clear()
+        return output
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
 
 
 def argument_parser():
     parser = argparse.ArgumentParser()
     parser.add_argument("--port", type=int, default=jamulus.DEFAULT_PORT, help="local port number")
+    parser.add_argument(
+        "--upstream-port",
+        type=int,
+        help="local port number for polling the central servers (0 = any free port), default = same port as clients",
+    )
     parser.add_argument(
         "--centralserver",
         type=jamulus.server_argument,
@@ -130,6 +310,12 @@ def argument_parser():
         default=DEFAULT_INTERVAL,
         help="central server collection interval",
     )
+    parser.add_argument(
+        "--dns-ttl",
+        type=float,
+        default=jamulus.DNS_TTL,
+        help="seconds after which central server host names are resolved again",
+    )
     parser.add_argument(
         "--filter",
         type=int,
@@ -143,6 +329,18 @@ def argument_parser():
         action="store_true",
         help="log protocol data",
     )
+    jamulus.add_server_arguments(parser)
+    parser.add_argument(
+        "--encode-workers",
+        type=int,
+        default=DEFAULT_ENCODE_WORKERS,
+        help="number of workers encoding server lists (0 = encode in the receive loop)",
+    )
+    parser.add_argument(
+        "--encode-processes",
+        action="store_true",
+        help="encode server lists in worker processes instead of threads",
+    )
     return parser.parse_args()
 
 
@@ -153,50 +351,130 @@ def main():
     # get arguments
     args = argument_parser()
 
-    # create jamulus connector
-    jc = jamulus.JamulusConnector(port=args.port, log_data=args.log_data)
+    # profile message handling if requested
+    profiler = jamulus.Profiler(report_interval=args.profile) if args.profile is not None else None
+    if profiler is not None:
+        profiler.install_signal(signal.SIGUSR1)
+
+    # collect metrics if requested
+    metrics = jamulus.Metrics() if args.metrics_port is not None else None
+    if metrics is not None:
+        metrics.serve(args.metrics_port)
+
+    # create jamulus connectors, clients and central servers on separate sockets if requested
+    jc = jamulus.JamulusConnector(
+        port=args.port,
+        log_data=args.log_data,
+        metrics=metrics,
+        profiler=profiler,
+        rcvbuf=args.rcvbuf,
+        sndbuf=args.sndbuf,
+    )
+    if args.upstream_port is not None:
+        upstream = jamulus.JamulusConnector(
+            port=args.upstream_port,
+            log_data=args.log_data,
+            metrics=metrics,
+            profiler=profiler,
+        )
+    else:
+        upstream = jc
 
     # create empty server list
     server_list = ServerList()
 
+    # resolve central server host names again in the background
+    resolver = jamulus.Resolver(ttl=args.dns_ttl)
+
+    # encode server lists without blocking the receive loop
+    list_encoder = ListEncoder(jc, args.filter, args.encode_workers, args.encode_processes, metrics=metrics)
+
+    def disconnect(addr, key, count, values):
+        # stop clients from connecting
+        jc.sendto(addr, "CLM_DISCONNECTION")
+
+    def add_servers(addr, key, count, message):
+        # add servers to list, decoding one server record at a time
+        print("add/update {} servers".format(len(message)))
+        server_list.add_list(addr, message.records())
+        list_encoder.invalidate()
+        scheduler.received(addr)
+
+    def change_central_server(old_addr, new_addr):
+        # only accept server lists from the addresses in use (central servers may share an address)
+        if old_addr not in scheduler.addresses.values():
+            upstream_dispatcher.remove_handler("CLM_SERVER_LIST", addr=old_addr)
+        upstream_dispatcher.add_handler("CLM_SERVER_LIST", add_servers, addr=new_addr, lazy=True)
+
+    def send_server_list(addr, key, count, values):
+        # sent right away if the lists are encoded already, otherwise once they are
+        list_encoder.request(addr, server_list)
+
+    # dispatch messages to handlers, other messages are not decoded
+    dispatcher = jamulus.Dispatcher(jc)
+    dispatcher.add_handler("AUDIO", disconnect)
+    dispatcher.add_handler("CLM_REQ_SERVER_LIST", send_server_list)
+    upstream_dispatcher = jamulus.Dispatcher(upstream) if upstream is not jc else dispatcher
+
     # initiate repeated actions
     scheduler = ActionScheduler(
-        jamulus=jc,
+        jamulus=upstream,
+        resolver=resolver,
         central_servers=args.centralserver,
         interval=args.interval,
+        on_change=change_central_server,
     )
+    for central_server in args.centralserver:
+        # only accept server lists from the central servers
+        upstream_dispatcher.add_handler(
+            "CLM_SERVER_LIST",
+            add_servers,
+            addr=scheduler.addresses[central_server],
+            lazy=True,
+        )
+
+    # shed requests of clients under overload if requested
+    if args.overload:
+        overload_policy = jamulus.OverloadPolicy(jc, metrics=metrics)
+        if not overload_policy.supported:
+            print("overload detection is not supported on this platform")
+        dispatcher.add_middleware(overload_policy)
+
+    # limit requests per source IP if requested
+    if args.rate_limit is not None:
+        budgets = dict.fromkeys(jamulus.RATE_LIMITED_KEYS, tuple(args.rate_limit))
+        dispatcher.add_middleware(jamulus.RateLimiter(budgets, metrics=metrics))
+
+    # receive from all sockets
+    connectors = jamulus.ConnectorGroup()
+    connectors.add(jc, dispatcher)
+    if upstream is not jc:
+        connectors.add(upstream, upstream_dispatcher)
+
+    next_report = monotonic() + RESPONSE_REPORT_INTERVAL
 
     # receive messages indefinitely
     while True:
         timeout = scheduler.run()
 
+        # send server lists that finished encoding
+        poll_timeout = list_encoder.poll()
+        if poll_timeout is not None:
+            timeout = min(timeout, poll_timeout)
+
+        if monotonic() >= next_report:
+            print(list_encoder.report())
+            next_report += RESPONSE_REPORT_INTERVAL
+
         if timeout is not None and timeout <= 0:
             print("negative timeout {}".format(timeout))
             continue
 
         try:
-            addr, key, count, values = jc.recvfrom(timeout)
+            connectors.recv(timeout)
         except TimeoutError:
             continue
 
-        if key == "AUDIO":
-            # stop clients from connecting
-            jc.sendto(addr, "CLM_DISCONNECTION")
-
-        elif key == "CLM_SERVER_LIST":
-            # add servers to list
-            print("add/update {} servers".format(len(values)))
-            server_list.add_list(addr, values)
-
-        elif key == "CLM_REQ_SERVER_LIST":
-            # get and filter server list
-            server_list_send = server_list.copy()
-            server_list_send.filter(args.filter)
-
-            # send (filtered) server list
-            print("sending {} servers\n{}".format(len(server_list_send), server_list_send))
-            jc.sendto(addr, "CLM_SERVER_LIST", server_list_send.get_list())
-
 
 def signal_handler(sig, frame):
     print()
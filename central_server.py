@@ -15,6 +15,7 @@ def argument_parser():
         action="store_true",
         help="log protocol data",
     )
+    jamulus.add_server_arguments(parser, profile=False)
     return parser.parse_args()
 
 
@@ -22,53 +23,113 @@ def main():
     # get arguments
     args = argument_parser()
 
+    # collect metrics if requested
+    metrics = jamulus.Metrics() if args.metrics_port is not None else None
+    if metrics is not None:
+        metrics.serve(args.metrics_port)
+
     # create jamulus connector
-    jc = jamulus.JamulusConnector(port=args.port, log_data=args.log_data)
+    jc = jamulus.JamulusConnector(
+        port=args.port,
+        log_data=args.log_data,
+        metrics=metrics,
+        rcvbuf=args.rcvbuf,
+        sndbuf=args.sndbuf,
+    )
 
     # create empty server list
     server_list = {}
 
-    # receive messages indefinitely
-    while True:
-        addr, key, count, values = jc.recvfrom()
+    # encoded (reduced) server list messages, cleared when the server list changes
+    server_list_cache = {}
 
-        if key == "AUDIO":
-            # stop clients from connecting
-            jc.sendto(addr, "CLM_DISCONNECTION")
+    def disconnect(addr, key, count, values):
+        # stop clients from connecting
+        jc.sendto(addr, "CLM_DISCONNECTION")
 
-        elif key in ["CLM_REGISTER_SERVER", "CLM_REGISTER_SERVER_EX"]:
-            # add server to list
-            values["ip"] = addr[0]
+    def register_server(addr, key, count, values):
+        # add server to list
+        values["ip"] = addr[0]
+        # periodic registrations of known servers don't change the encoded lists
+        if server_list.get(addr) != values:
             server_list[addr] = values
+            server_list_cache.clear()
+
+        print("registering server\n{}".format(values))
+
+        # send successful registration response
+        jc.sendto(addr, "CLM_REGISTER_SERVER_RESP", {"status": 0})
+
+    def unregister_server(addr, key, count, values):
+        print("unregistering server")
+
+        # remove server from list
+        if addr in server_list.keys():
+            del server_list[addr]
+            server_list_cache.clear()
+
+    def encode_server_lists():
+        # server list with dummy entry in first position
+        server_list_send = [
+            {
+                "ip": "0.0.0.0",
+                "port": 0,
+                "country_id": 0,
+                "max_clients": 0,
+                "permanent": 0,
+                "name": "",
+                "internal_address": "",
+                "city": "",
+            }
+        ] + [server for server in server_list.values() if jamulus.is_ipv4(server["ip"])]
+        print("encoding {} servers\n{}".format(len(server_list_send), server_list_send))
+        if len(server_list_send) <= len(server_list):
+            # the server list only has an IPv4 address field
+            print("skipping {} servers registered over IPv6".format(len(server_list) + 1 - len(server_list_send)))
+
+        # encode as many servers as fit into a single message
+        for key, values in [
+            ("CLM_RED_SERVER_LIST", map(jamulus.reduced_server, server_list_send)),
+            ("CLM_SERVER_LIST", server_list_send),
+        ]:
+            data, servers = next(jc.main_pack_pages(key, values))
+            if servers < len(server_list_send):
+                print("server list too long, sending {} of {} servers".format(servers, len(server_list_send)))
+            server_list_cache[key] = (data, servers)
+
+    def send_server_list(addr, key, count, values):
+        if len(server_list_cache) == 0:
+            encode_server_lists()
+
+        # send reduced server list first, followed by the full list
+        for key in ["CLM_RED_SERVER_LIST", "CLM_SERVER_LIST"]:
+            data, servers = server_list_cache[key]
+            print("sending {} servers".format(servers))
+            jc.send_data(addr, key, data, count=0)
+
+    # dispatch messages to handlers, other messages are not decoded
+    dispatcher = jamulus.Dispatcher(jc)
+    dispatcher.add_handler("AUDIO", disconnect)
+    dispatcher.add_handler("CLM_REGISTER_SERVER", register_server)
+    dispatcher.add_handler("CLM_REGISTER_SERVER_EX", register_server)
+    dispatcher.add_handler("CLM_UNREGISTER_SERVER", unregister_server)
+    dispatcher.add_handler("CLM_REQ_SERVER_LIST", send_server_list)
+
+    # keep registrations going under overload if requested
+    if args.overload:
+        overload_policy = jamulus.OverloadPolicy(jc, metrics=metrics)
+        if not overload_policy.supported:
+            print("overload detection is not supported on this platform")
+        dispatcher.add_middleware(overload_policy)
+
+    # limit requests per source IP if requested
+    if args.rate_limit is not None:
+        budgets = dict.fromkeys(jamulus.RATE_LIMITED_KEYS, tuple(args.rate_limit))
+        dispatcher.add_middleware(jamulus.RateLimiter(budgets, metrics=metrics))
 
-            print("registering server\n{}".format(values))
-
-            # send successful registration response
-            jc.sendto(addr, "CLM_REGISTER_SERVER_RESP", {"status": 0})
-
-        elif key == "CLM_UNREGISTER_SERVER":
-            print("unregistering server")
-
-            # remove server from list
-            if addr in server_list.keys():
-                del server_list[addr]
-
-        elif key == "CLM_REQ_SERVER_LIST":
-            # send server list with dummy entry in first position
-            server_list_send = [
-                {
-                    "ip": "0.0.0.0",
-                    "port": 0,
-                    "country_id": 0,
-                    "max_clients": 0,
-                    "permanent": 0,
-                    "name": "",
-                    "internal_address": "",
-                    "city": "",
-                }
-            ] + list(server_list.values())
-            print("sending {} servers\n{}".format(len(server_list_send), server_list_send))
-            jc.sendto(addr, "CLM_SERVER_LIST", server_list_send)
+    # receive messages indefinitely
+    while True:
+        dispatcher.recv()
 
 
 def signal_handler(sig, frame):
@@ -0,0 +1,298 @@
+#!/usr/bin/python3
+
+import jamulus
+
+import argparse
+import heapq
+import random
+import resource
+import selectors
+import signal
+import socket
+import statistics
+import sys
+
+from collections import deque
+from time import monotonic
+
+
+DEFAULT_SERVERS = 1000
+DEFAULT_REFRESH = 900  # Jamulus servers re-register every 15 minutes
+DEFAULT_RAMP = 10
+DEFAULT_LIST_RATE = 10
+DEFAULT_LIST_SOCKETS = 50
+DEFAULT_TIMEOUT = 2
+DEFAULT_DURATION = 60
+SOCKETS_PER_ADDRESS = 10000
+REPORT_INTERVAL = 5
+
+# main frame tag and message ID
+FORMAT_HEADER = jamulus.FORMAT["MAIN_FRAME"][:2]
+
+
+class LatencyStats:
+    def __init__(self, name):
+        self.name = name
+        self.sent = 0
+        self.latencies = []
+        self.dropped = 0
+
+    def add(self, latency):
+        self.latencies.append(latency)
+
+    def __str__(self):
+        output = "{}: {} sent, {} received, {} dropped".format(self.name, self.sent, len(self.latencies), self.dropped)
+        if len(self.latencies) > 1:
+            percentiles = statistics.quantiles(self.latencies, n=100, method="inclusive")
+            output += ", latency ms p50 {:.2f} p90 {:.2f} p99 {:.2f} max {:.2f}".format(
+                percentiles[49] * 1000,
+                percentiles[89] * 1000,
+                percentiles[98] * 1000,
+                max(self.latencies) * 1000,
+            )
+        return output
+
+
+class Endpoint:
+    # a local socket simulating a single server or list client
+    __slots__ = ("sock", "frame", "pending")
+
+    def __init__(self, sock, frame):
+        self.sock = sock
+        self.frame = frame
+        self.pending = deque()
+
+
+class DirectoryStress:
+    def __init__(self, jc, directory, servers, list_sockets, timeout):
+        self.jc = jc
+        self.directory = directory
+        self.timeout = timeout
+        self.selector = selectors.DefaultSelector()
+        self.registrations = LatencyStats("registrations")
+        self.reduced_lists = LatencyStats("reduced server lists")
+        self.lists = LatencyStats("server lists")
+        self.decode_errors = 0
+
+        self.servers = [self.create_endpoint(n, self.register_frame(n)) for n in range(servers)]
+        list_frame = jc.main_pack("CLM_REQ_SERVER_LIST", {}, 0)
+        self.clients = [self.create_endpoint(servers + n, list_frame) for n in range(list_sockets)]
+
+    def create_endpoint(self, number, frame):
+        # spread sockets across loopback addresses to get enough local ports
+        host = "127.0.{}.{}".format(*divmod(1 + number // SOCKETS_PER_ADDRESS, 256))
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setblocking(False)
+        sock.bind((host, 0))
+        endpoint = Endpoint(sock, frame)
+        self.selector.register(sock, selectors.EVENT_READ, endpoint)
+        return endpoint
+
+    def register_frame(self, number):
+        return self.jc.main_pack(
+            "CLM_REGISTER_SERVER_EX",
+            {
+                "port": jamulus.DEFAULT_PORT,
+                "country_id": number % 262,
+                "max_clients": 10,
+                "permanent": 0,
+                "name": "Stress {}".format(number),
+                "internal_address": "",
+                "city": "Loopback",
+                "os": 2,
+                "version": "python-stress",
+            },
+            0,
+        )
+
+    def close(self):
+        for endpoint in self.servers + self.clients:
+            self.selector.unregister(endpoint.sock)
+            endpoint.sock.close()
+        self.selector.close()
+
+    def send(self, endpoint, stats, now):
+        try:
+            endpoint.sock.sendto(endpoint.frame, self.directory)
+        except OSError:
+            stats.dropped += 1
+            return
+        endpoint.pending.append(now)
+        stats.sent += 1
+
+    def receive(self, endpoint, now):
+        try:
+            data, addr = endpoint.sock.recvfrom(jamulus.MAX_SIZE_BYTES_NETW_BUF)
+        except BlockingIOError:
+            return
+
+        # only the message ID is needed, skip decoding the payload
+        try:
+            values, offset = self.jc.unpack(FORMAT_HEADER, data)
+            key = jamulus.MSG_KEYS.get(values["id"])
+        except ValueError:
+            self.decode_errors += 1
+            return
+
+        if key == "CLM_RED_SERVER_LIST":
+            # sent before the full server list, keep the request pending
+            if len(endpoint.pending) > 0:
+                self.reduced_lists.add(now - endpoint.pending[0])
+            return
+        elif key == "CLM_REGISTER_SERVER_RESP":
+            stats = self.registrations
+        elif key == "CLM_SERVER_LIST":
+            stats = self.lists
+        else:
+            return
+
+        if len(endpoint.pending) > 0:
+            stats.add(now - endpoint.pending.popleft())
+
+    def expire(self, endpoints, stats, now):
+        for endpoint in endpoints:
+            while len(endpoint.pending) > 0 and endpoint.pending[0] < now - self.timeout:
+                endpoint.pending.popleft()
+                stats.dropped += 1
+
+    def run(self, duration, refresh, ramp, list_rate):
+        now = monotonic()
+        time_end = now + duration
+        next_report = now + REPORT_INTERVAL
+
+        # schedule initial registrations evenly across the ramp up time
+        schedule = [(now + ramp * n / max(1, len(self.servers)), n) for n in range(len(self.servers))]
+        heapq.heapify(schedule)
+
+        list_period = 1 / list_rate if list_rate > 0 else None
+        next_list = now
+        list_index = 0
+
+        while now < time_end:
+            # registrations and refreshes that are due
+            while len(schedule) > 0 and schedule[0][0] <= now:
+                _, n = heapq.heappop(schedule)
+                self.send(self.servers[n], self.registrations, now)
+                heapq.heappush(schedule, (now + refresh * random.uniform(0.9, 1.1), n))
+
+            # server list requests that are due
+            while list_period is not None and len(self.clients) > 0 and next_list <= now:
+                self.send(self.clients[list_index], self.lists, now)
+                self.reduced_lists.sent = self.lists.sent
+                list_index = (list_index + 1) % len(self.clients)
+                next_list += list_period
+
+            if now >= next_report:
+                self.expire(self.servers, self.registrations, now)
+                self.expire(self.clients, self.lists, now)
+                print("{}\n{}\n{}".format(self.registrations, self.reduced_lists, self.lists))
+                next_report += REPORT_INTERVAL
+
+            next_action = min(next_report, time_end)
+            if len(schedule) > 0:
+                next_action = min(next_action, schedule[0][0])
+            if list_period is not None and len(self.clients) > 0:
+                next_action = min(next_action, next_list)
+
+            for selector_key, events in self.selector.select(max(0, next_action - monotonic())):
+                self.receive(selector_key.data, monotonic())
+
+            now = monotonic()
+
+        # wait for outstanding responses
+        time_end = now + self.timeout
+        while now < time_end:
+            for selector_key, events in self.selector.select(time_end - now):
+                self.receive(selector_key.data, monotonic())
+            now = monotonic()
+
+        self.expire(self.servers, self.registrations, now + self.timeout)
+        self.expire(self.clients, self.lists, now + self.timeout)
+
+
+def raise_file_limit(required):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != resource.RLIM_INFINITY and soft < required:
+        limit = required if hard == resource.RLIM_INFINITY else min(required, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (limit, hard))
+        if limit < required:
+            print("warning: file limit {} is lower than the {} required sockets".format(limit, required))
+
+
+def argument_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--directory",
+        type=jamulus.server_argument,
+        required=True,
+        help="directory (central server) to stress",
+    )
+    parser.add_argument("--servers", type=int, default=DEFAULT_SERVERS, help="number of simulated servers")
+    parser.add_argument(
+        "--refresh",
+        type=float,
+        default=DEFAULT_REFRESH,
+        help="seconds between registration refreshes of a server",
+    )
+    parser.add_argument(
+        "--ramp",
+        type=float,
+        default=DEFAULT_RAMP,
+        help="seconds to spread the initial registrations over",
+    )
+    parser.add_argument(
+        "--list-rate",
+        type=float,
+        default=DEFAULT_LIST_RATE,
+        help="server list requests per second",
+    )
+    parser.add_argument(
+        "--list-sockets",
+        type=int,
+        default=DEFAULT_LIST_SOCKETS,
+        help="number of sockets used for server list requests",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=DEFAULT_TIMEOUT,
+        help="seconds after which a missing response counts as dropped",
+    )
+    parser.add_argument("--duration", type=float, default=DEFAULT_DURATION, help="seconds to run")
+
+    return parser.parse_args()
+
+
+def main():
+    args = argument_parser()
+
+    raise_file_limit(args.servers + args.list_sockets + 64)
+
+    jc = jamulus.JamulusConnector(port=None)
+    stress = DirectoryStress(jc, args.directory, args.servers, args.list_sockets, args.timeout)
+
+    print(
+        "simulating {} servers and {} server list requests/s for {}s".format(
+            args.servers,
+            args.list_rate,
+            args.duration,
+        )
+    )
+
+    try:
+        stress.run(args.duration, args.refresh, args.ramp, args.list_rate)
+    finally:
+        print("{}\n{}\n{}".format(stress.registrations, stress.reduced_lists, stress.lists))
+        if stress.decode_errors > 0:
+            print("{} messages could not be decoded".format(stress.decode_errors))
+        stress.close()
+
+
+def signal_handler(sig, frame):
+    print()
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    signal.signal(signal.SIGINT, signal_handler)
+    main()
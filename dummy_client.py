@@ -44,50 +44,53 @@ def main():
     audio_values = jamulus.silent_audio(BASE_NETW_SIZE)
     jc.sendto(args.server, "AUDIO", audio_values)
 
+    def audio(addr, key, count, values):
+        jc.sendto(addr, "AUDIO", audio_values)
+
+    def split_mess_support(addr, key, count, values):
+        jc.sendto(addr, "SPLIT_MESS_SUPPORTED")
+
+    def netw_transport_props(addr, key, count, values):
+        jc.sendto(
+            addr,
+            "NETW_TRANSPORT_PROPS",
+            {
+                "base_netw_size": BASE_NETW_SIZE,
+                "block_size_fact": 1,
+                "num_chan": 1,
+                "sam_rate": 48000,
+                "audiocod_type": 3,
+                "flags": 0,
+                "audiocod_arg": 0,
+            },
+        )
+
+    def jitt_buf_size(addr, key, count, values):
+        jc.sendto(addr, "JITT_BUF_SIZE", {"blocks": JITT_BUF_SIZE})
+
+    def channel_infos(addr, key, count, values):
+        jc.sendto(
+            addr,
+            "CHANNEL_INFOS",
+            {
+                "country": 0,
+                "instrument": 0,
+                "skill": 0,
+                "name": "Test Client",
+                "city": "",
+            },
+        )
+
+    # only handle messages coming from the server, other messages are not decoded
+    dispatcher = jamulus.Dispatcher(jc)
+    dispatcher.add_handler("AUDIO", audio, addr=args.server)
+    dispatcher.add_handler("REQ_SPLIT_MESS_SUPPORT", split_mess_support, addr=args.server)
+    dispatcher.add_handler("REQ_NETW_TRANSPORT_PROPS", netw_transport_props, addr=args.server)
+    dispatcher.add_handler("REQ_JITT_BUF_SIZE", jitt_buf_size, addr=args.server)
+    dispatcher.add_handler("REQ_CHANNEL_INFOS", channel_infos, addr=args.server)
+
     while True:
-        addr, key, count, values = jc.recvfrom()
-
-        if addr != args.server:
-            # drop messages not coming from the server
-            continue
-
-        if key == "AUDIO":
-            jc.sendto(addr, "AUDIO", audio_values)
-
-        elif key == "REQ_SPLIT_MESS_SUPPORT":
-            jc.sendto(addr, "SPLIT_MESS_SUPPORTED")
-            pass
-
-        elif key == "REQ_NETW_TRANSPORT_PROPS":
-            jc.sendto(
-                addr,
-                "NETW_TRANSPORT_PROPS",
-                {
-                    "base_netw_size": BASE_NETW_SIZE,
-                    "block_size_fact": 1,
-                    "num_chan": 1,
-                    "sam_rate": 48000,
-                    "audiocod_type": 3,
-                    "flags": 0,
-                    "audiocod_arg": 0,
-                },
-            )
-
-        elif key == "REQ_JITT_BUF_SIZE":
-            jc.sendto(addr, "JITT_BUF_SIZE", {"blocks": JITT_BUF_SIZE})
-
-        elif key == "REQ_CHANNEL_INFOS":
-            jc.sendto(
-                addr,
-                "CHANNEL_INFOS",
-                {
-                    "country": 0,
-                    "instrument": 0,
-                    "skill": 0,
-                    "name": "Test Client",
-                    "city": "",
-                },
-            )
+        dispatcher.recv()
 
 
 def signal_handler(sig, frame):
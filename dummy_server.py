@@ -5,9 +5,13 @@ import jamulus
 import argparse
 import signal
 import sys
+import time
 
 
 BASE_NETW_SIZE = 22
+JITT_BUF_SIZE = 5
+MIX_REPORT_INTERVAL = 10
+PING_REPORT_INTERVAL = 10
 
 
 def argument_parser():
@@ -30,16 +34,44 @@ def argument_parser():
         action="store_true",
         help="log audio messages",
     )
-
+    jamulus.add_server_arguments(parser, overload=False)
+    parser.add_argument(
+        "--mix",
+        action="store_true",
+        help="decode and mix the audio of the clients (requires NumPy, libopus for Opus audio)",
+    )
+    parser.add_argument(
+        "--ping-timestamps",
+        action="store_true",
+        help="report the time from receiving pings (kernel timestamps, Linux only) to replying",
+    )
     return parser.parse_args()
 
 
 def main():
-    global args, clients, jc
+    global args, sessions, jc
 
     args = argument_parser()
 
-    jc = jamulus.JamulusConnector(port=args.port, log_data=args.log_data, log_audio=args.log_audio)
+    # profile message handling if requested
+    profiler = jamulus.Profiler(report_interval=args.profile) if args.profile is not None else None
+    if profiler is not None:
+        profiler.install_signal(signal.SIGUSR1)
+
+    # collect metrics if requested
+    metrics = jamulus.Metrics() if args.metrics_port is not None else None
+    if metrics is not None:
+        metrics.serve(args.metrics_port)
+
+    jc = jamulus.JamulusConnector(
+        port=args.port,
+        log_data=args.log_data,
+        log_audio=args.log_audio,
+        metrics=metrics,
+        profiler=profiler,
+        rcvbuf=args.rcvbuf,
+        sndbuf=args.sndbuf,
+    )
 
     if args.centralserver:
         jc.sendto(
@@ -57,10 +89,9 @@ def main():
             },
         )
 
-    clients = {}
-    for id in range(args.clients):
-        addr = ("0.0.0.0", id)
-        clients[addr] = {
+    # fake clients use the lowest channel IDs
+    clients = [
+        {
             "id": id,
             "country": 0,
             "instrument": 0,
@@ -69,70 +100,249 @@ def main():
             "name": f"Test {id}",
             "city": "",
         }
-    clients_pending = []
+        for id in range(args.clients)
+    ]
+    sessions = jamulus.SessionTable(max_sessions=jamulus.MAX_NUM_CHANNELS - args.clients, first_id=args.clients)
 
-    while True:
-        addr, key, count, values = jc.recvfrom()
-
-        if key == "AUDIO":
-            if addr not in clients_pending + list(clients.keys()):
-                clients_pending.append(addr)
-                jc.sendto(addr, "CLIENT_ID", {"id": len(clients)})
-                jc.sendto(addr, "CONN_CLIENTS_LIST", clients.values())
-                jc.sendto(addr, "REQ_SPLIT_MESS_SUPPORT")
-                jc.sendto(addr, "REQ_NETW_TRANSPORT_PROPS")
-                jc.sendto(addr, "REQ_JITT_BUF_SIZE")
-                jc.sendto(addr, "REQ_CHANNEL_INFOS")
-                jc.sendto(
-                    addr,
-                    "CHAT_TEXT",
-                    {"string": "<b>Server Welcome Message:</b> This is a Test Server"},
-                )
+    # mix raw PCM audio if requested, every client gets its own mix on each tick
+    mixer = jamulus.Mixer() if args.mix else None
+    level_meter = jamulus.LevelMeter() if args.mix else None
+
+    def clients_list():
+        # fake clients and connected clients that sent their channel infos (ordered by ID)
+        listed = sorted((s for s in sessions if s.channel_info is not None), key=lambda s: s.id)
+        return clients + [dict(s.channel_info, id=s.id, zero=0) for s in listed]
+
+    def channel_ids():
+        # channel IDs in the order of the clients list
+        return [client["id"] for client in clients] + sorted(s.id for s in sessions if s.channel_info is not None)
+
+    def audio(addr, key, count, values):
+        session = sessions.get(addr)
+        if session is None:
+            session = sessions.create(addr)
+            if session is None:
+                jc.sendto(addr, "CLM_SERVER_FULL")
+                return
+            if mixer is not None:
+                mixer.reset(session.id)
+            jc.sendto(addr, "CLIENT_ID", {"id": session.id})
+            jc.sendto(addr, "CONN_CLIENTS_LIST", clients_list())
+            jc.sendto(addr, "REQ_SPLIT_MESS_SUPPORT")
+            jc.sendto(addr, "REQ_NETW_TRANSPORT_PROPS")
+            jc.sendto(addr, "REQ_JITT_BUF_SIZE")
+            jc.sendto(addr, "REQ_CHANNEL_INFOS")
+            jc.sendto(
+                addr,
+                "CHAT_TEXT",
+                {"string": "<b>Server Welcome Message:</b> This is a Test Server"},
+            )
+        else:
+            sessions.touch(session)
+
+        data = values["data"]
+        sequence = None
+        if uses_sequence_numbers(session):
+            data, sequence = data[:-1], data[-1]
+
+        if session.jitter_buffer is not None:
+            # mixed on the next ticks
+            session.jitter_buffer.put(data, sequence)
+        elif mixer is None or session.transport_props is not None:
+            send_audio(session, jamulus.silent_audio(len(data))["data"])
+
+    def uses_sequence_numbers(session):
+        return session.transport_props is not None and session.transport_props["flags"] & jamulus.SEQUENCE_NUMBER_FLAG
+
+    def send_audio(session, data):
+        # append sequence number if the client uses them
+        if uses_sequence_numbers(session):
+            data += bytes((session.sequence,))
+            session.sequence = (session.sequence + 1) & 0xFF
+        jc.sendto(session.addr, "AUDIO", {"data": data})
+
+    def channel_infos(addr, key, count, values):
+        session = sessions.get(addr)
+        if session is not None:
+            session.channel_info = values
+            jc.sendto(addr, "CONN_CLIENTS_LIST", clients_list())
 
-            audio_values = jamulus.silent_audio(len(values["data"]))
-            jc.sendto(addr, "AUDIO", audio_values)
+    def netw_transport_props(addr, key, count, values):
+        session = sessions.get(addr)
+        if session is not None:
+            session.transport_props = values
+            update_codec(session)
+            update_jitter_buffer(session)
 
-        elif key == "CHANNEL_INFOS":
-            id = len(clients)
-            clients[addr] = values
-            clients[addr]["id"] = id
-            clients[addr]["zero"] = 0
-            jc.sendto(addr, "CONN_CLIENTS_LIST", clients.values())
-            if addr in clients_pending:
-                clients_pending.remove(addr)
+    def jitt_buf_size(addr, key, count, values):
+        session = sessions.get(addr)
+        if session is not None:
+            session.jitter_buffer_size = values["blocks"]
+            update_jitter_buffer(session)
 
-        elif key == "CLM_DISCONNECTION":
-            # remove client from list
-            if addr in clients.keys():
-                del clients[addr]
+    def update_codec(session):
+        # only audio packets of the mixer frame size can be mixed
+        session.codec = None
+        if mixer is not None:
+            try:
+                codec = jamulus.AudioCodec(session.transport_props)
+            except ValueError as error:
+                print("can't mix audio of {}: {}".format(session.addr, error))
+                return
+            if codec.samples == mixer.frame_samples:
+                session.codec = codec
 
-        elif key == "CLM_PING_MS":
-            # respond to ping request
-            jc.sendto(addr, "CLM_PING_MS", values)
+    def update_jitter_buffer(session):
+        if session.codec is None:
+            session.jitter_buffer = None
+            return
+        size = session.jitter_buffer_size or JITT_BUF_SIZE
+        if session.jitter_buffer is None:
+            session.jitter_buffer = jamulus.JitterBuffer(size, mixer.frame_samples / jamulus.SYSTEM_SAMPLE_RATE)
+        else:
+            session.jitter_buffer.set_size(size)
 
-        elif key == "CLM_PING_MS_WITHNUMCLIENTS":
-            # respond to ping request with client number
-            jc.sendto(addr, "CLM_PING_MS_WITHNUMCLIENTS", values)
+    def channel_gain(addr, key, count, values):
+        session = sessions.get(addr)
+        if session is not None and values["id"] < jamulus.MAX_NUM_CHANNELS:
+            mixer.set_gain(session.id, values["id"], values["gain"])
 
-        elif key == "CLM_SEND_EMPTY_MESSAGE":
-            # send empty messages when requested
-            jc.sendto((values["ip"], values["port"]), "CLM_EMPTY_MESSAGE")
+    def channel_pan(addr, key, count, values):
+        session = sessions.get(addr)
+        if session is not None and values["id"] < jamulus.MAX_NUM_CHANNELS:
+            mixer.set_pan(session.id, values["id"], values["panning"])
+
+    def mix_tick():
+        mixed = [session for session in sessions if session.jitter_buffer is not None]
+        if len(mixed) == 0:
+            return 0
+
+        # next frame of each client, silence (or concealment) on buffer underruns
+        for session in mixed:
+            pcm = session.codec.decode(session.jitter_buffer.get())
+            mixer.set_input(session.id, pcm, session.codec.num_chan)
+
+        ids = [session.id for session in mixed]
+        output = mixer.mix(ids)
+        frames = mixer.encode(output, [session.codec.num_chan for session in mixed])
+        for session, pcm in zip(mixed, frames):
+            send_audio(session, session.codec.encode(pcm))
+
+        # channel levels, sent to subscribed clients at a limited rate
+        level_meter.add(ids, mixer.inputs[ids])
+        if len(level_meter.subscribers) > 0 and time.monotonic() >= level_meter.next_update:
+            level_meter.update(jc, channel_ids())
+        return len(mixed)
+
+    def channel_level_list(addr, key, count, values):
+        if addr in sessions:
+            level_meter.subscribe(addr, values["data"] != 0)
+
+    def end_session(addr):
+        sessions.remove(addr)
+        if level_meter is not None:
+            level_meter.subscribe(addr, False)
+
+    def disconnection(addr, key, count, values):
+        # remove client from list
+        end_session(addr)
+
+    def send_empty_message(addr, key, count, values):
+        # send empty messages when requested
+        jc.sendto((values["ip"], values["port"]), "CLM_EMPTY_MESSAGE")
+
+    def version_and_os(addr, key, count, values):
+        # respond to request to send version and os
+        values_send = {"os": 2, "version": "python-test"}
+        jc.sendto(addr, "CLM_VERSION_AND_OS", values_send)
+
+    def conn_clients_list(addr, key, count, values):
+        # respond to request to send connected clients list
+        jc.sendto(addr, "CONN_CLIENTS_LIST", clients_list())
+
+    # dispatch messages to handlers, other messages are not decoded
+    dispatcher = jamulus.Dispatcher(jc)
+    dispatcher.add_handler("AUDIO", audio)
+    dispatcher.add_handler("CHANNEL_INFOS", channel_infos)
+    dispatcher.add_handler("NETW_TRANSPORT_PROPS", netw_transport_props)
+    dispatcher.add_handler("JITT_BUF_SIZE", jitt_buf_size)
+    if mixer is not None:
+        dispatcher.add_handler("CHANNEL_GAIN", channel_gain)
+        dispatcher.add_handler("CHANNEL_PAN", channel_pan)
+        dispatcher.add_handler("REQ_CHANNEL_LEVEL_LIST", channel_level_list)
+    dispatcher.add_handler("CLM_DISCONNECTION", disconnection)
+    dispatcher.add_handler("CLM_SEND_EMPTY_MESSAGE", send_empty_message)
+    dispatcher.add_handler("CLM_REQ_VERSION_AND_OS", version_and_os)
+    dispatcher.add_handler("CLM_REQ_CONN_CLIENTS_LIST", conn_clients_list)
+
+    # respond to pings (with client number) without decoding them
+    ping_responder = jamulus.PingResponder(jc, clients=lambda: len(clients) + len(sessions))
+    dispatcher.add_fast_path(ping_responder)
+    if args.ping_timestamps and not jc.enable_timestamps():
+        print("kernel timestamps are not supported")
+    next_ping_report = time.monotonic() + PING_REPORT_INTERVAL
+
+    # limit requests per source IP if requested
+    if args.rate_limit is not None:
+        budgets = dict.fromkeys(jamulus.RATE_LIMITED_KEYS, tuple(args.rate_limit))
+        dispatcher.add_middleware(jamulus.RateLimiter(budgets, metrics=metrics))
+
+    # mix on a fixed period tick
+    if mixer is not None:
+        tick_period = mixer.frame_samples / jamulus.SYSTEM_SAMPLE_RATE
+        next_tick = time.monotonic()
+        next_report = next_tick + MIX_REPORT_INTERVAL
+        ticks = ticks_late = 0
+        time_mixing = 0.0
+
+    while True:
+        try:
+            dispatcher.recv(timeout=1 if mixer is None else max(0, next_tick - time.monotonic()))
+        except TimeoutError:
+            pass
+        now = time.monotonic()
+
+        if mixer is not None and now >= next_tick:
+            clients_mixed = mix_tick()
+            time_mixing += time.monotonic() - now
+            ticks += 1
+            next_tick += tick_period
+            # skip ticks that can't be made up for
+            if next_tick < now:
+                ticks_late += 1
+                next_tick = now + tick_period
+
+            if now >= next_report:
+                buffers = [session.jitter_buffer for session in sessions if session.jitter_buffer is not None]
+                print(
+                    "mixed {} clients, {:.1f}% of the tick period used, {} of {} ticks late, "
+                    "jitter buffer underruns {} overruns {}".format(
+                        clients_mixed,
+                        time_mixing / ticks / tick_period * 100,
+                        ticks_late,
+                        ticks,
+                        sum(buffer.underruns for buffer in buffers),
+                        sum(buffer.overruns for buffer in buffers),
+                    )
+                )
+                next_report += MIX_REPORT_INTERVAL
+                ticks = ticks_late = 0
+                time_mixing = 0.0
 
-        elif key == "CLM_REQ_VERSION_AND_OS":
-            # respond to request to send version and os
-            values_send = {"os": 2, "version": "python-test"}
-            jc.sendto(addr, "CLM_VERSION_AND_OS", values_send)
+        if jc.timestamps and now >= next_ping_report:
+            print(ping_responder.report())
+            next_ping_report += PING_REPORT_INTERVAL
 
-        elif key == "CLM_REQ_CONN_CLIENTS_LIST":
-            # respond to request to send connected clients list
-            jc.sendto(addr, "CONN_CLIENTS_LIST", clients.values())
+        # disconnect clients that stopped sending audio
+        for session in sessions.expire(now):
+            print("client {} timed out".format(session.addr))
+            end_session(session.addr)
 
 
 def signal_handler(sig, frame):
     print()
-    for addr in clients.keys():
-        if addr[0] != "0.0.0.0":
-            jc.sendto(addr, "CLM_DISCONNECTION")
+    for session in sessions:
+        jc.sendto(session.addr, "CLM_DISCONNECTION")
     if args.centralserver:
         jc.sendto(args.centralserver, "CLM_UNREGISTER_SERVER")
     sys.exit(0)
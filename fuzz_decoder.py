@@ -0,0 +1,414 @@
+#!/usr/bin/python3
+
+import jamulus
+
+import argparse
+import random
+import signal
+import sys
+import traceback
+
+from time import perf_counter
+
+
+DEFAULT_ITERATIONS = 100000
+DEFAULT_SEED = 0
+DEFAULT_THROUGHPUT_SIZE = 2000
+MAX_MUTATIONS = 4  # mutations applied to a corpus entry per input
+FIX_FRAME_PROBABILITY = 0.8  # share of inputs with a consistent frame length and CRC (to reach the payload decoding)
+SLOW_DECODE = 0.005  # seconds after which decoding a single datagram counts as pathological
+MAX_RECORDS = 10  # records of random repeated messages
+MAX_TEXT = 100  # characters of random strings (V)
+MAX_DATA = 200  # bytes of random data (v, z)
+TEXT_ALPHABET = "abcXYZ 019-_äöüß€♫\U0001f3b8"  # 1 to 4 byte UTF-8 characters
+INTERESTING_VALUES = (0, 1, 0x7F, 0x80, 0xFF, 0x100, 0x7FFF, 0x8000, 0xFFFF)
+
+
+def random_value(rng, format_char):
+    # random valid value of a format character
+    if format_char == "B":
+        return rng.randrange(0x100)
+    if format_char == "H":
+        return rng.randrange(0x10000)
+    if format_char == "L":
+        return rng.randrange(0x100000000)
+    if format_char == "A":
+        return ".".join(str(rng.randrange(256)) for _ in range(4))
+    if format_char == "U":
+        # at most 4 bytes per character, fits into the 1 byte length
+        return "".join(rng.choice(TEXT_ALPHABET) for _ in range(rng.randrange(64)))
+    if format_char == "V":
+        return "".join(rng.choice(TEXT_ALPHABET) for _ in range(rng.randrange(MAX_TEXT)))
+    # v / z = data
+    return rng.randbytes(rng.randrange(MAX_DATA))
+
+
+def random_values(rng, prot):
+    # random valid values of a protocol message (a list of records for repeated messages)
+    format = prot.get("format")
+    if format is None:
+        return None
+    if prot.get("repeat", False):
+        records = rng.randrange(MAX_RECORDS)
+        return [{key: random_value(rng, format_char) for key, format_char in format} for _ in range(records)]
+    return {key: random_value(rng, format_char) for key, format_char in format}
+
+
+class Fuzzer:
+    # mutation based fuzzing of the decoder, optionally guided by the line coverage of the library
+    def __init__(self, seed=DEFAULT_SEED, coverage=False):
+        self.rng = random.Random(seed)
+        self.jc = jamulus.JamulusConnector(port=None, log=False, frame_cache_size=0)
+        self.formats = [(prot.get("format", ()), prot.get("repeat", False)) for prot in jamulus.PROT.values()]
+
+        # valid frames of every message and audio frames as the initial corpus
+        self.corpus = [self.jc.main_pack(key, random_values(self.rng, prot), 0) for key, prot in jamulus.PROT.items()]
+        self.corpus += [self.rng.randbytes(size) for size in [1, 9, 100, 1000]]
+
+        # (target, exception, data, traceback) of inputs that raised anything but DecodeError
+        self.failures = []
+        # (target, seconds, data) of inputs that took longer than SLOW_DECODE
+        self.slow = []
+        self.executions = 0
+        # (code, previous line, line) transitions executed in the library, None = no coverage guidance
+        self.arcs = set() if coverage else None
+
+    def fix_frame(self, data):
+        # consistent frame length and CRC, to get past the frame checks
+        data[5:7] = (len(data) - jamulus.MAIN_FRAME_SIZE).to_bytes(2, "little")
+        data[-2:] = self.jc.calc_crc(data[:-2]).to_bytes(2, "little")
+
+    def mutate(self, data):
+        rng = self.rng
+        data = bytearray(data)
+        for _ in range(rng.randint(1, MAX_MUTATIONS)):
+            mutation = rng.randrange(7)
+            position = rng.randrange(len(data) + 1)
+            if mutation == 0 and position < len(data):
+                # random byte
+                data[position] = rng.randrange(256)
+            elif mutation == 1 and position < len(data):
+                # bit flip
+                data[position] ^= 1 << rng.randrange(8)
+            elif mutation == 2:
+                # delete bytes
+                del data[position : position + rng.randint(1, 16)]
+            elif mutation == 3:
+                # insert random bytes
+                data[position:position] = rng.randbytes(rng.randint(1, 16))
+            elif mutation == 4:
+                # interesting 16 bit value (lengths, counts)
+                data[position : position + 2] = rng.choice(INTERESTING_VALUES).to_bytes(2, "little")
+            elif mutation == 5 and len(data) >= 4:
+                # other (also obsolete or unknown) message ID
+                id = rng.choice(list(jamulus.MSG_IDS.values())) if rng.random() < 0.9 else rng.randrange(0x10000)
+                data[2:4] = id.to_bytes(2, "little")
+            elif mutation == 6:
+                # splice with another corpus entry
+                other = rng.choice(self.corpus)
+                data[position:] = other[rng.randrange(len(other) + 1) :]
+
+        del data[jamulus.MAX_SIZE_BYTES_NETW_BUF :]
+        if len(data) >= jamulus.MAIN_FRAME_SIZE and rng.random() < FIX_FRAME_PROBABILITY:
+            self.fix_frame(data)
+        return bytes(data)
+
+    def decode_message(self, data):
+        # decode lazily, field by field and record by record
+        message = jamulus.Message(self.jc, data)
+        if message.repeat:
+            len(message)
+            list(message.records())
+        else:
+            for key, format_char in message.format:
+                message[key]
+        message.values
+
+    def check(self, data):
+        # decode a datagram with every decoder entry point, only DecodeError may be raised
+        format, repeat = self.rng.choice(self.formats)
+        targets = [
+            ("main_unpack", lambda: self.jc.main_unpack(data, False, None)),
+            ("Message", lambda: self.decode_message(data)),
+            # payload decoded with the format of another message
+            ("prot_unpack", lambda: self.jc.prot_unpack(format, data[7:-2], repeat)),
+        ]
+        for target, decode in targets:
+            time_start = perf_counter()
+            try:
+                decode()
+            except jamulus.DecodeError:
+                pass
+            except Exception as error:
+                self.failures.append((target, type(error).__name__, data, traceback.format_exc()))
+            duration = perf_counter() - time_start
+            if duration > SLOW_DECODE and self.arcs is None:
+                # measure again, single slow runs are mostly garbage collection / scheduling
+                duration = min(duration, self.measure(decode), self.measure(decode))
+                if duration > SLOW_DECODE:
+                    self.slow.append((target, duration, data))
+        self.executions += 1
+
+    def measure(self, decode):
+        time_start = perf_counter()
+        try:
+            decode()
+        except Exception:
+            pass
+        return perf_counter() - time_start
+
+    def check_coverage(self, data):
+        # check a datagram, return True if it executed code of the library not executed before
+        arcs = set()
+        library = jamulus.__dict__
+
+        def trace(frame, event, arg):
+            if frame.f_globals is not library and not frame.f_code.co_filename.startswith("<codec"):
+                return None
+            previous = None
+
+            def trace_lines(frame, event, arg):
+                nonlocal previous
+                if event == "line":
+                    arcs.add((frame.f_code, previous, frame.f_lineno))
+                    previous = frame.f_lineno
+                return trace_lines
+
+            return trace_lines
+
+        sys.settrace(trace)
+        try:
+            self.check(data)
+        finally:
+            sys.settrace(None)
+        arcs -= self.arcs
+        self.arcs |= arcs
+        return len(arcs) > 0
+
+    def run(self, iterations):
+        for _ in range(iterations):
+            data = self.mutate(self.rng.choice(self.corpus))
+            if self.arcs is None:
+                self.check(data)
+            elif self.check_coverage(data):
+                self.corpus.append(data)
+
+    def round_trip(self, rounds=1):
+        # encode random values of every message, decoding must return the same values
+        for key, prot in jamulus.PROT.items():
+            for _ in range(rounds):
+                values = random_values(self.rng, prot)
+                count = self.rng.randrange(256)
+                data = b""
+                try:
+                    data = self.jc.main_pack(key, values, count)
+                    result = self.jc.main_unpack(data, False, None)
+                    # messages without data are decoded as empty dict
+                    if result != (key, count, {} if values is None else values):
+                        raise AssertionError("{} decoded as {}".format((key, count, values), result))
+                except Exception as error:
+                    self.failures.append(("round trip", type(error).__name__, data, traceback.format_exc()))
+
+    def report(self):
+        print("{} inputs, {} corpus entries".format(self.executions, len(self.corpus)))
+        if self.arcs is not None:
+            print("{} line transitions covered".format(len(self.arcs)))
+
+        # one example per target and exception
+        examples = {}
+        for target, error, data, trace in self.failures:
+            examples.setdefault((target, error), (data, trace))
+        for (target, error), (data, trace) in examples.items():
+            print("\n{} raised {}: {}\n{}".format(target, error, data, trace))
+        print("{} failures".format(len(self.failures)))
+
+        for target, duration, data in sorted(self.slow, reverse=True, key=lambda slow: slow[1])[:10]:
+            print("slow {} ({:.1f}ms): {}".format(target, duration * 1000, data[:100]))
+        print("{} slow inputs (> {}ms)".format(len(self.slow), SLOW_DECODE * 1000))
+
+
+def adversarial_inputs(fuzzer, size):
+    # categories of datagrams an attacker can send
+    rng = fuzzer.rng
+    jc = fuzzer.jc
+
+    def random_frame():
+        # valid frame of a random ID with random payload
+        id = rng.choice(list(jamulus.MSG_IDS.values()))
+        data = bytearray(b"\x00\x00" + id.to_bytes(2, "little") + b"\x00\x00\x00")
+        data += rng.randbytes(rng.randrange(1500)) + b"\x00\x00"
+        fuzzer.fix_frame(data)
+        return bytes(data)
+
+    def large_list():
+        # largest server list with the last record broken, decoded up to the end
+        servers = [{"ip": "0.0.0.0", "port": 0, "name": ""}] * 3000
+        data = bytearray(next(jc.main_pack_pages("CLM_RED_SERVER_LIST", servers))[0])
+        data[-3] = 0xFF
+        fuzzer.fix_frame(data)
+        return bytes(data)
+
+    def long_string():
+        # string lengths beyond the data
+        values = random_values(rng, jamulus.PROT["CLM_REGISTER_SERVER"])
+        data = bytearray(jc.main_pack("CLM_REGISTER_SERVER", values, 0))
+        data[13:15] = b"\xff\xff"
+        fuzzer.fix_frame(data)
+        return bytes(data)
+
+    return {
+        "random bytes": [rng.randbytes(rng.randrange(1500)) for _ in range(size)],
+        "random frames": [random_frame() for _ in range(size)],
+        "mutated frames": [fuzzer.mutate(rng.choice(fuzzer.corpus)) for _ in range(size)],
+        "large lists": [large_list()] * size,
+        "long strings": [long_string() for _ in range(size)],
+    }
+
+
+def throughput(fuzzer, size):
+    # decode rate of adversarial datagrams
+    for name, inputs in adversarial_inputs(fuzzer, size).items():
+        durations = []
+        time_start = perf_counter()
+        for data in inputs:
+            time_decode = perf_counter()
+            try:
+                fuzzer.jc.main_unpack(data, False, None)
+            except jamulus.DecodeError:
+                pass
+            durations.append(perf_counter() - time_decode)
+        duration = perf_counter() - time_start
+        print(
+            "{:<16} {:>9.0f} datagrams/s {:>9.1f} MB/s, max {:.3f}ms".format(
+                name,
+                len(inputs) / duration,
+                sum(map(len, inputs)) / duration / 1e6,
+                max(durations) * 1000,
+            )
+        )
+
+
+def run_hypothesis(iterations):
+    # property based tests with hypothesis (optional dependency)
+    from hypothesis import given, settings, strategies
+
+    jc = jamulus.JamulusConnector(port=None, log=False, frame_cache_size=0)
+    texts = strategies.text(max_size=MAX_TEXT)
+    value_strategies = {
+        "B": strategies.integers(0, 0xFF),
+        "H": strategies.integers(0, 0xFFFF),
+        "L": strategies.integers(0, 0xFFFFFFFF),
+        "A": strategies.ip_addresses(v=4).map(str),
+        "U": texts.filter(lambda text: len(text.encode()) <= 0xFF),
+        "V": texts,
+        "v": strategies.binary(max_size=MAX_DATA),
+        "z": strategies.binary(max_size=MAX_DATA),
+    }
+
+    def message_strategy(key):
+        prot = jamulus.PROT[key]
+        format = prot.get("format")
+        if format is None:
+            values = strategies.none()
+        else:
+            values = strategies.fixed_dictionaries(
+                {name: value_strategies[format_char] for name, format_char in format}
+            )
+            if prot.get("repeat", False):
+                values = strategies.lists(values, max_size=MAX_RECORDS)
+        return strategies.tuples(strategies.just(key), strategies.integers(0, 0xFF), values)
+
+    messages = strategies.one_of([message_strategy(key) for key in jamulus.PROT])
+
+    @settings(max_examples=iterations, deadline=None)
+    @given(messages)
+    def round_trip(message):
+        key, count, values = message
+        decoded = jc.main_unpack(jc.main_pack(key, values, count), False, None)
+        assert decoded == (key, count, {} if values is None else values)
+
+    @settings(max_examples=iterations, deadline=None)
+    @given(messages, strategies.data())
+    def corrupted(message, data):
+        # corrupted payload with a valid frame length and CRC
+        key, count, values = message
+        frame = bytearray(jc.main_pack(key, values, count))
+        position = data.draw(strategies.integers(7, len(frame) - 1))
+        frame[position:position] = data.draw(strategies.binary(min_size=1, max_size=8))
+        frame[5:7] = (len(frame) - jamulus.MAIN_FRAME_SIZE).to_bytes(2, "little")
+        frame[-2:] = jc.calc_crc(frame[:-2]).to_bytes(2, "little")
+        try:
+            jc.main_unpack(bytes(frame), False, None)
+        except jamulus.DecodeError:
+            pass
+
+    @settings(max_examples=iterations, deadline=None)
+    @given(strategies.binary(max_size=2000))
+    def random_data(data):
+        try:
+            jc.main_unpack(data, False, None)
+        except jamulus.DecodeError:
+            pass
+
+    for test in [round_trip, corrupted, random_data]:
+        print("hypothesis: {}".format(test.__name__))
+        test()
+
+
+def argument_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS, help="number of fuzzed inputs")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="seed of the random generator")
+    parser.add_argument(
+        "--coverage",
+        action="store_true",
+        help="keep inputs that execute new code of the library in the corpus (slower per input)",
+    )
+    parser.add_argument(
+        "--hypothesis",
+        action="store_true",
+        help="run property based tests with hypothesis instead",
+    )
+    parser.add_argument(
+        "--throughput",
+        type=int,
+        nargs="?",
+        const=DEFAULT_THROUGHPUT_SIZE,
+        metavar="SIZE",
+        help="measure the decode rate of SIZE adversarial datagrams per category instead",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = argument_parser()
+
+    if args.hypothesis:
+        try:
+            run_hypothesis(args.iterations)
+        except ImportError:
+            print("hypothesis is not installed")
+            sys.exit(1)
+        return
+
+    fuzzer = Fuzzer(seed=args.seed, coverage=args.coverage)
+    if args.throughput is not None:
+        throughput(fuzzer, args.throughput)
+        return
+
+    time_start = perf_counter()
+    fuzzer.round_trip(rounds=max(1, args.iterations // 1000))
+    fuzzer.run(args.iterations)
+    print("{:.1f}s".format(perf_counter() - time_start))
+    fuzzer.report()
+    sys.exit(1 if len(fuzzer.failures) > 0 else 0)
+
+
+def signal_handler(sig, frame):
+    print()
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    signal.signal(signal.SIGINT, signal_handler)
+    main()
@@ -1,11 +1,49 @@
 #!/usr/bin/python3
 
+import binascii
+import bisect
+import collections
+import heapq
+import itertools
+import os
+import selectors
 import socket
 import struct
+import sys
+import threading
+import time
 
 
 DEFAULT_PORT = 22124
 MAX_SIZE_BYTES_NETW_BUF = 20000
+MAIN_FRAME_SIZE = 9  # size of main frame header and crc
+MAX_NUM_CHANNELS = 150  # maximum number of clients of a Jamulus server
+CHANNEL_TIMEOUT = 30  # seconds without audio after which a client is disconnected
+SYSTEM_SAMPLE_RATE = 48000
+SYSTEM_FRAME_SIZE_SAMPLES = 64  # samples per audio channel and frame with block_size_fact 1
+AUDIO_CODEC_NONE = 0  # audiocod_type of raw 16 bit PCM audio frames
+AUDIO_CODEC_OPUS = 2  # audiocod_type of Opus frames of 128 samples
+AUDIO_CODEC_OPUS64 = 3  # audiocod_type of Opus frames of 64 samples
+MAX_GAIN = 32768  # CHANNEL_GAIN value of factor 1
+MAX_PAN = 32768  # CHANNEL_PAN value of right panning (center = MAX_PAN / 2)
+MIN_JITT_BUF_SIZE = 1  # jitter buffer size limits in frames
+MAX_JITT_BUF_SIZE = 20
+AUTO_JITT_BUF_SIZE = 9999  # JITT_BUF_SIZE value of automatic jitter buffer sizing
+LOW_BOUND_SIG_METER = -50.0  # dB of the lowest channel level step
+NUM_STEPS_LED_BAR = 8  # channel level steps (4 bit values in CLM_CHANNEL_LEVEL_LIST)
+CHANNEL_LEVEL_INTERVAL = 0.2  # seconds between channel level list updates
+SEQUENCE_NUMBER_FLAG = 0x0001  # NETW_TRANSPORT_PROPS flag of audio frames with a trailing sequence number byte
+# Linux socket option (and control message type) of receive times
+SO_TIMESTAMPNS = getattr(socket, "SO_TIMESTAMPNS", 35)
+TIMESPEC = struct.Struct("@ll")  # struct timespec of SO_TIMESTAMPNS control messages
+SO_RXQ_OVFL = getattr(socket, "SO_RXQ_OVFL", 40)  # Linux socket option (and control message type) of the drop counter
+DROP_COUNTER = struct.Struct("@I")  # number of datagrams dropped by the kernel in SO_RXQ_OVFL control messages
+ANCBUFSIZE = (
+    socket.CMSG_SPACE(TIMESPEC.size) + socket.CMSG_SPACE(DROP_COUNTER.size) if hasattr(socket, "CMSG_SPACE") else 0
+)
+FRAME_CACHE_SIZE = 256  # maximum number of cached encoded frames per connector
+DNS_TTL = 300  # seconds after which resolved host names are resolved again
+DNS_RETRY = 30  # seconds after which failed host name resolutions are retried
 
 FORMAT = {
     # format characters
@@ -177,342 +215,1153 @@ MSG_IDS = {
 }
 MSG_KEYS = dict(zip(MSG_IDS.values(), MSG_IDS.keys()))
 
-COUNTRY_KEYS = {
-    0: "-",
-    1: "Afghanistan",
-    2: "Albania",
-    3: "Algeria",
-    4: "American Samoa",
-    5: "Andorra",
-    6: "Angola",
-    7: "Anguilla",
-    8: "Antarctica",
-    9: "Antigua And Barbuda",
-    10: "Argentina",
-    11: "Armenia",
-    12: "Aruba",
-    13: "Australia",
-    14: "Austria",
-    15: "Azerbaijan",
-    16: "Bahamas",
-    17: "Bahrain",
-    18: "Bangladesh",
-    19: "Barbados",
-    20: "Belarus",
-    21: "Belgium",
-    22: "Belize",
-    23: "Benin",
-    24: "Bermuda",
-    25: "Bhutan",
-    26: "Bolivia",
-    27: "Bosnia And Herzegowina",
-    28: "Botswana",
-    29: "Bouvet Island",
-    30: "Brazil",
-    31: "British Indian Ocean Territory",
-    32: "Brunei",
-    33: "Bulgaria",
-    34: "Burkina Faso",
-    35: "Burundi",
-    36: "Cambodia",
-    37: "Cameroon",
-    38: "Canada",
-    39: "Cape Verde",
-    40: "Cayman Islands",
-    41: "Central African Republic",
-    42: "Chad",
-    43: "Chile",
-    44: "China",
-    45: "Christmas Island",
-    46: "Cocos Islands",
-    47: "Colombia",
-    48: "Comoros",
-    49: "Congo Kinshasa",
-    50: "Congo Brazzaville",
-    51: "Cook Islands",
-    52: "Costa Rica",
-    53: "Ivory Coast",
-    54: "Croatia",
-    55: "Cuba",
-    56: "Cyprus",
-    57: "Czech Republic",
-    58: "Denmark",
-    59: "Djibouti",
-    60: "Dominica",
-    61: "Dominican Republic",
-    62: "East Timor",
-    63: "Ecuador",
-    64: "Egypt",
-    65: "El Salvador",
-    66: "Equatorial Guinea",
-    67: "Eritrea",
-    68: "Estonia",
-    69: "Ethiopia",
-    70: "Falkland Islands",
-    71: "Faroe Islands",
-    72: "Fiji",
-    73: "Finland",
-    74: "France",
-    75: "Guernsey",
-    76: "French Guiana",
-    77: "French Polynesia",
-    78: "French Southern Territories",
-    79: "Gabon",
-    80: "Gambia",
-    81: "Georgia",
-    82: "Germany",
-    83: "Ghana",
-    84: "Gibraltar",
-    85: "Greece",
-    86: "Greenland",
-    87: "Grenada",
-    88: "Guadeloupe",
-    89: "Guam",
-    90: "Guatemala",
-    91: "Guinea",
-    92: "Guinea Bissau",
-    93: "Guyana",
-    94: "Haiti",
-    95: "Heard And McDonald Islands",
-    96: "Honduras",
-    97: "Hong Kong",
-    98: "Hungary",
-    99: "Iceland",
-    100: "India",
-    101: "Indonesia",
-    102: "Iran",
-    103: "Iraq",
-    104: "Ireland",
-    105: "Israel",
-    106: "Italy",
-    107: "Jamaica",
-    108: "Japan",
-    109: "Jordan",
-    110: "Kazakhstan",
-    111: "Kenya",
-    112: "Kiribati",
-    113: "North Korea",
-    114: "South Korea",
-    115: "Kuwait",
-    116: "Kyrgyzstan",
-    117: "Laos",
-    118: "Latvia",
-    119: "Lebanon",
-    120: "Lesotho",
-    121: "Liberia",
-    122: "Libya",
-    123: "Liechtenstein",
-    124: "Lithuania",
-    125: "Luxembourg",
-    126: "Macau",
-    127: "Macedonia",
-    128: "Madagascar",
-    129: "Malawi",
-    130: "Malaysia",
-    131: "Maldives",
-    132: "Mali",
-    133: "Malta",
-    134: "Marshall Islands",
-    135: "Martinique",
-    136: "Mauritania",
-    137: "Mauritius",
-    138: "Mayotte",
-    139: "Mexico",
-    140: "Micronesia",
-    141: "Moldova",
-    142: "Monaco",
-    143: "Mongolia",
-    144: "Montserrat",
-    145: "Morocco",
-    146: "Mozambique",
-    147: "Myanmar",
-    148: "Namibia",
-    149: "Nauru Country",
-    150: "Nepal",
-    151: "Netherlands",
-    152: "Cura Sao",
-    153: "New Caledonia",
-    154: "New Zealand",
-    155: "Nicaragua",
-    156: "Niger",
-    157: "Nigeria",
-    158: "Niue",
-    159: "Norfolk Island",
-    160: "Northern Mariana Islands",
-    161: "Norway",
-    162: "Oman",
-    163: "Pakistan",
-    164: "Palau",
-    165: "Palestinian Territories",
-    166: "Panama",
-    167: "Papua New Guinea",
-    168: "Paraguay",
-    169: "Peru",
-    170: "Philippines",
-    171: "Pitcairn",
-    172: "Poland",
-    173: "Portugal",
-    174: "Puerto Rico",
-    175: "Qatar",
-    176: "Reunion",
-    177: "Romania",
-    178: "Russia",
-    179: "Rwanda",
-    180: "Saint Kitts And Nevis",
-    181: "Saint Lucia",
-    182: "Saint Vincent And The Grenadines",
-    183: "Samoa",
-    184: "San Marino",
-    185: "Sao Tome And Principe",
-    186: "Saudi Arabia",
-    187: "Senegal",
-    188: "Seychelles",
-    189: "Sierra Leone",
-    190: "Singapore",
-    191: "Slovakia",
-    192: "Slovenia",
-    193: "Solomon Islands",
-    194: "Somalia",
-    195: "South Africa",
-    196: "South Georgia And The South Sandwich Islands",
-    197: "Spain",
-    198: "Sri Lanka",
-    199: "Saint Helena",
-    200: "Saint Pierre And Miquelon",
-    201: "Sudan",
-    202: "Suriname",
-    203: "Svalbard And Jan Mayen Islands",
-    204: "Swaziland",
-    205: "Sweden",
-    206: "Switzerland",
-    207: "Syria",
-    208: "Taiwan",
-    209: "Tajikistan",
-    210: "Tanzania",
-    211: "Thailand",
-    212: "Togo",
-    213: "Tokelau Country",
-    214: "Tonga",
-    215: "Trinidad And Tobago",
-    216: "Tunisia",
-    217: "Turkey",
-    218: "Turkmenistan",
-    219: "Turks And Caicos Islands",
-    220: "Tuvalu Country",
-    221: "Uganda",
-    222: "Ukraine",
-    223: "United Arab Emirates",
-    224: "United Kingdom",
-    225: "United States",
-    226: "United States Minor Outlying Islands",
-    227: "Uruguay",
-    228: "Uzbekistan",
-    229: "Vanuatu",
-    230: "Vatican City State",
-    231: "Venezuela",
-    232: "Vietnam",
-    233: "British Virgin Islands",
-    234: "United States Virgin Islands",
-    235: "Wallis And Futuna Islands",
-    236: "Western Sahara",
-    237: "Yemen",
-    238: "Canary Islands",
-    239: "Zambia",
-    240: "Zimbabwe",
-    241: "Clipperton Island",
-    242: "Montenegro",
-    243: "Serbia",
-    244: "Saint Barthelemy",
-    245: "Saint Martin",
-    246: "Latin America",
-    247: "Ascension Island",
-    248: "Aland Islands",
-    249: "Diego Garcia",
-    250: "Ceuta And Melilla",
-    251: "Isle Of Man",
-    252: "Jersey",
-    253: "Tristan Da Cunha",
-    254: "South Sudan",
-    255: "Bonaire",
-    256: "Sint Maarten",
-    257: "Kosovo",
-    258: "European Union",
-    259: "Outlying Oceania",
-    260: "World",
-    261: "Europe",
-}
 
-INSTRUMENT_KEYS = {
-    0: "-",
-    1: "Drums",
-    2: "Djembe",
-    3: "Electric Guitar",
-    4: "Acoustic Guitar",
-    5: "Bass Guitar",
-    6: "Keyboard",
-    7: "Synthesizer",
-    8: "Grand Piano",
-    9: "Accordion",
-    10: "Vocal",
-    11: "Microphone",
-    12: "Harmonica",
-    13: "Trumpet",
-    14: "Trombone",
-    15: "French Horn",
-    16: "Tuba",
-    17: "Saxophone",
-    18: "Clarinet",
-    19: "Flute",
-    20: "Violin",
-    21: "Cello",
-    22: "Double Bass",
-    23: "Recorder",
-    24: "Streamer",
-    25: "Listener",
-    26: "Guitar Vocal",
-    27: "Keyboard Vocal",
-    28: "Bodhran",
-    29: "Bassoon",
-    30: "Oboe",
-    31: "Harp",
-    32: "Viola",
-    33: "Congas",
-    34: "Bongo",
-    35: "Vocal Bass",
-    36: "Vocal Tenor",
-    37: "Vocal Alto",
-    38: "Vocal Soprano",
-    39: "Banjo",
-    40: "Mandolin",
-    41: "Ukulele",
-    42: "Bass Ukulele",
-    43: "Vocal Baritone",
-    44: "Vocal Lead",
-    45: "Mountain Dulcimer",
-    46: "Scratching",
-    47: "Rapping",
+# lookup tables only needed for displaying values, built on first access (see __getattr__)
+def country_keys():
+    return {
+        0: "-",
+        1: "Afghanistan",
+        2: "Albania",
+        3: "Algeria",
+        4: "American Samoa",
+        5: "Andorra",
+        6: "Angola",
+        7: "Anguilla",
+        8: "Antarctica",
+        9: "Antigua And Barbuda",
+        10: "Argentina",
+        11: "Armenia",
+        12: "Aruba",
+        13: "Australia",
+        14: "Austria",
+        15: "Azerbaijan",
+        16: "Bahamas",
+        17: "Bahrain",
+        18: "Bangladesh",
+        19: "Barbados",
+        20: "Belarus",
+        21: "Belgium",
+        22: "Belize",
+        23: "Benin",
+        24: "Bermuda",
+        25: "Bhutan",
+        26: "Bolivia",
+        27: "Bosnia And Herzegowina",
+        28: "Botswana",
+        29: "Bouvet Island",
+        30: "Brazil",
+        31: "British Indian Ocean Territory",
+        32: "Brunei",
+        33: "Bulgaria",
+        34: "Burkina Faso",
+        35: "Burundi",
+        36: "Cambodia",
+        37: "Cameroon",
+        38: "Canada",
+        39: "Cape Verde",
+        40: "Cayman Islands",
+        41: "Central African Republic",
+        42: "Chad",
+        43: "Chile",
+        44: "China",
+        45: "Christmas Island",
+        46: "Cocos Islands",
+        47: "Colombia",
+        48: "Comoros",
+        49: "Congo Kinshasa",
+        50: "Congo Brazzaville",
+        51: "Cook Islands",
+        52: "Costa Rica",
+        53: "Ivory Coast",
+        54: "Croatia",
+        55: "Cuba",
+        56: "Cyprus",
+        57: "Czech Republic",
+        58: "Denmark",
+        59: "Djibouti",
+        60: "Dominica",
+        61: "Dominican Republic",
+        62: "East Timor",
+        63: "Ecuador",
+        64: "Egypt",
+        65: "El Salvador",
+        66: "Equatorial Guinea",
+        67: "Eritrea",
+        68: "Estonia",
+        69: "Ethiopia",
+        70: "Falkland Islands",
+        71: "Faroe Islands",
+        72: "Fiji",
+        73: "Finland",
+        74: "France",
+        75: "Guernsey",
+        76: "French Guiana",
+        77: "French Polynesia",
+        78: "French Southern Territories",
+        79: "Gabon",
+        80: "Gambia",
+        81: "Georgia",
+        82: "Germany",
+        83: "Ghana",
+        84: "Gibraltar",
+        85: "Greece",
+        86: "Greenland",
+        87: "Grenada",
+        88: "Guadeloupe",
+        89: "Guam",
+        90: "Guatemala",
+        91: "Guinea",
+        92: "Guinea Bissau",
+        93: "Guyana",
+        94: "Haiti",
+        95: "Heard And McDonald Islands",
+        96: "Honduras",
+        97: "Hong Kong",
+        98: "Hungary",
+        99: "Iceland",
+        100: "India",
+        101: "Indonesia",
+        102: "Iran",
+        103: "Iraq",
+        104: "Ireland",
+        105: "Israel",
+        106: "Italy",
+        107: "Jamaica",
+        108: "Japan",
+        109: "Jordan",
+        110: "Kazakhstan",
+        111: "Kenya",
+        112: "Kiribati",
+        113: "North Korea",
+        114: "South Korea",
+        115: "Kuwait",
+        116: "Kyrgyzstan",
+        117: "Laos",
+        118: "Latvia",
+        119: "Lebanon",
+        120: "Lesotho",
+        121: "Liberia",
+        122: "Libya",
+        123: "Liechtenstein",
+        124: "Lithuania",
+        125: "Luxembourg",
+        126: "Macau",
+        127: "Macedonia",
+        128: "Madagascar",
+        129: "Malawi",
+        130: "Malaysia",
+        131: "Maldives",
+        132: "Mali",
+        133: "Malta",
+        134: "Marshall Islands",
+        135: "Martinique",
+        136: "Mauritania",
+        137: "Mauritius",
+        138: "Mayotte",
+        139: "Mexico",
+        140: "Micronesia",
+        141: "Moldova",
+        142: "Monaco",
+        143: "Mongolia",
+        144: "Montserrat",
+        145: "Morocco",
+        146: "Mozambique",
+        147: "Myanmar",
+        148: "Namibia",
+        149: "Nauru Country",
+        150: "Nepal",
+        151: "Netherlands",
+        152: "Cura Sao",
+        153: "New Caledonia",
+        154: "New Zealand",
+        155: "Nicaragua",
+        156: "Niger",
+        157: "Nigeria",
+        158: "Niue",
+        159: "Norfolk Island",
+        160: "Northern Mariana Islands",
+        161: "Norway",
+        162: "Oman",
+        163: "Pakistan",
+        164: "Palau",
+        165: "Palestinian Territories",
+        166: "Panama",
+        167: "Papua New Guinea",
+        168: "Paraguay",
+        169: "Peru",
+        170: "Philippines",
+        171: "Pitcairn",
+        172: "Poland",
+        173: "Portugal",
+        174: "Puerto Rico",
+        175: "Qatar",
+        176: "Reunion",
+        177: "Romania",
+        178: "Russia",
+        179: "Rwanda",
+        180: "Saint Kitts And Nevis",
+        181: "Saint Lucia",
+        182: "Saint Vincent And The Grenadines",
+        183: "Samoa",
+        184: "San Marino",
+        185: "Sao Tome And Principe",
+        186: "Saudi Arabia",
+        187: "Senegal",
+        188: "Seychelles",
+        189: "Sierra Leone",
+        190: "Singapore",
+        191: "Slovakia",
+        192: "Slovenia",
+        193: "Solomon Islands",
+        194: "Somalia",
+        195: "South Africa",
+        196: "South Georgia And The South Sandwich Islands",
+        197: "Spain",
+        198: "Sri Lanka",
+        199: "Saint Helena",
+        200: "Saint Pierre And Miquelon",
+        201: "Sudan",
+        202: "Suriname",
+        203: "Svalbard And Jan Mayen Islands",
+        204: "Swaziland",
+        205: "Sweden",
+        206: "Switzerland",
+        207: "Syria",
+        208: "Taiwan",
+        209: "Tajikistan",
+        210: "Tanzania",
+        211: "Thailand",
+        212: "Togo",
+        213: "Tokelau Country",
+        214: "Tonga",
+        215: "Trinidad And Tobago",
+        216: "Tunisia",
+        217: "Turkey",
+        218: "Turkmenistan",
+        219: "Turks And Caicos Islands",
+        220: "Tuvalu Country",
+        221: "Uganda",
+        222: "Ukraine",
+        223: "United Arab Emirates",
+        224: "United Kingdom",
+        225: "United States",
+        226: "United States Minor Outlying Islands",
+        227: "Uruguay",
+        228: "Uzbekistan",
+        229: "Vanuatu",
+        230: "Vatican City State",
+        231: "Venezuela",
+        232: "Vietnam",
+        233: "British Virgin Islands",
+        234: "United States Virgin Islands",
+        235: "Wallis And Futuna Islands",
+        236: "Western Sahara",
+        237: "Yemen",
+        238: "Canary Islands",
+        239: "Zambia",
+        240: "Zimbabwe",
+        241: "Clipperton Island",
+        242: "Montenegro",
+        243: "Serbia",
+        244: "Saint Barthelemy",
+        245: "Saint Martin",
+        246: "Latin America",
+        247: "Ascension Island",
+        248: "Aland Islands",
+        249: "Diego Garcia",
+        250: "Ceuta And Melilla",
+        251: "Isle Of Man",
+        252: "Jersey",
+        253: "Tristan Da Cunha",
+        254: "South Sudan",
+        255: "Bonaire",
+        256: "Sint Maarten",
+        257: "Kosovo",
+        258: "European Union",
+        259: "Outlying Oceania",
+        260: "World",
+        261: "Europe",
+    }
+
+
+def instrument_keys():
+    return {
+        0: "-",
+        1: "Drums",
+        2: "Djembe",
+        3: "Electric Guitar",
+        4: "Acoustic Guitar",
+        5: "Bass Guitar",
+        6: "Keyboard",
+        7: "Synthesizer",
+        8: "Grand Piano",
+        9: "Accordion",
+        10: "Vocal",
+        11: "Microphone",
+        12: "Harmonica",
+        13: "Trumpet",
+        14: "Trombone",
+        15: "French Horn",
+        16: "Tuba",
+        17: "Saxophone",
+        18: "Clarinet",
+        19: "Flute",
+        20: "Violin",
+        21: "Cello",
+        22: "Double Bass",
+        23: "Recorder",
+        24: "Streamer",
+        25: "Listener",
+        26: "Guitar Vocal",
+        27: "Keyboard Vocal",
+        28: "Bodhran",
+        29: "Bassoon",
+        30: "Oboe",
+        31: "Harp",
+        32: "Viola",
+        33: "Congas",
+        34: "Bongo",
+        35: "Vocal Bass",
+        36: "Vocal Tenor",
+        37: "Vocal Alto",
+        38: "Vocal Soprano",
+        39: "Banjo",
+        40: "Mandolin",
+        41: "Ukulele",
+        42: "Bass Ukulele",
+        43: "Vocal Baritone",
+        44: "Vocal Lead",
+        45: "Mountain Dulcimer",
+        46: "Scratching",
+        47: "Rapping",
+    }
+
+
+def skill_keys():
+    return {0: "-", 1: "Beginner", 2: "Intermediate", 3: "Expert"}
+
+
+def os_keys():
+    return {0: "Windows", 1: "MacOS", 2: "Linux", 3: "Android", 4: "iOS", 5: "Unix"}
+
+
+LAZY_TABLES = {
+    "COUNTRY_KEYS": country_keys,
+    "INSTRUMENT_KEYS": instrument_keys,
+    "SKILL_KEYS": skill_keys,
+    "OS_KEYS": os_keys,
 }
 
-SKILL_KEYS = {0: "-", 1: "Beginner", 2: "Intermediate", 3: "Expert"}
 
-OS_KEYS = {0: "Windows", 1: "MacOS", 2: "Linux", 3: "Android", 4: "iOS", 5: "Unix"}
+def __getattr__(name):
+    # build lazy tables on first access and keep them as module attributes
+    if name in LAZY_TABLES:
+        table = globals()[name] = LAZY_TABLES[name]()
+        return table
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(LAZY_TABLES))
+
+
+# histogram buckets in seconds for encode / decode latencies
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025)
+
+
+class DecodeError(ValueError):
+    """
+    Error decoding a Jamulus message
+
+    Parameters
+    ----------
+    kind : str
+        category of the error ("crc", "length", "id" or "format")
+    message : str
+        error description
+    """
+
+    def __init__(self, kind, message):
+        super().__init__(message)
+        self.kind = kind
+
+
+class Metrics:
+    """
+    Counters and histograms collected by a JamulusConnector
+
+    Metrics are identified by their name and a tuple of (label, value) pairs.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name, labels=(), value=1):
+        """
+        Increment a counter
+
+        Parameters
+        ----------
+        name : str
+            metric name
+        labels : tuple(tuple(str, str))
+            metric labels
+        value : int
+            value to add
+        """
+        metric = (name, labels)
+        self.counters[metric] = self.counters.get(metric, 0) + value
+
+    def observe(self, name, value, labels=()):
+        """
+        Add a value to a histogram
+
+        Parameters
+        ----------
+        name : str
+            metric name
+        value : float
+            observed value
+        labels : tuple(tuple(str, str))
+            metric labels
+        """
+        metric = (name, labels)
+        histogram = self.histograms.get(metric)
+        if histogram is None:
+            # bucket counts (last one is +Inf), sum
+            histogram = self.histograms[metric] = [0] * (len(self.buckets) + 1) + [0.0]
+        histogram[bisect.bisect_left(self.buckets, value)] += 1
+        histogram[-1] += value
+
+    def get(self, name, labels=()):
+        """
+        Get the current value of a counter
+
+        Parameters
+        ----------
+        name : str
+            metric name
+        labels : tuple(tuple(str, str))
+            metric labels
+
+        Returns
+        -------
+        int
+            counter value (0 if never incremented)
+        """
+        return self.counters.get((name, labels), 0)
+
+    def snapshot(self):
+        """
+        Get a copy of all metrics
+
+        Returns
+        -------
+        dict
+            counter values and histograms (bucket counts and sum)
+        """
+        return {
+            "counters": dict(self.counters),
+            "histograms": {k: list(v) for k, v in list(self.histograms.items())},
+        }
+
+    def exposition(self):
+        """
+        Format all metrics in the Prometheus text exposition format
+
+        Returns
+        -------
+        str
+            metrics text
+        """
+
+        def format_labels(labels):
+            if len(labels) == 0:
+                return ""
+            return "{{{}}}".format(",".join('{}="{}"'.format(k, v) for k, v in labels))
+
+        lines = []
+        types = set()
+        for (name, labels), value in sorted(list(self.counters.items())):
+            if name not in types:
+                types.add(name)
+                lines.append("# TYPE {} counter".format(name))
+            lines.append("{}{} {}".format(name, format_labels(labels), value))
+
+        for (name, labels), histogram in sorted(list(self.histograms.items())):
+            if name not in types:
+                types.add(name)
+                lines.append("# TYPE {} histogram".format(name))
+            count = 0
+            for le, bucket_count in zip(self.buckets + ("+Inf",), histogram[:-1]):
+                count += bucket_count
+                lines.append("{}_bucket{} {}".format(name, format_labels(labels + (("le", le),)), count))
+            lines.append("{}_sum{} {}".format(name, format_labels(labels), histogram[-1]))
+            lines.append("{}_count{} {}".format(name, format_labels(labels), count))
+
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="127.0.0.1"):
+        """
+        Serve the metrics text via HTTP in a background thread
+
+        Parameters
+        ----------
+        port : int
+            local port number
+        host : str
+            local address to listen on
+
+        Returns
+        -------
+        http.server.ThreadingHTTPServer
+            running HTTP server
+        """
+        import http.server
+
+        metrics = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.exposition().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = http.server.ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print("serving metrics on port {}".format(port))
+        return server
+
+
+class Profiler:
+    """
+    Sampling profiler for the time spent per message key
+
+    Call counts are exact, times are measured for every n-th call only and
+    extrapolated to all calls.
+
+    Parameters
+    ----------
+    sample_interval : int
+        measure every n-th call
+    report_interval : float
+        seconds between printed top-N reports, None = no reports
+    top : int
+        number of entries in a report
+    """
+
+    def __init__(self, sample_interval=10, report_interval=None, top=10):
+        self.sample_interval = sample_interval
+        self.report_interval = report_interval
+        self.top = top
+        self.next_report = time.monotonic() + report_interval if report_interval is not None else None
+        self.counter = 0
+        # name -> [calls, samples, sampled seconds]
+        self.entries = {}
+        self.window = None
+
+    def start(self):
+        """
+        Start measuring a call
+
+        Returns
+        -------
+        float
+            start time, None if the call is not sampled
+        """
+        self.counter += 1
+        if self.counter >= self.sample_interval:
+            self.counter = 0
+            return time.perf_counter()
+        return None
+
+    def stop(self, name, time_start):
+        """
+        Finish measuring a call
+
+        Parameters
+        ----------
+        name : str / tuple
+            name of the measured section (e.g. ("recv", key))
+        time_start : float
+            value returned by start()
+        """
+        entry = self.entries.get(name)
+        if entry is None:
+            entry = self.entries[name] = [0, 0, 0.0]
+        entry[0] += 1
+
+        if time_start is not None:
+            entry[1] += 1
+            entry[2] += time.perf_counter() - time_start
+
+            if self.next_report is not None and self.next_report <= time.monotonic():
+                print(self.report())
+                self.next_report += self.report_interval
+
+    def stats(self):
+        """
+        Get estimated statistics per section
+
+        Returns
+        -------
+        list(tuple(str, int, float))
+            name, call count and estimated cumulative seconds, most expensive first
+        """
+        stats = []
+        for name, (calls, samples, seconds) in list(self.entries.items()):
+            stats.append((name, calls, seconds * calls / samples if samples > 0 else 0.0))
+        return sorted(stats, key=lambda s: s[2], reverse=True)
+
+    def report(self):
+        """
+        Format the most expensive sections
+
+        Returns
+        -------
+        str
+            top-N report
+        """
+        lines = ["{:<40} {:>10} {:>12} {:>10}".format("section", "calls", "total ms", "mean us")]
+        for name, calls, seconds in self.stats()[: self.top]:
+            if isinstance(name, tuple):
+                name = " ".join(name)
+            lines.append(
+                "{:<40} {:>10} {:>12.1f} {:>10.1f}".format(name, calls, seconds * 1000, seconds * 1000000 / calls)
+            )
+        return "\n".join(lines)
+
+    def install_signal(self, sig, window=10, prefix="jamulus-profile", stack_interval=0.005):
+        """
+        Record a cProfile and stack samples for a time window when a signal is received
+
+        The first signal starts a recording, it ends after the window or when the
+        signal is received again. The results are written to '<prefix>-<pid>-<n>.prof'
+        (cProfile / pstats) and '<prefix>-<pid>-<n>.folded' (collapsed stacks for
+        flamegraph tools).
+
+        Parameters
+        ----------
+        sig : int
+            signal number (e.g. signal.SIGUSR1), must be called from the main thread
+        window : float
+            seconds to record
+        prefix : str
+            prefix of the output file names
+        stack_interval : float
+            seconds between stack samples
+        """
+        import signal
+
+        thread_id = threading.get_ident()
+        recordings = 0
+
+        def handler(signum, frame):
+            nonlocal recordings
+            if self.window is None:
+                import cProfile
+
+                profile = cProfile.Profile()
+                stacks = {}
+                stop = threading.Event()
+                sampler = threading.Thread(target=sample_stacks, args=(stacks, stop), daemon=True)
+                timer = threading.Timer(window, signal.pthread_kill, args=(thread_id, sig))
+                timer.daemon = True
+                self.window = (profile, stacks, stop, sampler, timer)
+                print("profiling for {}s".format(window))
+                sampler.start()
+                timer.start()
+                profile.enable()
+            else:
+                profile, stacks, stop, sampler, timer = self.window
+                self.window = None
+                profile.disable()
+                timer.cancel()
+                stop.set()
+                sampler.join()
+
+                recordings += 1
+                path = "{}-{}-{}".format(prefix, os.getpid(), recordings)
+                profile.dump_stats(path + ".prof")
+                with open(path + ".folded", "w") as f:
+                    for stack, count in stacks.items():
+                        f.write("{} {}\n".format(stack, count))
+                print("profile written to {}.prof / {}.folded".format(path, path))
+
+        def sample_stacks(stacks, stop):
+            while not stop.wait(stack_interval):
+                frame = sys._current_frames().get(thread_id)
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append("{}:{}".format(os.path.basename(code.co_filename), code.co_name))
+                    frame = frame.f_back
+                stack = ";".join(reversed(names))
+                stacks[stack] = stacks.get(stack, 0) + 1
+
+        signal.signal(sig, handler)
+
+
+# struct format characters of the fixed size values / length prefixes of the custom format characters
+PLAN_FORMAT_CHARS = {"A": "L", "U": "B", "V": "H", "v": "H", "z": None}
+
+# (format, mode) -> codec plan, filled on first use of a format
+CODEC_PLANS = {}
+
+
+def codec_plan(format, mode="<"):
+    # fields of a protocol format as (key, format character, compiled struct.Struct) tuples, built on first use
+    try:
+        return CODEC_PLANS[format, mode]
+    except KeyError:
+        pass
+    plan = []
+    for key, format_char in format:
+        struct_char = PLAN_FORMAT_CHARS.get(format_char, format_char)
+        try:
+            plan.append((key, format_char, None if struct_char is None else struct.Struct(mode + struct_char)))
+        except struct.error as error:
+            raise ValueError("invalid format '{}' of '{}': {}".format(format_char, key, error))
+    plan = CODEC_PLANS[format, mode] = tuple(plan)
+    return plan
+
+
+# byte orders of standard sizes without alignment, consecutive fields can be combined into a single struct
+FUSED_MODES = ("<", ">", "!", "=")
+
+# (format, mode) -> (encode, decode) functions, generated on first use of a format
+CODECS = {}
+
+
+def codec(format, mode="<"):
+    # encode(values) -> bytes and decode(data, offset=0) -> (values, offset) functions generated for a
+    # protocol format, equivalent to JamulusConnector.pack / unpack: consecutive fixed size fields and the
+    # length prefixes of the following strings are range checked and encoded / decoded by a single struct
+    # call, values that fail any check are passed to pack / unpack to raise the same errors
+    try:
+        return CODECS[format, mode]
+    except KeyError:
+        pass
+    plan = codec_plan(format, mode)
+
+    if mode not in FUSED_MODES or any(packer is not None and len(packer.format) != 2 for _, _, packer in plan):
+        # repeat counts / padding bytes don't map to a single value per field
+        def encode(values):
+            return JamulusConnector.pack(format, values, mode)
+
+        def decode(data, offset=0):
+            return JamulusConnector.unpack(format, data, offset, mode)
+
+        CODECS[format, mode] = (encode, decode)
+        return encode, decode
+
+    namespace = {
+        "pack": JamulusConnector.pack,
+        "unpack": JamulusConnector.unpack,
+        "format": format,
+        "mode": mode,
+        "inet_aton": socket.inet_aton,
+        "inet_ntoa": socket.inet_ntoa,
+    }
+    structs = []
+
+    def add_struct(chars):
+        name = "struct_{}".format(len(structs))
+        namespace[name] = struct.Struct(mode + "".join(chars))
+        structs.append(name)
+        return name, namespace[name].size
+
+    # encoder: get and convert all values, then join the packed runs of fixed size fields and the variable size data
+    encode_lines = ["def encode(values):", "    try:"]
+    parts = []
+    chars = []
+    args = []
+
+    def flush_encode():
+        if len(chars) > 0:
+            name, size = add_struct(chars)
+            parts.append("{}.pack({})".format(name, ", ".join(args)))
+            chars.clear()
+            args.clear()
+
+    for i, (key, format_char, _) in enumerate(plan):
+        encode_lines.append("        v{} = values[{!r}]".format(i, key))
+        if format_char == "A":
+            encode_lines.append('        v{0} = int.from_bytes(inet_aton(v{0}), "big")'.format(i))
+            chars.append(PLAN_FORMAT_CHARS[format_char])
+            args.append("v{}".format(i))
+        elif format_char in ["U", "V", "v", "z"]:
+            if format_char in ["U", "V"]:
+                encode_lines.append("        v{0} = v{0}.encode()".format(i))
+            else:
+                encode_lines.append("        if not isinstance(v{}, (bytes, bytearray)):".format(i))
+                encode_lines.append("            raise TypeError")
+            if format_char != "z":
+                chars.append(PLAN_FORMAT_CHARS[format_char])
+                args.append("len(v{})".format(i))
+            flush_encode()
+            parts.append("v{}".format(i))
+        else:
+            chars.append(format_char)
+            args.append("v{}".format(i))
+    flush_encode()
+
+    if len(parts) == 1 and len(structs) == 1:
+        encode_lines.append("        return {}".format(parts[0]))
+    else:
+        encode_lines.append('        return b"".join(({}{}))'.format(", ".join(parts), "," if len(parts) == 1 else ""))
+    encode_lines += ["    except Exception:", "        pass", "    return pack(format, values, mode)"]
+
+    # decoder: unpack runs of fixed size fields, slice the variable size data behind them
+    decode_lines = ["def decode(data, offset=0):", "    start = offset", "    try:", "        size = len(data)"]
+    targets = []
+    chars.clear()
+    keys = []
+    conversions = []
+
+    def flush_decode():
+        if len(chars) > 0:
+            name, size = add_struct(chars)
+            decode_lines.append("        ({},) = {}.unpack_from(data, offset)".format(", ".join(targets), name))
+            decode_lines.append("        offset += {}".format(size))
+            decode_lines.extend(conversions)
+            chars.clear()
+            targets.clear()
+            conversions.clear()
+
+    for i, (key, format_char, _) in enumerate(plan):
+        keys.append("{!r}: v{}".format(key, i))
+        if format_char == "A":
+            chars.append(PLAN_FORMAT_CHARS[format_char])
+            targets.append("v{}".format(i))
+            conversions.append('        v{0} = inet_ntoa(v{0}.to_bytes(4, "big"))'.format(i))
+        elif format_char in ["U", "V", "v"]:
+            chars.append(PLAN_FORMAT_CHARS[format_char])
+            targets.append("n{}".format(i))
+            flush_decode()
+            decode_lines.append("        end = offset + n{}".format(i))
+            decode_lines.append("        if end > size:")
+            decode_lines.append("            raise IndexError")
+            if format_char in ["U", "V"]:
+                decode_lines.append('        v{} = str(data[offset:end], "utf-8")'.format(i))
+            else:
+                decode_lines.append("        v{} = bytes(data[offset:end])".format(i))
+            decode_lines.append("        offset = end")
+        elif format_char == "z":
+            flush_decode()
+            decode_lines.append("        if offset > size:")
+            decode_lines.append("            raise IndexError")
+            decode_lines.append("        v{} = bytes(data[offset:])".format(i))
+            decode_lines.append("        offset = size")
+        else:
+            chars.append(format_char)
+            targets.append("v{}".format(i))
+    flush_decode()
+    decode_lines.append("        return {{{}}}, offset".format(", ".join(keys)))
+    decode_lines += ["    except Exception:", "        pass", "    return unpack(format, data, start, mode)"]
+
+    source = "\n".join(encode_lines + [""] + decode_lines) + "\n"
+    filename = "<codec {}>".format(" ".join(key + format_char for key, format_char, _ in plan))
+    exec(compile(source, filename, "exec"), namespace)
+    encode, decode = namespace["encode"], namespace["decode"]
+    encode.source = decode.source = source
+
+    CODECS[format, mode] = (encode, decode)
+    return encode, decode
+
+
+class FrameCache:
+    """
+    LRU cache of encoded main frames of messages with the same values
+
+    Frames are looked up by message key, values and value types (values
+    that are equal but can't be encoded, e.g. 1.0 instead of 1, must not
+    get the frame of a valid value). A cached frame with a different message
+    count gets the count byte patched and its CRC updated with a precomputed
+    difference instead of being encoded again (the CRC is affine, the
+    difference only depends on the changed bits and the frame length). Only
+    messages that are sent with the same values over and over (requests,
+    disconnections, registration responses) are cached.
+
+    Parameters
+    ----------
+    max_size : int
+        maximum number of cached frames
+    """
+
+    # messages with constant values, frames of other messages would rarely be reused
+    CACHED_KEYS = (
+        "REQ_JITT_BUF_SIZE",
+        "REQ_CONN_CLIENTS_LIST",
+        "REQ_CHANNEL_INFOS",
+        "REQ_NETW_TRANSPORT_PROPS",
+        "REQ_SPLIT_MESS_SUPPORT",
+        "REQ_CHANNEL_LEVEL_LIST",
+        "OPUS_SUPPORTED",
+        "CLM_REQ_SERVER_LIST",
+        "CLM_EMPTY_MESSAGE",
+        "CLM_DISCONNECTION",
+        "CLM_REQ_VERSION_AND_OS",
+        "CLM_REQ_CONN_CLIENTS_LIST",
+        "CLM_REGISTER_SERVER_RESP",
+    )
+
+    # frame length -> CRC differences of the count byte values
+    count_crc_deltas = {}
+
+    def __init__(self, max_size=FRAME_CACHE_SIZE):
+        self.max_size = max_size
+        # (key, values) -> (frame, count), least recently used first
+        self.frames = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.frames)
+
+    def cache_key(self, key, values):
+        # hashable cache key, None = not cacheable
+        if key not in FrameCache.CACHED_KEYS:
+            return None
+        if values is None:
+            return (key, None)
+        cache_key = (key, tuple((name, type(value), value) for name, value in values.items()))
+        try:
+            hash(cache_key)
+        except TypeError:
+            return None
+        return cache_key
+
+    def get(self, key, values, count):
+        """
+        Get a cached frame
+
+        Parameters
+        ----------
+        key : str
+            key of the protocol message ID
+        values : dict
+            data keys and values
+        count : int
+            message count
+
+        Returns
+        -------
+        bytes
+            encoded frame, None = not cached
+        """
+        cache_key = self.cache_key(key, values)
+        entry = None if cache_key is None else self.frames.get(cache_key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.frames.move_to_end(cache_key)
+
+        frame, frame_count = entry
+        if frame_count == count:
+            return frame
+        # patch the count byte and update the CRC
+        crc = (frame[-2] | frame[-1] << 8) ^ FrameCache.count_crc_delta(len(frame), frame_count ^ count)
+        frame = frame[:4] + bytes((count,)) + frame[5:-2] + bytes((crc & 0xFF, crc >> 8))
+        self.frames[cache_key] = (frame, count)
+        return frame
+
+    def put(self, key, values, count, frame):
+        """
+        Add an encoded frame
+
+        Parameters
+        ----------
+        key : str
+            key of the protocol message ID
+        values : dict
+            data keys and values
+        count : int
+            message count
+        frame : bytes
+            encoded frame
+        """
+        cache_key = self.cache_key(key, values)
+        if cache_key is None:
+            return
+        self.frames[cache_key] = (frame, count)
+        self.frames.move_to_end(cache_key)
+        if len(self.frames) > self.max_size:
+            self.frames.popitem(last=False)
+
+    @classmethod
+    def count_crc_delta(cls, length, count_bits):
+        # CRC difference of flipping count bits in a frame of the given length (count byte at offset 4)
+        deltas = cls.count_crc_deltas.get(length)
+        if deltas is None:
+            zeros = bytes(length - 7)
+            deltas = cls.count_crc_deltas[length] = [binascii.crc_hqx(bytes((bits,)) + zeros, 0) for bits in range(256)]
+        return deltas[count_bits]
 
 
 class JamulusConnector:
-    def __init__(self, host="", port=DEFAULT_PORT, log=True, log_data=False, log_audio=True):
+    def __init__(
+        self,
+        host="",
+        port=DEFAULT_PORT,
+        log=True,
+        log_data=False,
+        log_audio=True,
+        metrics=None,
+        profiler=None,
+        frame_cache_size=FRAME_CACHE_SIZE,
+        rcvbuf=None,
+        sndbuf=None,
+    ):
         self.log = log
         self.log_data = log_data
         self.log_audio = log_audio
+        # Metrics / Profiler instances, None disables instrumentation
+        self.metrics = metrics
+        self.profiler = profiler
+        # encoded frames of messages sent repeatedly with the same values, None = no caching
+        self.frame_cache = FrameCache(frame_cache_size) if frame_cache_size > 0 else None
         self.host = host
         self.port = port
+        self.family = socket.AF_INET
+        # kernel receive time of the last datagram (see enable_timestamps), None = not available
+        self.timestamps = False
+        self.recv_timestamp = None
+        # datagrams dropped by the kernel since the socket was created (see enable_drop_counter)
+        self.drop_counter = False
+        self.drops = 0
         if self.port is not None:
-            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            print("listening to port {}".format(self.port))
+            self.sock = self.create_socket(host)
+            if self.log:
+                print("listening to port {}".format(self.port))
             self.sock.bind((self.host, self.port))
+            if rcvbuf is not None or sndbuf is not None:
+                granted = self.set_buffer_sizes(rcvbuf, sndbuf)
+                if self.log:
+                    print("socket buffer sizes: receive {} bytes, send {} bytes".format(*granted))
+
+    def create_socket(self, host):
+        """
+        Create the UDP socket, dual-stack (IPv4 and IPv6) if no IPv4 host is given
+
+        Parameters
+        ----------
+        host : str
+            local address to listen on, "" = all IPv4 and IPv6 addresses
+
+        Returns
+        -------
+        socket.socket
+            unbound socket
+        """
+        if ":" in host or (host == "" and socket.has_ipv6):
+            try:
+                sock = socket.socket(socket.AF_INET6, socket.SOCK_DGRAM)
+                if host in ["", "::"]:
+                    # also receive IPv4 (as IPv4-mapped addresses)
+                    sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 0)
+                self.family = socket.AF_INET6
+                return sock
+            except OSError:
+                if host != "":
+                    raise
+                # IPv6 is not available, fall back to IPv4
+        return socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def enable_timestamps(self):
+        """
+        Record kernel receive times of datagrams (SO_TIMESTAMPNS, Linux only)
+
+        The receive time of the last datagram is kept in recv_timestamp as
+        seconds since the epoch (comparable to time.time()).
+
+        Returns
+        -------
+        bool
+            True if timestamps are supported
+        """
+        if not sys.platform.startswith("linux"):
+            return False
+        try:
+            self.sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+        except OSError:
+            return False
+        self.timestamps = True
+        return True
+
+    def enable_drop_counter(self):
+        """
+        Count datagrams dropped by the kernel because the receive buffer was full (SO_RXQ_OVFL, Linux only)
+
+        The counter is delivered with received datagrams and kept in drops.
+
+        Returns
+        -------
+        bool
+            True if the drop counter is supported
+        """
+        if not sys.platform.startswith("linux"):
+            return False
+        try:
+            self.sock.setsockopt(socket.SOL_SOCKET, SO_RXQ_OVFL, 1)
+        except OSError:
+            return False
+        self.drop_counter = True
+        return True
+
+    def set_buffer_sizes(self, rcvbuf=None, sndbuf=None):
+        """
+        Set the socket receive / send buffer sizes
+
+        Sizes above the system limits (net.core.rmem_max / wmem_max on Linux)
+        are forced when the process is allowed to, otherwise they are capped
+        by the kernel.
+
+        Parameters
+        ----------
+        rcvbuf : int
+            receive buffer size in bytes (SO_RCVBUF), None = unchanged
+        sndbuf : int
+            send buffer size in bytes (SO_SNDBUF), None = unchanged
+
+        Returns
+        -------
+        int
+            receive buffer size granted by the kernel
+        int
+            send buffer size granted by the kernel
+        """
+        for size, option, force_option in [
+            (rcvbuf, socket.SO_RCVBUF, getattr(socket, "SO_RCVBUFFORCE", None)),
+            (sndbuf, socket.SO_SNDBUF, getattr(socket, "SO_SNDBUFFORCE", None)),
+        ]:
+            if size is None:
+                continue
+            self.sock.setsockopt(socket.SOL_SOCKET, option, size)
+            # Linux reports twice the requested size
+            if force_option is not None and self.sock.getsockopt(socket.SOL_SOCKET, option) < size:
+                try:
+                    self.sock.setsockopt(socket.SOL_SOCKET, force_option, size)
+                except OSError:
+                    pass
+        return (
+            self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF),
+            self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF),
+        )
 
     def close(self):
         if self.port is not None:
-            print("closing socket")
+            if self.log:
+                print("closing socket")
             self.sock.close()
 
     def calc_crc(self, data):
@@ -529,28 +1378,17 @@ class JamulusConnector:
         int
             calculated CRC value
         """
-        crc = 0xFFFF
-        bmask = 0x10000
-        poly = 0x1020
-
-        for b in data:
-            b = 0xFF & b
-            for i in range(8):
-                crc <<= 1
-                if crc & bmask:
-                    crc |= 1
-                if b & (1 << (7 - i)):
-                    crc ^= 1
-                if crc & 1:
-                    crc ^= poly
-                crc &= 0xFFFF
-
-        return ~crc & 0xFFFF
+        # CRC-16 with polynomial 0x1021 and initial value 0xFFFF (computed in C), inverted
+        return ~binascii.crc_hqx(data, 0xFFFF) & 0xFFFF
 
-    def pack(self, format, values, mode="<"):
+    @staticmethod
+    def pack(format, values, mode="<"):
         """
         Encode data values according to the given protocol format
 
+        interprets the format field by field, the generated codecs of ``codec()`` are used for
+        encoding messages and fall back to this function for values they can't encode
+
         Parameters
         ----------
         format : tuple
@@ -567,7 +1405,7 @@ class JamulusConnector:
             encoded data
         """
         data = b""
-        for key, format_char in format:
+        for key, format_char, packer in codec_plan(format, mode):
             try:
                 value = values[key]
             except KeyError as error:
@@ -576,35 +1414,42 @@ class JamulusConnector:
             try:
                 if format_char == "A":
                     # A = 4 bytes / IPv4 address
-                    ip = socket.inet_aton(value)
-                    data += struct.pack("{}{}".format(mode, "L"), struct.unpack("!L", ip)[0])
+                    try:
+                        ip = socket.inet_aton(value)
+                    except OSError:
+                        raise ValueError("error packing '{}': no IPv4 address ({})".format(key, value))
+                    data += packer.pack(int.from_bytes(ip, "big"))
                 elif format_char in ["U", "V", "v"]:
                     # U = 1 byte length n + n bytes UTF-8 string
                     # V = 2 bytes length n + n bytes UTF-8 string
                     # v = 2 bytes length n + n bytes data
                     if format_char in ["U", "V"]:
                         value = value.encode()
+                    elif not isinstance(value, (bytes, bytearray)):
+                        raise struct.error("argument for 's' must be a bytes object")
 
-                    length_format = "B" if format_char == "U" else "H"
-                    length = len(value)
-
-                    data += struct.pack("{}{}{}{}".format(mode, length_format, length, "s"), length, value)
+                    data += packer.pack(len(value)) + value
                 elif format_char == "z":
                     # z = all remaining data
-                    length = len(value)
-                    data += struct.pack("{}{}".format(length, "s"), value)
+                    if not isinstance(value, (bytes, bytearray)):
+                        raise struct.error("argument for 's' must be a bytes object")
+                    data += value
                 else:
                     # standard format characters
-                    data += struct.pack("{}{}".format(mode, format_char), value)
+                    data += packer.pack(value)
             except struct.error as error:
                 raise ValueError("error packing '{}': {}".format(key, error))
 
         return data
 
-    def unpack(self, format, data, offset=0, mode="<"):
+    @staticmethod
+    def unpack(format, data, offset=0, mode="<"):
         """
         Decode data values according to the given protocol format
 
+        interprets the format field by field, the generated codecs of ``codec()`` are used for
+        decoding messages and fall back to this function for data they can't decode
+
         Parameters
         ----------
         format : tuple
@@ -624,38 +1469,42 @@ class JamulusConnector:
         """
         values = {}
 
-        for key, format_char in format:
+        for key, format_char, unpacker in codec_plan(format, mode):
             try:
                 if format_char == "A":
                     # A = 4 bytes / IPv4 address
-                    ip = struct.pack("!L", *struct.unpack_from("{}{}".format(mode, "L"), data, offset))
-                    values[key] = socket.inet_ntoa(ip)
+                    (ip,) = unpacker.unpack_from(data, offset)
+                    values[key] = socket.inet_ntoa(ip.to_bytes(4, "big"))
                     offset += 4
                 elif format_char in ["U", "V", "v"]:
                     # U = 1 byte length n + n bytes UTF-8 string
                     # V = 2 bytes length n + n bytes UTF-8 string
                     # v = 2 bytes length n + n bytes data
-                    length_format = "B" if format_char == "U" else "H"
-                    (length,) = struct.unpack_from("{}{}".format(mode, length_format), data, offset)
-                    offset += struct.calcsize(length_format)
+                    (length,) = unpacker.unpack_from(data, offset)
+                    offset += unpacker.size
+                    if offset + length > len(data):
+                        raise struct.error(
+                            "{} bytes of data expected, {} bytes left".format(length, len(data) - offset)
+                        )
 
-                    (value,) = struct.unpack_from("{}{}{}".format(mode, length, "s"), data, offset)
+                    value = bytes(data[offset : offset + length])
                     offset += length
 
                     utf8_enc = True if format_char in ["U", "V"] else False
                     values[key] = value.decode() if utf8_enc else value
                 elif format_char == "z":
                     # z = all remaining data
-                    length = len(data) - offset
-                    (values[key],) = struct.unpack_from("{}{}{}".format(mode, length, "s"), data, offset)
-                    offset += length
+                    if offset > len(data):
+                        raise struct.error("offset {} out of range for {} bytes of data".format(offset, len(data)))
+                    values[key] = bytes(data[offset:])
+                    offset = len(data)
                 else:
                     # standard format characters
-                    (values[key],) = struct.unpack_from("{}{}".format(mode, format_char), data, offset)
-                    offset += struct.calcsize("{}{}".format(mode, format_char))
+                    (values[key],) = unpacker.unpack_from(data, offset)
+                    offset += unpacker.size
 
-            except struct.error as error:
-                raise ValueError("error unpacking '{}': {}".format(key, error))
+            except (struct.error, UnicodeDecodeError) as error:
+                raise DecodeError("format", "error unpacking '{}': {}".format(key, error))
 
         return values, offset
 
@@ -677,15 +1526,51 @@ class JamulusConnector:
         bytearray
             encoded data
         """
+        encode = codec(format)[0]
         if repeat:
-            data = b""
-            for v in values:
-                data += self.pack(format, v)
+            data = b"".join(map(encode, values))
         else:
-            data = self.pack(format, values)
+            data = encode(values)
 
         return data
 
+    def iter_pack(self, format, values, max_size):
+        """
+        Encode data sets from an iterable until the size limit is reached
+
+        Parameters
+        ----------
+        format : tuple
+            sequence of multiple data keys and their value's format
+        values : iterable(dict)
+            data keys and values of the data sets
+        max_size : int
+            maximum size of the encoded data
+
+        Returns
+        -------
+        bytes
+            encoded data
+        int
+            number of encoded data sets
+        iterator(dict)
+            data sets that did not fit
+        """
+        encode = codec(format)[0]
+        values = iter(values)
+        parts = []
+        size = 0
+        for v in values:
+            part = encode(v)
+            if size + len(part) > max_size:
+                if len(parts) == 0:
+                    raise ValueError("data set does not fit into {} bytes".format(max_size))
+                return b"".join(parts), len(parts), itertools.chain((v,), values)
+            parts.append(part)
+            size += len(part)
+
+        return b"".join(parts), len(parts), iter(())
+
     def prot_unpack(self, format, data, repeat=False):
         """
         Decode single or multiple data sets according to the given protocol format
@@ -704,30 +1589,53 @@ class JamulusConnector:
         dict / list(dict)
             decoded data keys and values (a list when repeat is true)
         """
-        offset = 0
-
         if repeat:
-            values = []
-            while offset != len(data):
-                v, offset = self.unpack(format, data, offset)
-                values.append(v)
-        else:
-            values, offset = self.unpack(format, data, offset)
+            return [v for offset, v in self.iter_unpack(format, data)]
+
+        values, offset = codec(format)[1](data)
 
         if offset != len(data):
-            raise ValueError("invalid message length ({}/{}) {}".format(offset, len(data), values))
+            raise DecodeError("length", "invalid message length ({}/{}) {}".format(offset, len(data), values))
 
         return values
 
-    def main_pack(self, key, values, count):
+    def iter_unpack(self, format, data, offset=0):
         """
-        Encode a Jamulus 'main frame'
+        Decode repeated data sets one by one
 
         Parameters
         ----------
-        key : str
-            key of the protocol message ID
-        values : dict / list(dict)
+        format : tuple
+            sequence of multiple data keys and their value's format
+        data : bytearray
+            encoded data
+        offset : int
+            position in data bytearray where the decoding should start
+
+        Yields
+        ------
+        int
+            position of the data set in data
+        dict
+            decoded data keys and values
+        """
+        decode = codec(format)[1]
+        while offset < len(data):
+            values, next_offset = decode(data, offset)
+            if next_offset == offset:
+                raise DecodeError("format", "empty data set format")
+            yield offset, values
+            offset = next_offset
+
+    def main_pack(self, key, values, count):
+        """
+        Encode a Jamulus 'main frame'
+
+        Parameters
+        ----------
+        key : str
+            key of the protocol message ID
+        values : dict / list(dict)
             data keys and values (needs to be a list when repeat is true)
         count : int
             message count
@@ -737,13 +1645,18 @@ class JamulusConnector:
         bytearray
             encoded data
         """
+        frame_cache = self.frame_cache
+        if frame_cache is not None:
+            frame = frame_cache.get(key, values, count)
+            if frame is not None:
+                return frame
+
         prot = PROT[key]
         format = prot.get("format", ())
         repeat = prot.get("repeat", False)
 
         # pack main frame and data
-        data = self.pack(
-            FORMAT["MAIN_FRAME"],
+        data = codec(FORMAT["MAIN_FRAME"])[0](
             {
                 "id": MSG_IDS[key],
                 "tag": 0,
@@ -753,11 +1666,46 @@ class JamulusConnector:
         )
 
         # add crc checksum
-        data += self.pack(FORMAT["CRC"], {"crc": self.calc_crc(data)})
+        data += codec(FORMAT["CRC"])[0]({"crc": self.calc_crc(data)})
 
+        if frame_cache is not None:
+            frame_cache.put(key, values, count, data)
         return data
 
-    def main_unpack(self, data, ackn, addr):
+    def main_pack_pages(self, key, values, count=0, max_size=MAX_SIZE_BYTES_NETW_BUF):
+        """
+        Encode repeated data sets into as many Jamulus 'main frames' as needed
+
+        Parameters
+        ----------
+        key : str
+            key of the protocol message ID (with repeated data sets)
+        values : iterable(dict)
+            data keys and values of the data sets
+        count : int
+            message count of the first frame (incremented per frame)
+        max_size : int
+            maximum size of a single frame
+
+        Yields
+        ------
+        bytes
+            encoded frame
+        int
+            number of data sets in the frame
+        """
+        format = PROT[key]["format"]
+        values = iter(values)
+        while True:
+            data, records, values = self.iter_pack(format, values, max_size - MAIN_FRAME_SIZE)
+            if records == 0:
+                return
+            frame = codec(FORMAT["MAIN_FRAME"])[0]({"id": MSG_IDS[key], "tag": 0, "count": count, "data": data})
+            frame += codec(FORMAT["CRC"])[0]({"crc": self.calc_crc(frame)})
+            yield frame, records
+            count = (count + 1) & 0xFF
+
+    def main_unpack(self, data, ackn, addr, payload=True):
         """
         Decode a Jamulus 'main frame'
 
@@ -769,6 +1717,8 @@ class JamulusConnector:
             send acknowledgement messages when needed
         addr : tuple(str, int)
             host/port for sending the acknoledgement
+        payload : bool
+            decode the message data, if false values is None
 
         Returns
         -------
@@ -780,21 +1730,21 @@ class JamulusConnector:
             data keys and values (needs to be a list when repeat is true)
         """
         # get crc attached to data
-        crc_values = self.unpack(FORMAT["CRC"], data, offset=len(data) - 2)[0]
+        crc_values = codec(FORMAT["CRC"])[1](data, len(data) - 2)[0]
         data = data[:-2]
         # calculate crc from data
         crc_check = self.calc_crc(data)
         if crc_values["crc"] != crc_check:
-            raise ValueError("invalid message crc ({}/{})".format(crc_values["crc"], crc_check))
+            raise DecodeError("crc", "invalid message crc ({}/{})".format(crc_values["crc"], crc_check))
 
         # unpack main frame
-        main_values, offset = self.unpack(FORMAT["MAIN_FRAME"], data)
+        main_values, offset = codec(FORMAT["MAIN_FRAME"])[1](data)
         id = main_values["id"]
         count = main_values["count"]
 
         # verify there's no data left
         if offset != len(data):
-            raise ValueError("invalid message length ({}/{}) {}".format(offset, len(data)))
+            raise DecodeError("length", "invalid message length ({}/{})".format(offset, len(data)))
 
         # send acknowledgement
         if ackn:
@@ -802,10 +1752,16 @@ class JamulusConnector:
 
         # verify ID is valid
         if id not in MSG_KEYS.keys() or id == 0:
-            raise ValueError("invalid message ID ({})".format(id))
+            raise DecodeError("id", "invalid message ID ({})".format(id))
 
         key = MSG_KEYS[id]
-        prot = PROT[key]
+        if not payload:
+            return key, count, None
+
+        # obsolete messages have an ID but no format
+        prot = PROT.get(key)
+        if prot is None:
+            raise DecodeError("id", "unsupported message ID ({} {})".format(id, key))
         format = prot.get("format", ())
         repeat = prot.get("repeat", False)
 
@@ -836,6 +1792,8 @@ class JamulusConnector:
                 values={"id": id},
                 count=count,
             )
+            if self.metrics is not None:
+                self.metrics.inc("jamulus_ackn_sent_total")
 
     def log_message(self, addr, key, count="-", length="", values=None, recv=True):
         """
@@ -883,54 +1841,157 @@ class JamulusConnector:
         count : int
             message count
         """
+        metrics = self.metrics
+        profiler = self.profiler
+        if profiler is not None:
+            time_profile = profiler.start()
+
         if key == "AUDIO":
             # pack audio frame
             data = self.pack(FORMAT["AUDIO_FRAME"], values)
-            self.log_message(addr, key, length=len(data), values=values, recv=False)
+            self.send_data(addr, key, data, values=values)
 
         else:
             # pack protocol frame
-            data = self.main_pack(key, values, count)
-            self.log_message(addr, key, count=count, length=len(data), values=values, recv=False)
+            if metrics is not None:
+                time_start = time.perf_counter()
+                data = self.main_pack(key, values, count)
+                metrics.observe("jamulus_encode_seconds", time.perf_counter() - time_start)
+            else:
+                data = self.main_pack(key, values, count)
+            self.send_data(addr, key, data, count=count, values=values)
+
+        if profiler is not None:
+            profiler.stop(("send", key), time_profile)
+
+    def send_data(self, addr, key, data, count="-", values=None):
+        """
+        Send already encoded data to a host
+
+        Parameters
+        ----------
+        addr : tuple(str, int)
+            host/port to send to
+        key : str
+            key of the protocol message ID (for logging and metrics)
+        data : bytes
+            encoded message
+        count : int
+            message count (for logging)
+        values : dict / list(dict)
+            data keys and values (for logging)
+        """
+        metrics = self.metrics
+        self.log_message(addr, key, count=count, length=len(data), values=values, recv=False)
 
         # send data
         if data is not None and len(data) <= MAX_SIZE_BYTES_NETW_BUF:
-            self.sock.sendto(data, addr)
+            try:
+                self.send_datagram(addr, data)
+            except OSError:
+                if metrics is not None:
+                    metrics.inc("jamulus_socket_errors_total", (("op", "send"),))
+                raise
+            if metrics is not None:
+                labels = (("key", key),)
+                metrics.inc("jamulus_packets_sent_total", labels)
+                metrics.inc("jamulus_bytes_sent_total", labels, len(data))
         else:
             print("error: no valid data to send")
 
-    def recvfrom(self, timeout=None, ackn=True, bufsize=MAX_SIZE_BYTES_NETW_BUF):
+    def send_datagram(self, addr, data):
         """
-        Receive and decode a Jamulus message
+        Send a datagram without logging or metrics
+
+        Parameters
+        ----------
+        addr : tuple(str, int)
+            host/port to send to
+        data : bytes
+            encoded message
+        """
+        if self.family == socket.AF_INET6 and ":" not in addr[0]:
+            # IPv4 host on a dual-stack socket
+            self.sock.sendto(data, ("::ffff:" + addr[0], addr[1]))
+        else:
+            self.sock.sendto(data, addr)
+
+    def recv_data(self, timeout=None, bufsize=MAX_SIZE_BYTES_NETW_BUF):
+        """
+        Receive a datagram without decoding it
 
         Parameters
         ----------
         timeout : int
             seconds to wait for message, None = no timeout
-        ackn : bool
-            send acknowledgement messages when needed
         bufsize : int
             receive buffer size
 
         Returns
         -------
+        bytes
+            received data
         tuple(str, int)
-            host/port the message was received from
+            host/port the data was received from
+        """
+        # set timeout (only when changed, it takes system calls)
+        if self.sock.gettimeout() != timeout:
+            self.sock.settimeout(timeout)
+
+        # receive data
+        try:
+            if self.timestamps or self.drop_counter:
+                data, ancdata, flags, addr = self.sock.recvmsg(bufsize, ANCBUFSIZE)
+                self.recv_timestamp = None
+                for level, type, cmsg_data in ancdata:
+                    if level != socket.SOL_SOCKET:
+                        continue
+                    if type == SO_TIMESTAMPNS:
+                        seconds, nanoseconds = TIMESPEC.unpack(cmsg_data[: TIMESPEC.size])
+                        self.recv_timestamp = seconds + nanoseconds / 1e9
+                    elif type == SO_RXQ_OVFL:
+                        (drops,) = DROP_COUNTER.unpack(cmsg_data[: DROP_COUNTER.size])
+                        if drops != self.drops and self.metrics is not None:
+                            self.metrics.inc("jamulus_socket_drops_total", value=(drops - self.drops) & 0xFFFFFFFF)
+                        self.drops = drops
+            else:
+                data, addr = self.sock.recvfrom(bufsize)
+            if self.family == socket.AF_INET6:
+                addr = normalize_address(addr)
+            return data, addr
+        except (socket.timeout, BlockingIOError):
+            raise TimeoutError
+        except OSError:
+            if self.metrics is not None:
+                self.metrics.inc("jamulus_socket_errors_total", (("op", "recv"),))
+            raise
+
+    def decode(self, data, addr, ackn=True, payload=True):
+        """
+        Decode a received Jamulus message
+
+        Parameters
+        ----------
+        data : bytes
+            received data
+        addr : tuple(str, int)
+            host/port the data was received from
+        ackn : bool
+            send acknowledgement messages when needed
+        payload : bool
+            decode the message data, if false only key and count are determined
+            (frames that need an acknowledgement are still verified)
+
+        Returns
+        -------
         str
             key of the protocol message ID
         int
             message count
         dict / list(dict)
-            data keys and values
+            data keys and values (None when payload is false)
         """
-        # set timeout
-        self.sock.settimeout(timeout)
-
-        # receive data
-        try:
-            data, addr = self.sock.recvfrom(bufsize)
-        except socket.timeout:
-            raise TimeoutError
+        metrics = self.metrics
 
         key = "INVALID"
         count = None
@@ -939,31 +2000,2211 @@ class JamulusConnector:
         try:
             # detect protocol messages
             if len(data) >= 9 and data[:2] == b"\x00\x00":
-                key, count, values = self.main_unpack(data, ackn, addr)
+                id = data[2] | data[3] << 8
+                if payload or (ackn and id > MSG_IDS["ACKN"] and id < MSG_IDS["CLM_START"]):
+                    if metrics is not None:
+                        time_start = time.perf_counter()
+                        key, count, values = self.main_unpack(data, ackn, addr, payload)
+                        metrics.observe("jamulus_decode_seconds", time.perf_counter() - time_start)
+                    else:
+                        key, count, values = self.main_unpack(data, ackn, addr, payload)
+                elif id in MSG_KEYS and id != 0:
+                    # header only, the frame is not verified
+                    key = MSG_KEYS[id]
+                    count = data[4]
                 self.log_message(addr, key, count=count, length=len(data), values=values, recv=True)
 
             # assume audio messages
             elif len(data) >= 1:
                 key = "AUDIO"
-                values = self.unpack(FORMAT["AUDIO_FRAME"], data)[0]
+                if payload:
+                    values = self.unpack(FORMAT["AUDIO_FRAME"], data)[0]
                 self.log_message(addr, key, length=len(data), values=values, recv=True)
 
         except ValueError as error:
             print("error decoding message from {}: {} - {}".format(addr, error, data))
+            if metrics is not None:
+                metrics.inc("jamulus_decode_errors_total", (("kind", getattr(error, "kind", "format")),))
+
+        if metrics is not None:
+            labels = (("key", key),)
+            metrics.inc("jamulus_packets_received_total", labels)
+            metrics.inc("jamulus_bytes_received_total", labels, len(data))
+
+        return key, count, values
+
+    def recvfrom(self, timeout=None, ackn=True, bufsize=MAX_SIZE_BYTES_NETW_BUF):
+        """
+        Receive and decode a Jamulus message
+
+        Parameters
+        ----------
+        timeout : int
+            seconds to wait for message, None = no timeout
+        ackn : bool
+            send acknowledgement messages when needed
+        bufsize : int
+            receive buffer size
+
+        Returns
+        -------
+        tuple(str, int)
+            host/port the message was received from
+        str
+            key of the protocol message ID
+        int
+            message count
+        dict / list(dict)
+            data keys and values
+        """
+        data, addr = self.recv_data(timeout, bufsize)
+
+        profiler = self.profiler
+        if profiler is not None:
+            time_profile = profiler.start()
+
+        key, count, values = self.decode(data, addr, ackn)
+
+        if profiler is not None:
+            profiler.stop(("recv", key), time_profile)
 
         return (addr, key, count, values)
 
 
-def server_argument(string):
-    server = string.split(":")
-    if len(server) == 2:
-        port = int(server[1])
-    elif len(server) == 1:
-        port = DEFAULT_PORT
-    else:
-        raise ValueError
-    host = socket.gethostbyname(server[0])
-    return host, port
+class Message:
+    """
+    Lazily decoded Jamulus protocol message
+
+    The frame header (key, count, length) is parsed on creation. The CRC is
+    verified and the values are decoded only when they are accessed, either
+    completely (values), per field (message["name"]) or record by record
+    (records()).
+
+    Parameters
+    ----------
+    jc : JamulusConnector
+        connector used for decoding
+    data : bytes
+        encoded main frame including the CRC
+    """
+
+    # sizes of the fixed size format characters
+    FIXED_SIZES = {"B": 1, "H": 2, "L": 4, "A": 4}
+
+    def __init__(self, jc, data):
+        if len(data) < 9 or data[:2] != b"\x00\x00":
+            raise DecodeError("format", "no protocol message")
+
+        length = data[5] | data[6] << 8
+        if length + 9 != len(data):
+            raise DecodeError("length", "invalid message length ({}/{})".format(length + 9, len(data)))
+
+        self.id = data[2] | data[3] << 8
+        if self.id not in MSG_KEYS or self.id == 0:
+            raise DecodeError("id", "invalid message ID ({})".format(self.id))
+
+        self.jc = jc
+        self.data = data
+        self.key = MSG_KEYS[self.id]
+        self.count = data[4]
+        prot = PROT.get(self.key)
+        if prot is None:
+            raise DecodeError("id", "unsupported message ID ({} {})".format(self.id, self.key))
+        self.format = prot.get("format", ())
+        self.repeat = prot.get("repeat", False)
+        self.verified = False
+        self.decoded = None
+
+    def verify(self):
+        """
+        Verify the CRC of the message (only once)
+        """
+        if not self.verified:
+            crc = self.data[-2] | self.data[-1] << 8
+            crc_check = self.jc.calc_crc(self.data[:-2])
+            if crc != crc_check:
+                raise DecodeError("crc", "invalid message crc ({}/{})".format(crc, crc_check))
+            self.verified = True
+
+    @property
+    def payload(self):
+        """
+        bytes: encoded message data (without frame header and CRC)
+        """
+        return self.data[7:-2]
+
+    @property
+    def values(self):
+        """
+        dict / list(dict): all decoded data keys and values (a list for repeated records)
+        """
+        if self.decoded is None:
+            self.verify()
+            self.decoded = self.jc.prot_unpack(self.format, self.payload, repeat=self.repeat)
+        return self.decoded
+
+    def field_size(self, format_char, data, offset):
+        """
+        Get the encoded size of a single field without decoding it
+
+        Parameters
+        ----------
+        format_char : str
+            format character of the field
+        data : bytes
+            encoded data
+        offset : int
+            position of the field in data
+
+        Returns
+        -------
+        int
+            encoded size in bytes
+        """
+        size = Message.FIXED_SIZES.get(format_char)
+        if size is not None:
+            return size
+        if format_char == "U":
+            return 1 + data[offset]
+        if format_char in ["V", "v"]:
+            return 2 + (data[offset] | data[offset + 1] << 8)
+        # z = all remaining data
+        return len(data) - offset
+
+    def __getitem__(self, name):
+        """
+        Decode a single field (or a single record of repeated messages)
+
+        Parameters
+        ----------
+        name : str / int
+            data key (record index for repeated messages)
+
+        Returns
+        -------
+        value / dict
+            decoded value (record for repeated messages)
+        """
+        if self.decoded is not None:
+            return self.decoded[name]
+
+        if self.repeat:
+            for i, record in enumerate(self.records()):
+                if i == name:
+                    return record
+            raise IndexError(name)
+
+        self.verify()
+        payload = self.payload
+        offset = 0
+        try:
+            for key, format_char in self.format:
+                if key == name:
+                    return self.jc.unpack(((key, format_char),), payload, offset)[0][key]
+                offset += self.field_size(format_char, payload, offset)
+        except IndexError:
+            raise DecodeError("format", "error unpacking '{}': data too short".format(name))
+        raise KeyError(name)
+
+    def records(self):
+        """
+        Decode repeated records one by one
+
+        Yields
+        ------
+        dict
+            decoded data keys and values of a single record
+        """
+        if self.decoded is not None:
+            yield from self.decoded if self.repeat else [self.decoded]
+            return
+
+        self.verify()
+        for offset, values in self.jc.iter_unpack(self.format, self.payload):
+            yield values
+
+    def __len__(self):
+        """
+        Count the records of repeated messages without decoding them (1 otherwise)
+        """
+        if not self.repeat:
+            return 1
+        if self.decoded is not None:
+            return len(self.decoded)
+
+        payload = self.payload
+        offset = 0
+        records = 0
+        try:
+            while offset < len(payload):
+                for key, format_char in self.format:
+                    offset += self.field_size(format_char, payload, offset)
+                records += 1
+        except IndexError:
+            raise DecodeError("format", "error counting records: data too short")
+        if offset != len(payload):
+            raise DecodeError("length", "invalid message length ({}/{})".format(offset, len(payload)))
+        return records
+
+
+class Dispatcher:
+    """
+    Dispatch received messages to handlers registered per message ID
+
+    Handlers are looked up by the message ID in the frame header before the
+    message is decoded. Messages without a handler are not decoded (only
+    acknowledged when needed), middleware can reject messages before decoding.
+
+    Handlers are called as handler(addr, key, count, values), middleware as
+    middleware(addr, key) and returns False to drop the message. Lazy
+    handlers get a Message instead of the decoded values.
+
+    Parameters
+    ----------
+    jc : JamulusConnector
+        connector to receive messages from
+    ackn : bool
+        send acknowledgement messages when needed
+    """
+
+    # handler ID for audio frames
+    AUDIO_ID = -1
+
+    def __init__(self, jc, ackn=True):
+        self.jc = jc
+        self.ackn = ackn
+        self.handlers = {}
+        self.peer_handlers = {}
+        self.middleware = []
+        self.fast_paths = []
+
+    def message_id(self, key):
+        """
+        Get the handler ID of a message key
+
+        Parameters
+        ----------
+        key : str
+            key of the protocol message ID or "AUDIO"
+
+        Returns
+        -------
+        int
+            message ID (AUDIO_ID for audio frames)
+        """
+        return Dispatcher.AUDIO_ID if key == "AUDIO" else MSG_IDS[key]
+
+    def add_handler(self, key, handler, addr=None, lazy=False):
+        """
+        Register a handler for a message key
+
+        Parameters
+        ----------
+        key : str
+            key of the protocol message ID or "AUDIO"
+        handler : callable
+            handler(addr, key, count, values)
+        addr : tuple(str, int)
+            only handle messages from this host/port (takes precedence over global handlers)
+        lazy : bool
+            pass a lazily decoded Message instead of the values (protocol messages only)
+        """
+        if lazy and key == "AUDIO":
+            raise ValueError("audio frames can't be decoded lazily")
+        if addr is None:
+            self.handlers[self.message_id(key)] = (handler, lazy)
+        else:
+            self.peer_handlers[(addr, self.message_id(key))] = (handler, lazy)
+
+    def remove_handler(self, key, addr=None):
+        """
+        Remove a handler for a message key
+
+        Parameters
+        ----------
+        key : str
+            key of the protocol message ID or "AUDIO"
+        addr : tuple(str, int)
+            host/port the handler was registered for
+        """
+        if addr is None:
+            self.handlers.pop(self.message_id(key), None)
+        else:
+            self.peer_handlers.pop((addr, self.message_id(key)), None)
+
+    def add_middleware(self, middleware):
+        """
+        Register a middleware that is called for every handled message before decoding
+
+        Parameters
+        ----------
+        middleware : callable
+            middleware(addr, key), returns False to drop the message
+        """
+        self.middleware.append(middleware)
+
+    def add_fast_path(self, fast_path):
+        """
+        Register a fast path that gets received data before it is parsed
+
+        Fast paths are called as fast_path(data, addr) and return True when
+        they handled the data, which skips middleware, decoding and logging.
+
+        Parameters
+        ----------
+        fast_path : function
+            fast path to call for each received datagram
+        """
+        self.fast_paths.append(fast_path)
+
+    def dispatch(self, data, addr):
+        """
+        Dispatch received data to the registered handler
+
+        Parameters
+        ----------
+        data : bytes
+            received data
+        addr : tuple(str, int)
+            host/port the data was received from
+
+        Returns
+        -------
+        bool
+            True if the message was handled
+        """
+        for fast_path in self.fast_paths:
+            if fast_path(data, addr):
+                return True
+
+        # get message ID from the frame header
+        if len(data) >= 9 and data[:2] == b"\x00\x00":
+            id = data[2] | data[3] << 8
+        elif len(data) >= 1:
+            id = Dispatcher.AUDIO_ID
+        else:
+            return False
+
+        entry = None
+        if len(self.peer_handlers) > 0:
+            entry = self.peer_handlers.get((addr, id))
+        if entry is None:
+            entry = self.handlers.get(id)
+
+        if entry is None:
+            # acknowledge and log only
+            self.jc.decode(data, addr, self.ackn, payload=False)
+            return False
+
+        key = "AUDIO" if id == Dispatcher.AUDIO_ID else MSG_KEYS.get(id, "INVALID")
+        for middleware in self.middleware:
+            if not middleware(addr, key):
+                return False
+
+        profiler = self.jc.profiler
+        if profiler is not None:
+            time_profile = profiler.start()
+
+        handler, lazy = entry
+        if lazy:
+            key, count, values = self.jc.decode(data, addr, self.ackn, payload=False)
+            if key != "INVALID":
+                try:
+                    handler(addr, key, count, Message(self.jc, data))
+                except DecodeError as error:
+                    # raised when the message is decoded lazily
+                    print("error decoding message from {}: {} - {}".format(addr, error, data))
+                    if self.jc.metrics is not None:
+                        self.jc.metrics.inc("jamulus_decode_errors_total", (("kind", error.kind),))
+        else:
+            key, count, values = self.jc.decode(data, addr, self.ackn)
+            if key != "INVALID":
+                handler(addr, key, count, values)
+
+        if profiler is not None:
+            profiler.stop(("handle", key), time_profile)
+
+        return True
+
+    def recv(self, timeout=None, bufsize=MAX_SIZE_BYTES_NETW_BUF):
+        """
+        Receive a single message and dispatch it
+
+        Parameters
+        ----------
+        timeout : int
+            seconds to wait for message, None = no timeout
+        bufsize : int
+            receive buffer size
+
+        Returns
+        -------
+        bool
+            True if the message was handled
+        """
+        data, addr = self.jc.recv_data(timeout, bufsize)
+        return self.dispatch(data, addr)
+
+
+class ConnectorGroup:
+    """
+    Receive from the sockets of multiple connectors through a single selector
+
+    Sockets with pending datagrams are served round-robin, one datagram per
+    socket and turn, so a busy socket can't starve the others. The selector
+    is only polled again when all ready sockets are drained.
+
+    Parameters
+    ----------
+    connectors : list(JamulusConnector)
+        connectors to add (without dispatchers)
+    """
+
+    def __init__(self, connectors=()):
+        self.selector = selectors.DefaultSelector()
+        # connector -> Dispatcher (None = no dispatcher)
+        self.dispatchers = {}
+        # connectors with pending datagrams, next one first
+        self.ready = collections.deque()
+        for jc in connectors:
+            self.add(jc)
+
+    def __len__(self):
+        return len(self.dispatchers)
+
+    def __iter__(self):
+        return iter(self.dispatchers)
+
+    def add(self, jc, dispatcher=None, rcvbuf=None, sndbuf=None):
+        """
+        Add a connector
+
+        Parameters
+        ----------
+        jc : JamulusConnector
+            connector with a socket
+        dispatcher : Dispatcher
+            dispatcher for messages received by the connector (see recv)
+        rcvbuf : int
+            receive buffer size in bytes, None = unchanged
+        sndbuf : int
+            send buffer size in bytes, None = unchanged
+        """
+        if rcvbuf is not None or sndbuf is not None:
+            jc.set_buffer_sizes(rcvbuf, sndbuf)
+        self.selector.register(jc.sock, selectors.EVENT_READ, jc)
+        self.dispatchers[jc] = dispatcher
+
+    def remove(self, jc):
+        """
+        Remove a connector (the connector is not closed)
+
+        Parameters
+        ----------
+        jc : JamulusConnector
+            connector added before
+        """
+        self.selector.unregister(jc.sock)
+        del self.dispatchers[jc]
+        if jc in self.ready:
+            self.ready.remove(jc)
+
+    def recv_data(self, timeout=None, bufsize=MAX_SIZE_BYTES_NETW_BUF):
+        """
+        Receive a datagram from any of the sockets without decoding it
+
+        Parameters
+        ----------
+        timeout : float
+            seconds to wait for a datagram, None = no timeout
+        bufsize : int
+            receive buffer size
+
+        Returns
+        -------
+        JamulusConnector
+            connector that received the data
+        bytes
+            received data
+        tuple(str, int)
+            host/port the data was received from
+        """
+        time_end = None if timeout is None else time.monotonic() + timeout
+        while True:
+            while len(self.ready) > 0:
+                jc = self.ready.popleft()
+                try:
+                    data, addr = jc.recv_data(0, bufsize)
+                except TimeoutError:
+                    # drained, wait for the selector
+                    continue
+                self.ready.append(jc)
+                return jc, data, addr
+
+            events = self.selector.select(None if time_end is None else max(0, time_end - time.monotonic()))
+            if len(events) == 0:
+                raise TimeoutError
+            self.ready.extend(selector_key.data for selector_key, mask in events)
+
+    def recvfrom(self, timeout=None, ackn=True, bufsize=MAX_SIZE_BYTES_NETW_BUF):
+        """
+        Receive and decode a Jamulus message from any of the sockets
+
+        Parameters
+        ----------
+        timeout : float
+            seconds to wait for a message, None = no timeout
+        ackn : bool
+            send acknowledgement messages when needed
+        bufsize : int
+            receive buffer size
+
+        Returns
+        -------
+        JamulusConnector
+            connector that received the message
+        tuple(str, int)
+            host/port the message was received from
+        str
+            key of the protocol message ID
+        int
+            message count
+        dict / list(dict)
+            data keys and values
+        """
+        jc, data, addr = self.recv_data(timeout, bufsize)
+        key, count, values = jc.decode(data, addr, ackn)
+        return jc, addr, key, count, values
+
+    def recv(self, timeout=None, bufsize=MAX_SIZE_BYTES_NETW_BUF):
+        """
+        Receive a single message from any of the sockets and dispatch it
+
+        Messages are dispatched by the dispatcher of the receiving connector,
+        messages of connectors without a dispatcher are only decoded.
+
+        Parameters
+        ----------
+        timeout : float
+            seconds to wait for a message, None = no timeout
+        bufsize : int
+            receive buffer size
+
+        Returns
+        -------
+        bool
+            True if the message was handled
+        """
+        jc, data, addr = self.recv_data(timeout, bufsize)
+        dispatcher = self.dispatchers[jc]
+        if dispatcher is None:
+            jc.decode(data, addr)
+            return False
+        return dispatcher.dispatch(data, addr)
+
+    def close(self):
+        # the connectors are not closed
+        self.selector.close()
+        self.dispatchers.clear()
+        self.ready.clear()
+
+
+# connection less requests that trigger (large) responses
+RATE_LIMITED_KEYS = (
+    "CLM_REQ_SERVER_LIST",
+    "CLM_REQ_CONN_CLIENTS_LIST",
+    "CLM_REQ_VERSION_AND_OS",
+    "CLM_SEND_EMPTY_MESSAGE",
+)
+
+
+class RateLimiter:
+    """
+    Token bucket rate limiter per source IP and message key
+
+    The buckets are kept in a table ordered by last use. It is limited to
+    max_sources entries, idle entries are evicted automatically. Messages of
+    new sources are dropped while the table is full of buckets in use (evicting
+    them would reset their limits). Can be used as Dispatcher middleware
+    (runs before decoding).
+
+    Parameters
+    ----------
+    budgets : dict
+        message key -> (tokens per second, burst size), keys without budget are not limited
+    max_sources : int
+        maximum number of tracked (source IP, message key) buckets
+    idle_timeout : float
+        seconds after which unused buckets are evicted
+    metrics : Metrics
+        count dropped messages, None = no metrics
+    """
+
+    def __init__(self, budgets, max_sources=10000, idle_timeout=60, metrics=None):
+        self.budgets = budgets
+        self.max_sources = max_sources
+        self.idle_timeout = idle_timeout
+        self.metrics = metrics
+        # (ip, key) -> [tokens, time updated]
+        self.buckets = collections.OrderedDict()
+        self.dropped = {}
+
+    def __call__(self, addr, key):
+        """
+        Take a token for a message
+
+        Parameters
+        ----------
+        addr : tuple(str, int)
+            host/port the message was received from
+        key : str
+            key of the protocol message ID
+
+        Returns
+        -------
+        bool
+            False if the message should be dropped
+        """
+        budget = self.budgets.get(key)
+        if budget is None:
+            return True
+
+        rate, burst = budget
+        now = time.monotonic()
+        buckets = self.buckets
+
+        # evict idle buckets (the least recently used ones are first)
+        while len(buckets) > 0:
+            oldest = next(iter(buckets.values()))
+            if oldest[1] > now - self.idle_timeout:
+                break
+            buckets.popitem(last=False)
+
+        bucket_key = (addr[0], key)
+        bucket = buckets.get(bucket_key)
+        if bucket is None:
+            if len(buckets) < self.max_sources:
+                bucket = buckets[bucket_key] = [burst, now]
+        else:
+            buckets.move_to_end(bucket_key)
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+
+        # no bucket = table full of buckets in use
+        if bucket is not None and bucket[0] >= 1:
+            bucket[0] -= 1
+            return True
+
+        self.dropped[key] = self.dropped.get(key, 0) + 1
+        if self.metrics is not None:
+            self.metrics.inc("jamulus_rate_limited_total", (("key", key),))
+        return False
+
+
+# messages shed under overload, lowest priority first (messages not listed, e.g. registrations, are never shed)
+OVERLOAD_SHED_KEYS = (
+    ("AUDIO",),
+    ("CLM_REQ_SERVER_LIST", "CLM_REQ_CONN_CLIENTS_LIST", "CLM_REQ_VERSION_AND_OS", "CLM_SEND_EMPTY_MESSAGE"),
+)
+
+# queueing delays in seconds from which the overload levels 1, 2, ... start
+OVERLOAD_DELAYS = (0.02, 0.1)
+
+
+class OverloadPolicy:
+    """
+    Shed low priority messages while the receive queue is backed up
+
+    The overload level is the number of delays exceeded by the queueing delay
+    of a message (time since the kernel received it). At level n the first n
+    groups of shed_keys are dropped: audio first, then list requests. After
+    the kernel dropped datagrams the highest level is kept for hold seconds.
+    Can be used as Dispatcher middleware (runs before decoding).
+
+    Parameters
+    ----------
+    jc : JamulusConnector
+        connector the messages are received with (kernel timestamps and drop counter are enabled, Linux only)
+    delays : tuple(float)
+        queueing delays in seconds from which the levels 1, 2, ... start
+    hold : float
+        seconds the highest level is kept after kernel drops
+    shed_keys : tuple(tuple(str))
+        message keys shed per level, lowest priority first
+    metrics : Metrics
+        count shed messages, None = no metrics
+    """
+
+    def __init__(self, jc, delays=OVERLOAD_DELAYS, hold=1.0, shed_keys=OVERLOAD_SHED_KEYS, metrics=None):
+        self.jc = jc
+        self.delays = delays
+        self.hold = hold
+        self.metrics = metrics
+        # message key -> level from which it is shed
+        self.shed_levels = {key: level + 1 for level, keys in enumerate(shed_keys) for key in keys}
+        self.max_level = len(shed_keys)
+        timestamps = jc.enable_timestamps()
+        drop_counter = jc.enable_drop_counter()
+        self.supported = timestamps or drop_counter
+        self.drops = jc.drops
+        self.hold_until = 0.0
+        self.level = 0
+        self.shed = {}
+
+    def current_level(self):
+        """
+        Get the overload level of the last received message
+
+        Returns
+        -------
+        int
+            overload level, 0 = no overload
+        """
+        now = time.monotonic()
+        if self.jc.drops != self.drops:
+            self.drops = self.jc.drops
+            self.hold_until = now + self.hold
+        if now < self.hold_until:
+            return self.max_level
+        if self.jc.recv_timestamp is None:
+            return 0
+        return bisect.bisect_right(self.delays, time.time() - self.jc.recv_timestamp)
+
+    def __call__(self, addr, key):
+        """
+        Check if a message should be shed
+
+        Parameters
+        ----------
+        addr : tuple(str, int)
+            host/port the message was received from
+        key : str
+            key of the protocol message ID
+
+        Returns
+        -------
+        bool
+            False if the message should be dropped
+        """
+        shed_level = self.shed_levels.get(key)
+        if shed_level is None:
+            return True
+
+        level = self.current_level()
+        if level != self.level:
+            print("overload level {} (kernel drops {})".format(level, self.drops))
+            self.level = level
+        if level < shed_level:
+            return True
+
+        self.shed[key] = self.shed.get(key, 0) + 1
+        if self.metrics is not None:
+            self.metrics.inc("jamulus_overload_shed_total", (("key", key),))
+        return False
+
+
+class PingResponder:
+    """
+    Dispatcher fast path that answers pings without decoding / encoding them
+
+    Ping frames are recognized by their fixed header bytes and verified by
+    their CRC. CLM_PING_MS frames are reflected as they are, the number of
+    clients is patched into CLM_PING_MS_WITHNUMCLIENTS frames before the CRC
+    is recalculated. With kernel timestamps enabled on the connector, the time
+    from receiving a ping to sending the reply is measured.
+
+    Parameters
+    ----------
+    jc : JamulusConnector
+        connector to send replies with
+    clients : function
+        clients() returning the number of connected clients
+    """
+
+    # tag, message ID and data length of the ping frames (the count byte in between varies)
+    PING_MS = (
+        b"\x00\x00" + struct.pack("<H", MSG_IDS["CLM_PING_MS"]),
+        struct.pack("<H", struct.calcsize("<" + "".join(char for _, char in FORMAT["CLM_PING_MS"]))),
+    )
+    PING_MS_WITHNUMCLIENTS = (
+        b"\x00\x00" + struct.pack("<H", MSG_IDS["CLM_PING_MS_WITHNUMCLIENTS"]),
+        struct.pack("<H", struct.calcsize("<" + "".join(char for _, char in FORMAT["CLM_PING_MS_WITHNUMCLIENTS"]))),
+    )
+
+    def __init__(self, jc, clients=None):
+        self.jc = jc
+        self.clients = clients
+        self.replies = 0
+        # turnaround times of replies to timestamped pings
+        self.turnarounds = 0
+        self.turnaround_total = 0.0
+        self.turnaround_max = 0.0
+
+    def __call__(self, data, addr):
+        length = len(data)
+        if length == 13:
+            header, data_length = PingResponder.PING_MS
+        elif length == 14:
+            header, data_length = PingResponder.PING_MS_WITHNUMCLIENTS
+        else:
+            return False
+        if data[:4] != header or data[5:7] != data_length:
+            return False
+
+        body = data[:-2]
+        if data[-2:] != struct.pack("<H", self.jc.calc_crc(body)):
+            # leave invalid frames to the regular path (which reports them)
+            return False
+
+        if length == 14 and self.clients is not None:
+            body = body[:11] + bytes((min(self.clients(), 255),))
+            data = body + struct.pack("<H", self.jc.calc_crc(body))
+
+        metrics = self.jc.metrics
+        try:
+            self.jc.send_datagram(addr, data)
+        except OSError:
+            if metrics is not None:
+                metrics.inc("jamulus_socket_errors_total", (("op", "send"),))
+            return True
+        self.replies += 1
+
+        if self.jc.recv_timestamp is not None:
+            turnaround = time.time() - self.jc.recv_timestamp
+            self.turnarounds += 1
+            self.turnaround_total += turnaround
+            self.turnaround_max = max(self.turnaround_max, turnaround)
+            if metrics is not None:
+                metrics.observe("jamulus_ping_turnaround_seconds", turnaround)
+
+        if metrics is not None:
+            labels = (("key", MSG_KEYS[data[2] | data[3] << 8]),)
+            metrics.inc("jamulus_packets_received_total", labels)
+            metrics.inc("jamulus_bytes_received_total", labels, length)
+            metrics.inc("jamulus_packets_sent_total", labels)
+            metrics.inc("jamulus_bytes_sent_total", labels, length)
+        return True
+
+    def report(self):
+        """
+        Get a report of the replies since the last report
+
+        Returns
+        -------
+        str
+            number of replies and turnaround times
+        """
+        output = "{} pings answered".format(self.replies)
+        if self.turnarounds > 0:
+            output += ", turnaround from kernel receive time avg {:.3f}ms max {:.3f}ms".format(
+                self.turnaround_total / self.turnarounds * 1000,
+                self.turnaround_max * 1000,
+            )
+        self.replies = self.turnarounds = 0
+        self.turnaround_total = self.turnaround_max = 0.0
+        return output
+
+
+class Session:
+    """
+    State of a client connected to a server
+
+    Attributes
+    ----------
+    addr : tuple(str, int)
+        host/port of the client
+    id : int
+        channel ID of the client (CLIENT_ID)
+    transport_props : dict
+        values of the last NETW_TRANSPORT_PROPS message, None = not received yet
+    jitter_buffer_size : int
+        jitter buffer size requested with JITT_BUF_SIZE, None = not received yet
+    jitter_buffer : JitterBuffer
+        jitter buffer of the client, None = no buffering
+    codec : AudioCodec
+        audio encoder / decoder of the client, None = audio is not decoded
+    sequence : int
+        sequence number of the next audio frame sent to the client
+    channel_info : dict
+        values of the last CHANNEL_INFOS message, None = not received yet
+    last_seen : float
+        monotonic time the client was last seen
+    """
+
+    __slots__ = (
+        "addr",
+        "id",
+        "transport_props",
+        "jitter_buffer_size",
+        "jitter_buffer",
+        "codec",
+        "sequence",
+        "channel_info",
+        "last_seen",
+    )
+
+    def __init__(self, addr, id, now):
+        self.addr = addr
+        self.id = id
+        self.transport_props = None
+        self.jitter_buffer_size = None
+        self.jitter_buffer = None
+        self.codec = None
+        self.sequence = 0
+        self.channel_info = None
+        self.last_seen = now
+
+
+class SessionTable:
+    """
+    Table of client sessions with constant time lookups by address
+
+    Channel IDs are taken from a free-list, the lowest free ID is used first
+    and IDs are reused after a session ends. The sessions are kept ordered by
+    last seen time, so idle sessions are found without scanning the table.
+
+    Parameters
+    ----------
+    max_sessions : int
+        maximum number of sessions
+    timeout : float
+        seconds after which idle sessions expire
+    first_id : int
+        lowest channel ID to use (lower IDs can be used for other channels)
+    """
+
+    def __init__(self, max_sessions=MAX_NUM_CHANNELS, timeout=CHANNEL_TIMEOUT, first_id=0):
+        self.timeout = timeout
+        # addr -> Session, least recently seen first
+        self.sessions = collections.OrderedDict()
+        self.free_ids = list(range(first_id, first_id + max_sessions))
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def __contains__(self, addr):
+        return addr in self.sessions
+
+    def __iter__(self):
+        return iter(self.sessions.values())
+
+    def get(self, addr):
+        """
+        Get the session of an address
+
+        Parameters
+        ----------
+        addr : tuple(str, int)
+            host/port of the client
+
+        Returns
+        -------
+        Session
+            session of the client, None = no session
+        """
+        return self.sessions.get(addr)
+
+    def create(self, addr, now=None):
+        """
+        Create a session with the lowest free channel ID
+
+        Parameters
+        ----------
+        addr : tuple(str, int)
+            host/port of the client
+        now : float
+            monotonic time, None = current time
+
+        Returns
+        -------
+        Session
+            new session, None = table is full
+        """
+        # an existing session of the address frees its ID first
+        self.remove(addr)
+        if len(self.free_ids) == 0:
+            return None
+        session = Session(addr, heapq.heappop(self.free_ids), time.monotonic() if now is None else now)
+        self.sessions[addr] = session
+        return session
+
+    def touch(self, session, now=None):
+        """
+        Update the last seen time of a session
+
+        Parameters
+        ----------
+        session : Session
+            session of the client
+        now : float
+            monotonic time, None = current time
+        """
+        session.last_seen = time.monotonic() if now is None else now
+        self.sessions.move_to_end(session.addr)
+
+    def remove(self, addr):
+        """
+        Remove a session and free its channel ID
+
+        Parameters
+        ----------
+        addr : tuple(str, int)
+            host/port of the client
+
+        Returns
+        -------
+        Session
+            removed session, None = no session
+        """
+        session = self.sessions.pop(addr, None)
+        if session is not None:
+            heapq.heappush(self.free_ids, session.id)
+        return session
+
+    def expire(self, now=None):
+        """
+        Remove sessions that were not seen within the timeout
+
+        Parameters
+        ----------
+        now : float
+            monotonic time, None = current time
+
+        Returns
+        -------
+        list(Session)
+            removed sessions
+        """
+        time_limit = (time.monotonic() if now is None else now) - self.timeout
+        expired = []
+        # the least recently seen sessions are first
+        while len(self.sessions) > 0:
+            session = next(iter(self.sessions.values()))
+            if session.last_seen > time_limit:
+                break
+            expired.append(self.remove(session.addr))
+        return expired
+
+
+class JitterBuffer:
+    """
+    Jitter buffer for audio frames
+
+    A ring buffer of preallocated slots indexed by sequence number. Frames are
+    inserted at the position of their sequence number (8 bit, wrapping), so
+    reordered frames are played in order and missing frames are detected.
+    Frames without sequence numbers are assumed to arrive in order.
+
+    With automatic sizing the size follows the measured interarrival jitter.
+
+    Parameters
+    ----------
+    size : int
+        size in frames, AUTO_JITT_BUF_SIZE = automatic sizing
+    frame_period : float
+        seconds per frame
+    max_size : int
+        maximum size in frames (number of slots)
+
+    Attributes
+    ----------
+    jitter : float
+        interarrival jitter estimate in seconds (RFC 3550)
+    puts, gets : int
+        number of frames put and requested
+    underruns : int
+        requested frames that were missing (lost or late)
+    overruns : int
+        frames dropped because the buffer was full
+    late : int
+        frames received after they were due
+    duplicates : int
+        frames received more than once
+    """
+
+    def __init__(
+        self,
+        size=AUTO_JITT_BUF_SIZE,
+        frame_period=SYSTEM_FRAME_SIZE_SAMPLES * 2 / SYSTEM_SAMPLE_RATE,
+        max_size=MAX_JITT_BUF_SIZE,
+    ):
+        self.frame_period = frame_period
+        self.max_size = max_size
+        self.slots = [None] * max_size
+        # unwrapped sequence number of the frame in each slot
+        self.slot_sequences = [None] * max_size
+        self.size = MIN_JITT_BUF_SIZE
+        self.set_size(size)
+        self.jitter = 0.0
+        self.puts = self.gets = 0
+        self.underruns = self.overruns = self.late = self.duplicates = 0
+        self.reset()
+
+    def set_size(self, size):
+        """
+        Set the size (when JITT_BUF_SIZE is received)
+
+        Parameters
+        ----------
+        size : int
+            size in frames, AUTO_JITT_BUF_SIZE = automatic sizing
+        """
+        self.auto = size == AUTO_JITT_BUF_SIZE
+        if not self.auto:
+            self.size = max(MIN_JITT_BUF_SIZE, min(self.max_size, size))
+
+    def reset(self):
+        """
+        Drop all frames and wait for the buffer to fill again
+        """
+        self.read = None  # unwrapped sequence number of the next frame to get
+        self.write = None  # highest unwrapped sequence number put
+        self.playing = False
+        self.last_arrival = None
+
+    def __len__(self):
+        """
+        Number of frames between the read position and the newest frame (including missing ones)
+        """
+        return 0 if self.read is None else max(0, self.write - self.read + 1)
+
+    def put(self, data, sequence=None, now=None):
+        """
+        Insert a received frame
+
+        Parameters
+        ----------
+        data : bytes
+            audio frame (without sequence number)
+        sequence : int
+            sequence number of the frame (0 ... 255), None = next frame
+        now : float
+            monotonic arrival time, None = current time
+        """
+        now = time.monotonic() if now is None else now
+        self.puts += 1
+
+        if self.read is None:
+            position = self.read = self.write = 0 if sequence is None else sequence
+        elif sequence is None:
+            position = self.write + 1
+        else:
+            # signed distance to the newest frame (sequence numbers wrap after 255)
+            position = self.write + ((sequence - self.write + 128) & 0xFF) - 128
+
+        if self.last_arrival is not None and position > self.write:
+            # deviation from the expected arrival time
+            deviation = abs(now - self.last_arrival - (position - self.write) * self.frame_period)
+            self.jitter += (deviation - self.jitter) / 16
+            if self.auto:
+                size = 1 + round(4 * self.jitter / self.frame_period)
+                self.size = max(MIN_JITT_BUF_SIZE, min(self.max_size, size))
+        if position >= self.write:
+            self.last_arrival = now
+
+        if position < self.read:
+            self.late += 1
+            return
+
+        slot = position % self.max_size
+        if self.slot_sequences[slot] == position:
+            self.duplicates += 1
+            return
+
+        # drop the oldest frames when the buffer is full
+        if position - self.read >= self.size:
+            read = position - self.size + 1
+            for dropped in range(self.read, min(read, self.write + 1)):
+                if self.slot_sequences[dropped % self.max_size] == dropped:
+                    self.overruns += 1
+            self.read = read
+
+        self.slots[slot] = data
+        self.slot_sequences[slot] = position
+        self.write = max(self.write, position)
+
+    def get(self):
+        """
+        Get the next frame to play (once per frame period)
+
+        Returns
+        -------
+        bytes
+            audio frame, None = no frame (buffer filling or frame missing)
+        """
+        if self.read is None:
+            return None
+
+        # start playing when half of the buffer is filled
+        if not self.playing:
+            if len(self) < (self.size + 1) // 2:
+                return None
+            self.playing = True
+
+        self.gets += 1
+        if self.read > self.write:
+            # buffer ran empty, fill it again before playing
+            self.underruns += 1
+            self.playing = False
+            return None
+
+        slot = self.read % self.max_size
+        self.read += 1
+        if self.slot_sequences[slot] != self.read - 1:
+            self.underruns += 1
+            return None
+        self.slot_sequences[slot] = None
+        data = self.slots[slot]
+        self.slots[slot] = None
+        return data
+
+    def stats(self):
+        """
+        Get the buffer statistics
+
+        Returns
+        -------
+        dict
+            size, jitter and frame counters
+        """
+        return {
+            "size": self.size,
+            "jitter_ms": self.jitter * 1000,
+            "puts": self.puts,
+            "gets": self.gets,
+            "underruns": self.underruns,
+            "overruns": self.overruns,
+            "late": self.late,
+            "duplicates": self.duplicates,
+        }
+
+
+class Mixer:
+    """
+    Audio mixer with per-listener gain and panning of each channel
+
+    Works on raw 16 bit PCM frames (little endian, interleaved) instead of
+    encoded audio. The first sample of a frame must not be zero, otherwise the
+    frame is taken for a protocol message. Every listener gets a stereo mix of
+    all active channels, the mix is computed with matrix products over all
+    listeners at once. Requires NumPy.
+
+    Parameters
+    ----------
+    max_channels : int
+        number of channel IDs
+    frame_samples : int
+        samples per audio channel and frame
+    """
+
+    def __init__(self, max_channels=MAX_NUM_CHANNELS, frame_samples=SYSTEM_FRAME_SIZE_SAMPLES * 2):
+        import numpy
+
+        self.np = numpy
+        self.frame_samples = frame_samples
+        # current input frame of each channel (left, right)
+        self.inputs = numpy.zeros((max_channels, 2, frame_samples), dtype=numpy.float32)
+        # [listener, channel] gain factors and panning (0 = left, 1 = right)
+        self.gains = numpy.ones((max_channels, max_channels), dtype=numpy.float32)
+        self.pans = numpy.full((max_channels, max_channels), 0.5, dtype=numpy.float32)
+        self.gains_left = numpy.ones((max_channels, max_channels), dtype=numpy.float32)
+        self.gains_right = numpy.ones((max_channels, max_channels), dtype=numpy.float32)
+
+    def frame_size(self, num_chan):
+        """
+        Size of a raw PCM frame
+
+        Parameters
+        ----------
+        num_chan : int
+            number of audio channels (1 = mono, 2 = stereo)
+
+        Returns
+        -------
+        int
+            size of a frame in bytes
+        """
+        return self.frame_samples * num_chan * 2
+
+    def set_input(self, id, data, num_chan):
+        """
+        Set the input frame of a channel
+
+        Parameters
+        ----------
+        id : int
+            channel ID
+        data : bytes
+            raw PCM frame, None = silence
+        num_chan : int
+            number of audio channels of the frame (1 = mono, 2 = stereo)
+
+        Returns
+        -------
+        bool
+            False if the frame size does not match (the input is silent)
+        """
+        if data is None or len(data) != self.frame_size(num_chan):
+            self.inputs[id] = 0
+            return data is None
+        samples = self.np.frombuffer(data, dtype="<i2").reshape(self.frame_samples, num_chan)
+        self.inputs[id] = samples.T
+        return True
+
+    def set_gain(self, listener, id, gain):
+        """
+        Set the gain of a channel in the mix of a listener
+
+        Parameters
+        ----------
+        listener : int
+            channel ID of the listener
+        id : int
+            channel ID of the mixed channel
+        gain : int
+            CHANNEL_GAIN value (0 ... MAX_GAIN)
+        """
+        self.gains[listener, id] = gain / MAX_GAIN
+        self.update_gains(listener, id)
+
+    def set_pan(self, listener, id, panning):
+        """
+        Set the panning of a channel in the mix of a listener
+
+        Parameters
+        ----------
+        listener : int
+            channel ID of the listener
+        id : int
+            channel ID of the mixed channel
+        panning : int
+            CHANNEL_PAN value (0 = left ... MAX_PAN = right)
+        """
+        self.pans[listener, id] = panning / MAX_PAN
+        self.update_gains(listener, id)
+
+    def update_gains(self, listener, id):
+        # balance panning as in Jamulus (center = full level on both sides)
+        pan = self.pans[listener, id]
+        self.gains_left[listener, id] = self.gains[listener, id] * min(1.0, 2 * (1 - pan))
+        self.gains_right[listener, id] = self.gains[listener, id] * min(1.0, 2 * pan)
+
+    def reset(self, id):
+        """
+        Reset input, gains and panning of a channel (when the channel ID is reused)
+
+        Parameters
+        ----------
+        id : int
+            channel ID
+        """
+        self.inputs[id] = 0
+        for table, value in [(self.gains, 1), (self.pans, 0.5), (self.gains_left, 1), (self.gains_right, 1)]:
+            table[id, :] = value
+            table[:, id] = value
+
+    def mix(self, ids):
+        """
+        Mix the inputs of the channels for each of the channels
+
+        Parameters
+        ----------
+        ids : list(int)
+            channel IDs of the connected clients
+
+        Returns
+        -------
+        numpy.ndarray
+            mixed audio of each listener (len(ids) x 2 x frame_samples)
+        """
+        np = self.np
+        ids = np.asarray(ids, dtype=np.intp)
+        inputs = self.inputs[ids]
+        output = np.empty((len(ids), 2, self.frame_samples), dtype=np.float32)
+        # listener x channel gains times channel x samples
+        np.matmul(self.gains_left[np.ix_(ids, ids)], inputs[:, 0], out=output[:, 0])
+        np.matmul(self.gains_right[np.ix_(ids, ids)], inputs[:, 1], out=output[:, 1])
+        return output
+
+    def encode(self, output, num_chans):
+        """
+        Convert mixed audio to raw PCM frames
+
+        Parameters
+        ----------
+        output : numpy.ndarray
+            mixed audio as returned by mix()
+        num_chans : list(int)
+            number of audio channels of each listener (1 = mono, 2 = stereo)
+
+        Returns
+        -------
+        list(bytes)
+            raw PCM frame of each listener
+        """
+        np = self.np
+        # frames starting with two zero bytes would be taken for protocol messages
+        stereo = np.clip(output, -32768, 32767).astype("<i2")
+        stereo[stereo[:, 0, 0] == 0, 0, 0] = 1
+        stereo = stereo.transpose(0, 2, 1)
+        if 1 in num_chans:
+            mono = np.clip(output.mean(axis=1), -32768, 32767).astype("<i2")
+            mono[mono[:, 0] == 0, 0] = 1
+        return [stereo[n].tobytes() if num_chan == 2 else mono[n].tobytes() for n, num_chan in enumerate(num_chans)]
+
+
+class LevelMeter:
+    """
+    Channel level meter for CLM_CHANNEL_LEVEL_LIST
+
+    Keeps the peak level of each channel since the last update and sends the
+    levels to subscribed clients at a limited rate. A subscriber only gets
+    the list when it changed since it was last sent. Requires NumPy.
+
+    Parameters
+    ----------
+    max_channels : int
+        number of channel IDs
+    interval : float
+        minimum seconds between updates
+    """
+
+    def __init__(self, max_channels=MAX_NUM_CHANNELS, interval=CHANNEL_LEVEL_INTERVAL):
+        import numpy
+
+        self.np = numpy
+        self.interval = interval
+        self.peaks = numpy.zeros(max_channels, dtype=numpy.float32)
+        # addr -> levels last sent
+        self.subscribers = {}
+        self.next_update = 0.0
+
+    def subscribe(self, addr, enable=True):
+        """
+        Subscribe a client to level updates (when REQ_CHANNEL_LEVEL_LIST is received)
+
+        Parameters
+        ----------
+        addr : tuple(str, int)
+            host/port of the client
+        enable : bool
+            False = unsubscribe
+        """
+        if enable:
+            self.subscribers.setdefault(addr, None)
+        else:
+            self.subscribers.pop(addr, None)
+
+    def add(self, ids, frames):
+        """
+        Add audio frames to the peak levels
+
+        Parameters
+        ----------
+        ids : list(int)
+            channel IDs
+        frames : numpy.ndarray
+            audio of each channel (len(ids) x ...), e.g. Mixer.inputs[ids]
+        """
+        np = self.np
+        ids = np.asarray(ids, dtype=np.intp)
+        peaks = np.abs(frames).reshape(len(ids), -1).max(axis=1)
+        self.peaks[ids] = np.maximum(self.peaks[ids], peaks)
+
+    def levels(self, ids):
+        """
+        Get the channel levels and reset the peaks
+
+        Parameters
+        ----------
+        ids : list(int)
+            channel IDs in the order of the connected clients list
+
+        Returns
+        -------
+        numpy.ndarray
+            level steps of the channels (0 ... NUM_STEPS_LED_BAR)
+        """
+        np = self.np
+        ids = np.asarray(ids, dtype=np.intp)
+        peaks = np.maximum(self.peaks[ids], 1)
+        self.peaks[ids] = 0
+        db = 20 * np.log10(peaks / 32768)
+        steps = np.ceil((db - LOW_BOUND_SIG_METER) / -LOW_BOUND_SIG_METER * NUM_STEPS_LED_BAR)
+        return np.clip(steps, 0, NUM_STEPS_LED_BAR).astype(np.uint8)
+
+    def pack(self, levels):
+        """
+        Pack channel levels as 4 bit values (first channel in the low nibble)
+
+        Parameters
+        ----------
+        levels : numpy.ndarray
+            level steps of the channels
+
+        Returns
+        -------
+        bytes
+            CLM_CHANNEL_LEVEL_LIST data
+        """
+        np = self.np
+        if len(levels) % 2 != 0:
+            levels = np.append(levels, np.uint8(0))
+        return (levels[0::2] | levels[1::2] << 4).astype(np.uint8).tobytes()
+
+    def unpack(self, data, channels):
+        """
+        Unpack channel levels from 4 bit values
+
+        Parameters
+        ----------
+        data : bytes
+            CLM_CHANNEL_LEVEL_LIST data
+        channels : int
+            number of channels
+
+        Returns
+        -------
+        list(int)
+            level steps of the channels
+        """
+        return [(data[n // 2] >> (n % 2 * 4)) & 0x0F for n in range(channels)]
+
+    def update(self, jc, ids, now=None):
+        """
+        Send the channel levels to the subscribers if the update interval passed
+
+        Parameters
+        ----------
+        jc : JamulusConnector
+            connector to send the levels with
+        ids : list(int)
+            channel IDs in the order of the connected clients list
+        now : float
+            monotonic time, None = current time
+
+        Returns
+        -------
+        int
+            number of clients the levels were sent to
+        """
+        now = time.monotonic() if now is None else now
+        if now < self.next_update or len(self.subscribers) == 0:
+            return 0
+        self.next_update = now + self.interval
+
+        levels = self.pack(self.levels(ids))
+        sent = 0
+        for addr, levels_sent in self.subscribers.items():
+            if levels != levels_sent:
+                jc.sendto(addr, "CLM_CHANNEL_LEVEL_LIST", {"levels": levels})
+                self.subscribers[addr] = levels
+                sent += 1
+        return sent
+
+
+class StandInCodec:
+    """
+    Stand-in for the Opus codec (for tests or when libopus is not available)
+
+    Encodes a frame to the requested size by keeping the high byte of evenly
+    spaced samples. It is much cheaper than Opus and not compatible with it,
+    both ends have to use the stand-in.
+
+    Parameters
+    ----------
+    frame_samples : int
+        samples per audio channel and frame
+    num_chan : int
+        number of audio channels (1 = mono, 2 = stereo)
+    frame_bytes : int
+        size of an encoded frame
+    """
+
+    def __init__(self, frame_samples, num_chan, frame_bytes):
+        self.frame_samples = frame_samples
+        self.num_chan = num_chan
+        self.frame_bytes = frame_bytes
+        # the first byte is a marker, so frames are not taken for protocol messages
+        kept = max(1, (frame_bytes - 1) // num_chan)
+        self.step = -(-frame_samples // kept)
+        self.kept = -(-frame_samples // self.step)
+        self.stride = 2 * num_chan * self.step
+        # preallocated output buffers
+        self.encoded = bytearray(frame_bytes)
+        self.encoded[0] = 0xFF
+        self.decoded = bytearray(frame_samples * num_chan * 2)
+
+    def encode(self, pcm):
+        """
+        Encode a frame
+
+        Parameters
+        ----------
+        pcm : bytes
+            raw 16 bit PCM frame (little endian, interleaved)
+
+        Returns
+        -------
+        bytes
+            encoded frame
+        """
+        encoded = self.encoded
+        end = 1 + self.kept * self.num_chan
+        for c in range(self.num_chan):
+            # high byte of each kept sample
+            encoded[1 + c : end : self.num_chan] = pcm[2 * c + 1 :: self.stride]
+        return bytes(encoded)
+
+    def decode(self, data):
+        """
+        Decode a frame
+
+        Parameters
+        ----------
+        data : bytes
+            encoded frame, None = lost frame
+
+        Returns
+        -------
+        bytes
+            raw 16 bit PCM frame (silence for lost frames)
+        """
+        decoded = self.decoded
+        if data is None:
+            return bytes(len(decoded))
+        end = 1 + self.kept * self.num_chan
+        for c in range(self.num_chan):
+            high = data[1 + c : end : self.num_chan]
+            # repeat each kept sample
+            for k in range(self.step):
+                start = 2 * c + 1 + 2 * self.num_chan * k
+                decoded[start :: self.stride] = high[: len(range(start, len(decoded), self.stride))]
+        return bytes(decoded)
+
+
+class OpusCodec:
+    """
+    Opus codec in custom mode (as used by Jamulus)
+
+    Uses libopus via ctypes, it has to be built with custom modes enabled.
+    Frames are encoded with constant bitrate to the requested size.
+
+    Parameters
+    ----------
+    frame_samples : int
+        samples per audio channel and frame
+    num_chan : int
+        number of audio channels (1 = mono, 2 = stereo)
+    frame_bytes : int
+        size of an encoded frame
+    """
+
+    OPUS_SET_VBR_REQUEST = 4006
+    lib = None
+    modes = {}
+
+    @classmethod
+    def load(cls):
+        """
+        Load libopus
+
+        Returns
+        -------
+        ctypes.CDLL
+            libopus, None = not available (or without custom modes)
+        """
+        if cls.lib is None:
+            import ctypes
+            import ctypes.util
+
+            cls.lib = False
+            name = ctypes.util.find_library("opus")
+            if name is None:
+                return None
+            lib = ctypes.CDLL(name)
+            if not hasattr(lib, "opus_custom_mode_create"):
+                return None
+
+            error = ctypes.POINTER(ctypes.c_int)
+            lib.opus_custom_mode_create.argtypes = [ctypes.c_int, ctypes.c_int, error]
+            lib.opus_custom_mode_create.restype = ctypes.c_void_p
+            for function in [lib.opus_custom_encoder_create, lib.opus_custom_decoder_create]:
+                function.argtypes = [ctypes.c_void_p, ctypes.c_int, error]
+                function.restype = ctypes.c_void_p
+            lib.opus_custom_encoder_ctl.restype = ctypes.c_int
+            lib.opus_custom_encode.argtypes = [
+                ctypes.c_void_p,
+                ctypes.c_char_p,
+                ctypes.c_int,
+                ctypes.c_char_p,
+                ctypes.c_int,
+            ]
+            lib.opus_custom_encode.restype = ctypes.c_int
+            lib.opus_custom_decode.argtypes = [
+                ctypes.c_void_p,
+                ctypes.c_char_p,
+                ctypes.c_int,
+                ctypes.POINTER(ctypes.c_int16),
+                ctypes.c_int,
+            ]
+            lib.opus_custom_decode.restype = ctypes.c_int
+            for function in [lib.opus_custom_encoder_destroy, lib.opus_custom_decoder_destroy]:
+                function.argtypes = [ctypes.c_void_p]
+                function.restype = None
+            cls.lib = lib
+        return cls.lib or None
+
+    def __init__(self, frame_samples, num_chan, frame_bytes):
+        import ctypes
+
+        lib = OpusCodec.load()
+        if lib is None:
+            raise ImportError("libopus with custom modes is not available")
+        self.lib = lib
+        self.frame_samples = frame_samples
+        self.frame_bytes = frame_bytes
+
+        error = ctypes.c_int()
+        # modes are shared by all codecs of a frame size
+        mode = OpusCodec.modes.get(frame_samples)
+        if mode is None:
+            mode = lib.opus_custom_mode_create(SYSTEM_SAMPLE_RATE, frame_samples, ctypes.byref(error))
+            if not mode:
+                raise ValueError("error creating opus mode ({})".format(error.value))
+            OpusCodec.modes[frame_samples] = mode
+        self.encoder = lib.opus_custom_encoder_create(mode, num_chan, ctypes.byref(error))
+        self.decoder = lib.opus_custom_decoder_create(mode, num_chan, ctypes.byref(error))
+        if not self.encoder or not self.decoder:
+            self.close()
+            raise ValueError("error creating opus codec ({})".format(error.value))
+        lib.opus_custom_encoder_ctl(
+            ctypes.c_void_p(self.encoder),
+            ctypes.c_int(OpusCodec.OPUS_SET_VBR_REQUEST),
+            ctypes.c_int(0),
+        )
+
+        # preallocated output buffers
+        self.encoded = ctypes.create_string_buffer(frame_bytes)
+        self.decoded = (ctypes.c_int16 * (frame_samples * num_chan))()
+
+    def close(self):
+        """
+        Free the encoder and decoder
+        """
+        if self.encoder:
+            self.lib.opus_custom_encoder_destroy(self.encoder)
+            self.encoder = None
+        if self.decoder:
+            self.lib.opus_custom_decoder_destroy(self.decoder)
+            self.decoder = None
+
+    def __del__(self):
+        if hasattr(self, "decoder"):
+            self.close()
+
+    def encode(self, pcm):
+        """
+        Encode a frame
+
+        Parameters
+        ----------
+        pcm : bytes
+            raw 16 bit PCM frame (little endian, interleaved)
+
+        Returns
+        -------
+        bytes
+            encoded frame
+        """
+        size = self.lib.opus_custom_encode(self.encoder, pcm, self.frame_samples, self.encoded, self.frame_bytes)
+        if size < 0:
+            raise ValueError("error encoding opus frame ({})".format(size))
+        return self.encoded.raw[:size]
+
+    def decode(self, data):
+        """
+        Decode a frame
+
+        Parameters
+        ----------
+        data : bytes
+            encoded frame, None = lost frame (packet loss concealment)
+
+        Returns
+        -------
+        bytes
+            raw 16 bit PCM frame
+        """
+        samples = self.lib.opus_custom_decode(
+            self.decoder, data, 0 if data is None else len(data), self.decoded, self.frame_samples
+        )
+        if samples < 0:
+            return bytes(len(self.decoded) * 2)
+        return bytes(self.decoded)
+
+
+class AudioCodec:
+    """
+    Audio packet codec for the negotiated transport properties
+
+    A packet holds block_size_fact frames of base_netw_size bytes each. Keeps
+    the encoder and decoder state of a single client, so one is needed per
+    session.
+
+    Parameters
+    ----------
+    transport_props : dict
+        NETW_TRANSPORT_PROPS values
+    frame_codec : class
+        codec for Opus frames (OpusCodec / StandInCodec), None = OpusCodec if available
+    """
+
+    # samples per audio channel and frame of the supported audiocod_types
+    FRAME_SAMPLES = {
+        AUDIO_CODEC_NONE: SYSTEM_FRAME_SIZE_SAMPLES,
+        AUDIO_CODEC_OPUS: SYSTEM_FRAME_SIZE_SAMPLES * 2,
+        AUDIO_CODEC_OPUS64: SYSTEM_FRAME_SIZE_SAMPLES,
+    }
+
+    def __init__(self, transport_props, frame_codec=None):
+        audiocod_type = transport_props["audiocod_type"]
+        if audiocod_type not in AudioCodec.FRAME_SAMPLES:
+            raise ValueError("unsupported audio codec type ({})".format(audiocod_type))
+
+        self.num_chan = transport_props["num_chan"]
+        self.frames = max(1, transport_props["block_size_fact"])
+        self.frame_samples = AudioCodec.FRAME_SAMPLES[audiocod_type]
+        self.frame_bytes = transport_props["base_netw_size"]
+        self.pcm_frame_bytes = self.frame_samples * self.num_chan * 2
+        # samples per audio channel and packet
+        self.samples = self.frame_samples * self.frames
+        self.packet_bytes = self.frame_bytes * self.frames
+
+        if audiocod_type == AUDIO_CODEC_NONE:
+            if self.frame_bytes != self.pcm_frame_bytes:
+                raise ValueError("invalid raw audio frame size ({})".format(self.frame_bytes))
+            self.codec = None
+        else:
+            if frame_codec is None:
+                frame_codec = OpusCodec if OpusCodec.load() is not None else StandInCodec
+            self.codec = frame_codec(self.frame_samples, self.num_chan, self.frame_bytes)
+
+    def encode(self, pcm):
+        """
+        Encode an audio packet
+
+        Parameters
+        ----------
+        pcm : bytes
+            raw 16 bit PCM audio of a packet (little endian, interleaved)
+
+        Returns
+        -------
+        bytes
+            encoded audio packet
+        """
+        if self.codec is None:
+            return pcm
+        size = self.pcm_frame_bytes
+        return b"".join(self.codec.encode(pcm[i * size : (i + 1) * size]) for i in range(self.frames))
+
+    def decode(self, data):
+        """
+        Decode an audio packet
+
+        Parameters
+        ----------
+        data : bytes
+            encoded audio packet, None = lost packet (packets of the wrong size are lost)
+
+        Returns
+        -------
+        bytes
+            raw 16 bit PCM audio of the packet
+        """
+        if data is not None and len(data) != self.packet_bytes:
+            data = None
+        if self.codec is None:
+            return bytes(self.samples * self.num_chan * 2) if data is None else data
+        size = self.frame_bytes
+        return b"".join(
+            self.codec.decode(None if data is None else data[i * size : (i + 1) * size]) for i in range(self.frames)
+        )
+
+
+class ServerAddress(tuple):
+    """
+    Resolved host/port of a server that keeps the host name for resolving it again
+
+    Compares and hashes like the (ip, port) tuple of the first resolved address.
+
+    Attributes
+    ----------
+    host : str
+        host name (or address) the server was given as
+    addresses : list(tuple(str, int))
+        all resolved host/port tuples, IPv4 addresses first
+    """
+
+    def __new__(cls, host, addresses):
+        self = super().__new__(cls, addresses[0])
+        self.host = host
+        self.addresses = addresses
+        return self
+
+
+class Resolution:
+    """
+    Cached addresses of a host name
+
+    Attributes
+    ----------
+    addresses : list(tuple(str, int))
+        resolved host/port tuples
+    index : int
+        index of the address in use
+    expires : float
+        monotonic time after which the host name is resolved again
+    future : concurrent.futures.Future
+        resolution running in the background, None = no resolution running
+    """
+
+    __slots__ = ("addresses", "index", "expires", "future")
+
+    def __init__(self, addresses, expires):
+        self.addresses = addresses
+        self.index = 0
+        self.expires = expires
+        self.future = None
+
+
+class Resolver:
+    """
+    Cache of resolved server addresses, refreshed in the background
+
+    Lookups never block: expired host names are resolved again in a thread
+    pool while the cached addresses remain in use. When a host name resolves
+    to multiple addresses, the address in use is kept as long as it is still
+    resolved and failover() moves on to the next one.
+
+    Parameters
+    ----------
+    ttl : float
+        seconds after which host names are resolved again
+    retry : float
+        seconds after which failed resolutions are retried
+    max_workers : int
+        maximum number of concurrent resolutions
+    lookup : function
+        lookup(host, port) returning a list of host/port tuples
+    """
+
+    def __init__(self, ttl=DNS_TTL, retry=DNS_RETRY, max_workers=2, lookup=None):
+        self.ttl = ttl
+        self.retry = retry
+        self.max_workers = max_workers
+        self.lookup = resolve_addresses if lookup is None else lookup
+        self.executor = None
+        # (host, port) -> Resolution
+        self.resolutions = {}
+
+    def add(self, server, now=None):
+        """
+        Add a server with the addresses it was resolved to
+
+        Parameters
+        ----------
+        server : ServerAddress
+            resolved server (plain host/port tuples are never resolved again)
+        now : float
+            monotonic time, None = current time
+        """
+        now = time.monotonic() if now is None else now
+        addresses = getattr(server, "addresses", [tuple(server)])
+        self.resolutions[self.key(server)] = Resolution(list(addresses), now + self.ttl)
+
+    def key(self, server):
+        return getattr(server, "host", server[0]), server[1]
+
+    def address(self, server, now=None):
+        """
+        Get the address in use for a server without blocking
+
+        Applies finished background resolutions and starts a new one when the
+        cached addresses expired.
+
+        Parameters
+        ----------
+        server : ServerAddress
+            server added with add()
+        now : float
+            monotonic time, None = current time
+
+        Returns
+        -------
+        tuple(str, int)
+            host/port to send to
+        """
+        now = time.monotonic() if now is None else now
+        resolution = self.resolutions[self.key(server)]
+
+        if resolution.future is not None and resolution.future.done():
+            self.update(resolution, resolution.future, now)
+        if resolution.future is None and now >= resolution.expires and hasattr(server, "host"):
+            if self.executor is None:
+                # imported on first use, it takes longer to import than the rest of the module
+                import concurrent.futures
+
+                self.executor = concurrent.futures.ThreadPoolExecutor(self.max_workers, thread_name_prefix="resolver")
+            resolution.future = self.executor.submit(self.lookup, server.host, server[1])
+
+        return resolution.addresses[resolution.index]
+
+    def update(self, resolution, future, now):
+        resolution.future = None
+        try:
+            addresses = future.result()
+        except OSError as error:
+            # keep the cached addresses until the name resolves again
+            print("resolving failed, retrying in {}s: {}".format(self.retry, error))
+            resolution.expires = now + self.retry
+            return
+        if len(addresses) == 0:
+            resolution.expires = now + self.retry
+            return
+
+        # stay on the address in use if it still resolves
+        current = resolution.addresses[resolution.index]
+        resolution.index = addresses.index(current) if current in addresses else 0
+        resolution.addresses = addresses
+        resolution.expires = now + self.ttl
+
+    def addresses(self, server):
+        """
+        Get all cached addresses of a server
+
+        Parameters
+        ----------
+        server : ServerAddress
+            server added with add()
+
+        Returns
+        -------
+        list(tuple(str, int))
+            cached host/port tuples
+        """
+        return self.resolutions[self.key(server)].addresses
+
+    def failover(self, server):
+        """
+        Move on to the next cached address of a server
+
+        Parameters
+        ----------
+        server : ServerAddress
+            server added with add()
+
+        Returns
+        -------
+        tuple(str, int)
+            host/port to send to
+        """
+        resolution = self.resolutions[self.key(server)]
+        resolution.index = (resolution.index + 1) % len(resolution.addresses)
+        return resolution.addresses[resolution.index]
+
+    @property
+    def pending(self):
+        # background resolutions running or not yet applied
+        return any(resolution.future is not None for resolution in self.resolutions.values())
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+
+def normalize_address(addr):
+    # canonical (host, port) tuple of a socket address, IPv4-mapped IPv6 addresses as IPv4
+    host = addr[0]
+    if host.startswith("::ffff:") and "." in host:
+        host = host[7:]
+    return host, addr[1]
+
+
+def is_ipv4(host):
+    # normalized addresses only, IPv6 addresses always contain colons
+    return ":" not in host
+
+
+def server_argument(string):
+    # host, host:port, IPv6 address or [IPv6 address]:port
+    if string.startswith("["):
+        host, bracket, port = string[1:].partition("]")
+        if bracket == "" or (port != "" and not port.startswith(":")):
+            raise ValueError
+        port = port[1:]
+    elif string.count(":") == 1:
+        host, port = string.split(":")
+    else:
+        host, port = string, ""
+    port = int(port) if port != "" else DEFAULT_PORT
+
+    # the host name is kept for resolving it again (see Resolver)
+    return ServerAddress(host, resolve_addresses(host, port))
+
+
+def add_server_arguments(parser, profile=True, overload=True):
+    # command line options shared by the server scripts (metrics, rate limits, profiling, socket buffers, overload)
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        help="local port number for serving metrics",
+    )
+    parser.add_argument(
+        "--rate-limit",
+        type=float,
+        nargs=2,
+        metavar=("RATE", "BURST"),
+        help="limit requests per source IP to RATE per second with bursts of BURST",
+    )
+    if profile:
+        parser.add_argument(
+            "--profile",
+            type=float,
+            metavar="INTERVAL",
+            help="profile message handling, report every INTERVAL seconds and record a cProfile on SIGUSR1",
+        )
+    parser.add_argument(
+        "--rcvbuf",
+        type=int,
+        help="socket receive buffer size in bytes (SO_RCVBUF)",
+    )
+    parser.add_argument(
+        "--sndbuf",
+        type=int,
+        help="socket send buffer size in bytes (SO_SNDBUF)",
+    )
+    if overload:
+        parser.add_argument(
+            "--overload",
+            action="store_true",
+            help="shed audio, then list requests while the receive queue is backed up (Linux only)",
+        )
+
+
+def resolve_addresses(host, port):
+    # all addresses of a host name (A and AAAA records), IPv4 addresses first
+    addresses = socket.getaddrinfo(host, port, type=socket.SOCK_DGRAM)
+    addresses.sort(key=lambda address: address[0] != socket.AF_INET)
+    return list(dict.fromkeys(normalize_address(address[4]) for address in addresses))
+
+
+def reduced_server(server):
+    # CLM_RED_SERVER_LIST entry of a CLM_SERVER_LIST entry (name limited to 255 bytes)
+    name = server["name"].encode()[:255].decode(errors="ignore")
+    return {"ip": server["ip"], "port": server["port"], "name": name}
 
 
 def silent_audio(base_netw_size):
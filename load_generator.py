@@ -0,0 +1,402 @@
+#!/usr/bin/python3
+
+import jamulus
+
+import argparse
+import math
+import multiprocessing
+import selectors
+import signal
+import statistics
+import struct
+import sys
+
+from time import monotonic, process_time
+
+
+BASE_NETW_SIZE = 22
+JITT_BUF_SIZE = 5
+DEFAULT_CLIENTS = 10
+DEFAULT_FRAME_RATE = 375  # 128 samples at 48 kHz
+DEFAULT_DURATION = 30
+DEFAULT_PING_INTERVAL = 1
+PCM_BLOCK_SIZE_FACT = 2
+PCM_NUM_CHAN = 2
+ENCODED_BASE_NETW_SIZE = 47  # bytes per encoded stereo frame of 64 samples
+
+
+def pcm_audio(number):
+    # stereo tone of a whole number of periods per packet, different for each client
+    # (starts at full level, frames must not start with a zero sample)
+    samples = jamulus.SYSTEM_FRAME_SIZE_SAMPLES * PCM_BLOCK_SIZE_FACT
+    periods = 1 + number % 8
+    values = [int(8000 * math.cos(2 * math.pi * periods * n / samples)) for n in range(samples)]
+    return struct.pack("<{}h".format(samples * PCM_NUM_CHAN), *[v for v in values for c in range(PCM_NUM_CHAN)])
+
+
+def transport_props(audio):
+    if audio == "silence":
+        props = {
+            "base_netw_size": BASE_NETW_SIZE,
+            "block_size_fact": 1,
+            "num_chan": 1,
+            "audiocod_type": jamulus.AUDIO_CODEC_OPUS64,
+        }
+    else:
+        props = {
+            "base_netw_size": (
+                ENCODED_BASE_NETW_SIZE if audio == "encoded" else jamulus.SYSTEM_FRAME_SIZE_SAMPLES * PCM_NUM_CHAN * 2
+            ),
+            "block_size_fact": PCM_BLOCK_SIZE_FACT,
+            "num_chan": PCM_NUM_CHAN,
+            "audiocod_type": jamulus.AUDIO_CODEC_OPUS64 if audio == "encoded" else jamulus.AUDIO_CODEC_NONE,
+        }
+    props.update({"sam_rate": jamulus.SYSTEM_SAMPLE_RATE, "flags": jamulus.SEQUENCE_NUMBER_FLAG, "audiocod_arg": 0})
+    return props
+
+
+class SimulatedClient:
+    def __init__(self, number, server, frame_rate, ping_interval, audio="silence"):
+        self.number = number
+        self.server = server
+        self.frame_period = 1 / frame_rate
+        self.ping_interval = ping_interval
+        self.audio_type = audio
+
+        # own socket on an ephemeral port
+        self.jc = jamulus.JamulusConnector(port=0, log=False)
+        self.jc.sock.setblocking(False)
+        self.local_port = self.jc.sock.getsockname()[1]
+
+        # only handle messages coming from the server
+        self.dispatcher = jamulus.Dispatcher(self.jc)
+        self.dispatcher.add_handler("AUDIO", self.audio, addr=server)
+        self.dispatcher.add_handler("CLM_PING_MS_WITHNUMCLIENTS", self.ping, addr=server)
+        self.dispatcher.add_handler("REQ_SPLIT_MESS_SUPPORT", self.split_mess_support, addr=server)
+        self.dispatcher.add_handler("REQ_NETW_TRANSPORT_PROPS", self.netw_transport_props, addr=server)
+        self.dispatcher.add_handler("REQ_JITT_BUF_SIZE", self.jitt_buf_size, addr=server)
+        self.dispatcher.add_handler("REQ_CHANNEL_INFOS", self.channel_infos, addr=server)
+        self.dispatcher.add_handler("CLM_DISCONNECTION", self.disconnection, addr=server)
+        self.dispatcher.add_handler("CLM_CHANNEL_LEVEL_LIST", self.channel_level_list, addr=server)
+
+        # encoded audio is encoded for every packet sent and decoded for every packet played
+        self.transport_props = transport_props(audio)
+        self.codec = jamulus.AudioCodec(self.transport_props) if audio == "encoded" else None
+        self.audio_data = jamulus.silent_audio(BASE_NETW_SIZE)["data"] if audio == "silence" else pcm_audio(number)
+        self.handshake = set()
+        self.time_started = monotonic()
+        self.now = self.time_started
+        self.time_connected = None
+        self.next_audio = self.time_started
+        self.next_ping = self.time_started
+
+        # frames carry a trailing sequence number, received frames are played from a jitter buffer
+        self.sequence = 0
+        self.jitter_buffer = jamulus.JitterBuffer(jamulus.AUTO_JITT_BUF_SIZE, self.frame_period)
+
+        self.audio_sent = 0
+        self.audio_received = 0
+        self.pings_sent = 0
+        self.rtts = []
+        self.level_updates = 0
+
+    def close(self):
+        self.jc.close()
+
+    def send_audio(self, now):
+        data = self.audio_data if self.codec is None else self.codec.encode(self.audio_data)
+        self.jc.sendto(self.server, "AUDIO", {"data": data + bytes((self.sequence,))})
+        self.sequence = (self.sequence + 1) & 0xFF
+        self.audio_sent += 1
+
+        # play a frame on the same clock
+        data = self.jitter_buffer.get()
+        if self.codec is not None:
+            self.codec.decode(data)
+        self.next_audio += self.frame_period
+
+        # do not try to catch up on frames after a stall
+        if self.next_audio < now:
+            self.next_audio = now + self.frame_period
+
+    def send_ping(self, now):
+        time_ms = int(now * 1000) & 0xFFFFFFFF
+        self.jc.sendto(self.server, "CLM_PING_MS_WITHNUMCLIENTS", {"time": time_ms, "clients": 0})
+        self.pings_sent += 1
+        self.next_ping = now + self.ping_interval
+
+    def receive(self, now):
+        self.now = now
+        self.dispatcher.recv(timeout=0)
+
+    def audio(self, addr, key, count, values):
+        self.audio_received += 1
+        data = values["data"]
+        self.jitter_buffer.put(data[:-1], data[-1], self.now)
+
+    def ping(self, addr, key, count, values):
+        rtt_ms = ((int(self.now * 1000) & 0xFFFFFFFF) - values["time"]) & 0xFFFFFFFF
+        self.rtts.append(rtt_ms)
+
+    def split_mess_support(self, addr, key, count, values):
+        self.jc.sendto(addr, "SPLIT_MESS_SUPPORTED")
+
+    def netw_transport_props(self, addr, key, count, values):
+        self.jc.sendto(addr, "NETW_TRANSPORT_PROPS", self.transport_props)
+        self.handshake_step(key)
+
+    def jitt_buf_size(self, addr, key, count, values):
+        self.jc.sendto(addr, "JITT_BUF_SIZE", {"blocks": JITT_BUF_SIZE})
+        self.handshake_step(key)
+
+    def channel_infos(self, addr, key, count, values):
+        self.jc.sendto(
+            addr,
+            "CHANNEL_INFOS",
+            {
+                "country": 0,
+                "instrument": 0,
+                "skill": 0,
+                "name": "Load {}".format(self.number),
+                "city": "",
+            },
+        )
+        if self.audio_type != "silence":
+            # subscribe to the channel levels of the mix
+            self.jc.sendto(addr, "REQ_CHANNEL_LEVEL_LIST", {"data": 1})
+        self.handshake_step(key)
+
+    def channel_level_list(self, addr, key, count, values):
+        self.level_updates += 1
+
+    def disconnection(self, addr, key, count, values):
+        self.handshake.clear()
+
+    def handshake_step(self, key):
+        self.handshake.add(key)
+        if self.time_connected is None and len(self.handshake) == 3:
+            self.time_connected = self.now
+
+    def disconnect(self):
+        self.jc.sendto(self.server, "CLM_DISCONNECTION")
+
+    def stats(self):
+        jitter_buffer = self.jitter_buffer.stats()
+        return {
+            "client": self.number,
+            "port": self.local_port,
+            "connect_ms": (self.time_connected - self.time_started) * 1000 if self.time_connected else None,
+            "audio_sent": self.audio_sent,
+            "audio_received": self.audio_received,
+            "loss": 1 - self.audio_received / self.audio_sent if self.audio_sent > 0 else 0.0,
+            "jitter_ms": jitter_buffer["jitter_ms"],
+            "buffer_size": jitter_buffer["size"],
+            "underruns": jitter_buffer["underruns"],
+            "late": jitter_buffer["late"],
+            "pings_sent": self.pings_sent,
+            "rtt_ms": statistics.median(self.rtts) if len(self.rtts) > 0 else None,
+            "rtt_max_ms": max(self.rtts) if len(self.rtts) > 0 else None,
+            "level_updates": self.level_updates,
+        }
+
+
+def run_clients(server, numbers, frame_rate, ping_interval, duration, audio="silence"):
+    """
+    Run a group of simulated clients in the current process
+
+    Parameters
+    ----------
+    server : tuple(str, int)
+        host/port of the server
+    numbers : list(int)
+        client numbers to simulate
+    frame_rate : float
+        audio frames per second and client
+    ping_interval : float
+        seconds between ping messages
+    duration : float
+        seconds to run
+    audio : str
+        audio to send ("silence" = Opus silence, "pcm" = raw PCM tone, "encoded" = encoded tone)
+
+    Returns
+    -------
+    list(dict)
+        per client statistics
+    """
+    selector = selectors.DefaultSelector()
+    clients = []
+    for number in numbers:
+        client = SimulatedClient(number, server, frame_rate, ping_interval, audio)
+        selector.register(client.jc.sock, selectors.EVENT_READ, client)
+        clients.append(client)
+
+    time_end = monotonic() + duration
+    cpu_start = process_time()
+    try:
+        while True:
+            now = monotonic()
+            if now >= time_end:
+                break
+
+            # send everything that is due
+            for client in clients:
+                if client.next_audio <= now:
+                    client.send_audio(now)
+                if client.next_ping <= now:
+                    client.send_ping(now)
+
+            next_action = min(min(c.next_audio, c.next_ping) for c in clients)
+            timeout = max(0, min(next_action, time_end) - monotonic())
+
+            for selector_key, events in selector.select(timeout):
+                client = selector_key.data
+                try:
+                    client.receive(monotonic())
+                except (BlockingIOError, TimeoutError):
+                    pass
+    finally:
+        for client in clients:
+            client.disconnect()
+            selector.unregister(client.jc.sock)
+            client.close()
+        selector.close()
+
+    # cpu time of this process shared by its clients
+    cpu_percent = (process_time() - cpu_start) / duration / max(1, len(clients)) * 100
+    return [dict(client.stats(), cpu_percent=cpu_percent) for client in clients]
+
+
+def run_worker(params):
+    # ignore SIGINT in workers, the parent process terminates the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    return run_clients(**params)
+
+
+def format_stats(stats):
+    def fmt(value, format="{:.1f}"):
+        return "-" if value is None else format.format(value)
+
+    return "{:>5} {:>5} {:>9} {:>7} {:>7} {:>6}% {:>7} {:>4} {:>6} {:>6} {:>7} {:>7}".format(
+        stats["client"],
+        stats["port"],
+        fmt(stats["connect_ms"]),
+        stats["audio_sent"],
+        stats["audio_received"],
+        fmt(stats["loss"] * 100),
+        fmt(stats["jitter_ms"], "{:.2f}"),
+        stats["buffer_size"],
+        stats["underruns"],
+        stats["late"],
+        fmt(stats["rtt_ms"]),
+        fmt(stats["rtt_max_ms"]),
+    )
+
+
+def print_report(all_stats):
+    print(
+        "{:>5} {:>5} {:>9} {:>7} {:>7} {:>7} {:>7} {:>4} {:>6} {:>6} {:>7} {:>7}".format(
+            "#", "port", "conn ms", "sent", "recv", "loss", "jit ms", "buf", "under", "late", "rtt ms", "rtt max"
+        )
+    )
+    for stats in sorted(all_stats, key=lambda s: s["client"]):
+        print(format_stats(stats))
+
+    connected = [s for s in all_stats if s["connect_ms"] is not None]
+    rtts = [s["rtt_ms"] for s in all_stats if s["rtt_ms"] is not None]
+    sent = sum(s["audio_sent"] for s in all_stats)
+    received = sum(s["audio_received"] for s in all_stats)
+    print(
+        "{}/{} clients connected, audio loss {:.1f}%, mean jitter {:.2f} ms, {} buffer underruns, "
+        "median rtt {} ms, {} level updates, {:.2f}% cpu per client".format(
+            len(connected),
+            len(all_stats),
+            (1 - received / sent) * 100 if sent > 0 else 0.0,
+            statistics.mean(s["jitter_ms"] for s in all_stats) if len(all_stats) > 0 else 0.0,
+            sum(s["underruns"] for s in all_stats),
+            statistics.median(rtts) if len(rtts) > 0 else "-",
+            sum(s["level_updates"] for s in all_stats),
+            statistics.mean(s["cpu_percent"] for s in all_stats) if len(all_stats) > 0 else 0.0,
+        )
+    )
+
+
+def argument_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--server",
+        type=jamulus.server_argument,
+        required=True,
+        help="server to connect to",
+    )
+    parser.add_argument("--clients", type=int, default=DEFAULT_CLIENTS, help="number of simulated clients")
+    parser.add_argument("--processes", type=int, default=1, help="number of worker processes")
+    parser.add_argument(
+        "--frame-rate",
+        type=float,
+        default=DEFAULT_FRAME_RATE,
+        help="audio frames per second and client",
+    )
+    parser.add_argument(
+        "--ping-interval",
+        type=float,
+        default=DEFAULT_PING_INTERVAL,
+        help="seconds between ping messages",
+    )
+    parser.add_argument("--duration", type=float, default=DEFAULT_DURATION, help="seconds to run")
+    audio = parser.add_mutually_exclusive_group()
+    audio.add_argument(
+        "--pcm",
+        action="store_const",
+        const="pcm",
+        dest="audio",
+        default="silence",
+        help="send raw PCM audio (for servers that mix audio)",
+    )
+    audio.add_argument(
+        "--encode",
+        action="store_const",
+        const="encoded",
+        dest="audio",
+        help="encode / decode audio with Opus (stand-in codec without libopus)",
+    )
+
+    return parser.parse_args()
+
+
+def main():
+    args = argument_parser()
+
+    # distribute clients evenly across the worker processes
+    processes = max(1, min(args.processes, args.clients))
+    params = [
+        {
+            "server": args.server,
+            "numbers": list(range(i, args.clients, processes)),
+            "frame_rate": args.frame_rate,
+            "ping_interval": args.ping_interval,
+            "duration": args.duration,
+            "audio": args.audio,
+        }
+        for i in range(processes)
+    ]
+
+    print("starting {} clients in {} process(es) for {}s".format(args.clients, processes, args.duration))
+
+    if processes == 1:
+        all_stats = run_clients(**params[0])
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            all_stats = [s for stats in pool.map(run_worker, params) for s in stats]
+
+    print_report(all_stats)
+
+
+def signal_handler(sig, frame):
+    print()
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    signal.signal(signal.SIGINT, signal_handler)
+    main()
@@ -0,0 +1,261 @@
+#!/usr/bin/python3
+
+import jamulus
+
+import argparse
+import signal
+import socket
+import statistics
+import sys
+
+from time import monotonic
+
+
+DEFAULT_RATE = 1000
+DEFAULT_TIMEOUT = 2
+DEFAULT_RETRIES = 1
+LIST_QUIET_TIME = 0.5  # seconds without further server lists after which the list is complete
+RECV_BUFFER_SIZE = 4 * 1024 * 1024  # replies of thousands of servers arrive within a short time
+
+
+class ScanResult:
+    # replies of a single server
+    __slots__ = ("server", "ping_time", "ping_sent", "pings", "rtt", "clients", "version", "os", "names")
+
+    def __init__(self, server):
+        self.server = server
+        self.ping_time = None
+        self.ping_sent = None
+        self.pings = 0
+        self.rtt = None
+        self.clients = None
+        self.version = None
+        self.os = None
+        self.names = None
+
+    def __str__(self):
+        server = self.server
+        return "{:>21} {:<20} {:>8} {:>3}/{:>3} {:<16} {}".format(
+            "{}:{}".format(server["ip"], server["port"]),
+            server["name"][:20],
+            "-" if self.rtt is None else "{:.1f}ms".format(self.rtt * 1000),
+            "?" if self.clients is None else self.clients,
+            server["max_clients"],
+            "?" if self.version is None else self.version[:16],
+            "" if self.os is None else jamulus.OS_KEYS.get(self.os, "?"),
+        )
+
+
+class ServerScanner:
+    def __init__(self, jc, timeout):
+        self.jc = jc
+        self.timeout = timeout
+        self.servers = []
+        # (ip, port) -> ScanResult
+        self.results = {}
+        self.unexpected = 0
+        self.send_errors = 0
+
+        # requests without values are the same for every server
+        self.version_frame = jc.main_pack("CLM_REQ_VERSION_AND_OS", {}, 0)
+        self.clients_frame = jc.main_pack("CLM_REQ_CONN_CLIENTS_LIST", {}, 0)
+
+        # only the replies are decoded
+        self.dispatcher = jamulus.Dispatcher(jc, ackn=False)
+        self.dispatcher.add_handler("CLM_PING_MS_WITHNUMCLIENTS", self.ping)
+        self.dispatcher.add_handler("CLM_VERSION_AND_OS", self.version_and_os)
+        self.dispatcher.add_handler("CLM_CONN_CLIENTS_LIST", self.conn_clients_list)
+        # older servers answer with the connection message
+        self.dispatcher.add_handler("CONN_CLIENTS_LIST", self.conn_clients_list)
+
+    def server_list(self, addr, key, count, values):
+        for server in values:
+            if server["ip"] == "0.0.0.0":
+                # directory servers first (own) entry
+                server["ip"], server["port"] = addr
+            key = (server["ip"], server["port"])
+            if key not in self.results:
+                self.results[key] = ScanResult(server)
+                self.servers.append(key)
+        self.list_received = monotonic()
+
+    def ping(self, addr, key, count, values):
+        result = self.results.get(addr)
+        if result is None or result.ping_time != values["time"]:
+            # not a reply to our last ping
+            self.unexpected += 1
+            return
+        if result.rtt is None:
+            result.rtt = monotonic() - result.ping_sent
+            result.clients = values["clients"]
+
+    def version_and_os(self, addr, key, count, values):
+        result = self.results.get(addr)
+        if result is None:
+            self.unexpected += 1
+            return
+        result.version = values["version"]
+        result.os = values["os"]
+
+    def conn_clients_list(self, addr, key, count, values):
+        result = self.results.get(addr)
+        if result is None:
+            self.unexpected += 1
+            return
+        result.names = [client["name"] for client in values]
+
+    def receive(self, time_end):
+        # dispatch replies until the given time
+        while True:
+            timeout = time_end - monotonic()
+            if timeout <= 0:
+                return
+            try:
+                self.dispatcher.recv(timeout)
+            except TimeoutError:
+                return
+            except ValueError:
+                # replies that can't be decoded
+                self.unexpected += 1
+
+    def fetch_servers(self, directory):
+        # request the server list, directories may send it in multiple messages
+        self.list_received = None
+        self.dispatcher.add_handler("CLM_SERVER_LIST", self.server_list, addr=directory)
+        self.jc.sendto(directory, "CLM_REQ_SERVER_LIST")
+        time_end = monotonic() + self.timeout
+        while True:
+            if self.list_received is not None:
+                time_end = self.list_received + LIST_QUIET_TIME
+            timeout = time_end - monotonic()
+            if timeout <= 0:
+                break
+            try:
+                self.dispatcher.recv(timeout)
+            except TimeoutError:
+                pass
+            except ValueError:
+                self.unexpected += 1
+        self.dispatcher.remove_handler("CLM_SERVER_LIST", addr=directory)
+        return self.list_received is not None
+
+    def send_ping(self, result):
+        result.ping_time = int(monotonic() * 1000) & 0xFFFFFFFF
+        result.ping_sent = monotonic()
+        result.pings += 1
+        addr = (result.server["ip"], result.server["port"])
+        self.jc.sendto(addr, "CLM_PING_MS_WITHNUMCLIENTS", {"time": result.ping_time, "clients": 0})
+
+    def scan(self, rate, retries):
+        # send requests at a fixed rate, receiving replies in between
+        pending = [self.results[key] for key in self.servers]
+        for attempt in range(1 + retries):
+            period = 1 / rate
+            next_send = monotonic()
+            for result in pending:
+                self.receive(next_send)
+                addr = (result.server["ip"], result.server["port"])
+                try:
+                    self.send_ping(result)
+                    if attempt == 0:
+                        self.jc.send_data(addr, "CLM_REQ_VERSION_AND_OS", self.version_frame, count=0)
+                        self.jc.send_data(addr, "CLM_REQ_CONN_CLIENTS_LIST", self.clients_frame, count=0)
+                except OSError:
+                    # unreachable servers, full send buffer
+                    self.send_errors += 1
+                next_send = max(next_send + period, monotonic() - period)
+
+            # wait for outstanding replies, then retry servers that did not answer the ping
+            self.receive(monotonic() + self.timeout)
+            pending = [result for result in pending if result.rtt is None]
+            if len(pending) == 0:
+                break
+
+    def report(self, duration):
+        results = [self.results[key] for key in self.servers]
+        results.sort(key=lambda result: (result.rtt is None, result.rtt or 0))
+        for result in results:
+            print(result)
+
+        rtts = [result.rtt for result in results if result.rtt is not None]
+        output = "{} servers scanned in {:.1f}s, {} answered pings, {} versions, {} client lists".format(
+            len(results),
+            duration,
+            len(rtts),
+            sum(result.version is not None for result in results),
+            sum(result.names is not None for result in results),
+        )
+        if len(rtts) > 1:
+            percentiles = statistics.quantiles(rtts, n=10, method="inclusive")
+            output += ", rtt ms p50 {:.1f} p90 {:.1f} max {:.1f}".format(
+                statistics.median(rtts) * 1000,
+                percentiles[8] * 1000,
+                max(rtts) * 1000,
+            )
+        clients = sum(result.clients for result in results if result.clients is not None)
+        output += ", {} clients connected".format(clients)
+        print(output)
+        if self.unexpected > 0:
+            print("{} unexpected or invalid replies".format(self.unexpected))
+        if self.send_errors > 0:
+            print("{} servers could not be sent to".format(self.send_errors))
+
+
+def argument_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=0, help="local port number (0 = any)")
+    parser.add_argument(
+        "--directory",
+        type=jamulus.server_argument,
+        required=True,
+        action="extend",
+        nargs="+",
+        help="directories (central servers) to get the server lists from",
+    )
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE, help="servers queried per second")
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=DEFAULT_TIMEOUT,
+        help="seconds to wait for outstanding replies",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=DEFAULT_RETRIES,
+        help="number of pings resent to servers that did not answer",
+    )
+    parser.add_argument(
+        "--log-data",
+        action="store_true",
+        help="log protocol data",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = argument_parser()
+
+    jc = jamulus.JamulusConnector(port=args.port, log=args.log_data, log_data=args.log_data)
+    jc.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER_SIZE)
+    scanner = ServerScanner(jc, args.timeout)
+
+    time_start = monotonic()
+    for directory in args.directory:
+        if not scanner.fetch_servers(directory):
+            print("no server list received from {}".format(directory))
+    print("scanning {} servers at {} servers/s".format(len(scanner.servers), args.rate))
+
+    scanner.scan(args.rate, args.retries)
+    scanner.report(monotonic() - time_start)
+    jc.close()
+
+
+def signal_handler(sig, frame):
+    print()
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    signal.signal(signal.SIGINT, signal_handler)
+    main()
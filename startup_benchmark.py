@@ -0,0 +1,122 @@
+#!/usr/bin/python3
+
+import argparse
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+
+from time import perf_counter
+
+
+DEFAULT_RUNS = 20
+DEFAULT_TIMEOUT = 5
+BUFFER_SIZE = 20000
+
+# a short-lived probe: import the library, create a socket and send a single ping
+PROBE = """
+from time import perf_counter
+start = perf_counter()
+import jamulus
+imported = perf_counter()
+jc = jamulus.JamulusConnector(port=0, log=False)
+jc.sendto(("127.0.0.1", {port}), "CLM_PING_MS", {{"time": 0}})
+sent = perf_counter()
+print(imported - start, sent - imported)
+"""
+
+
+def format_times(name, times):
+    output = "{:<24}".format(name)
+    if len(times) > 1:
+        percentiles = statistics.quantiles(times, n=10, method="inclusive")
+        output += " ms p50 {:6.2f} p90 {:6.2f} max {:6.2f}".format(
+            statistics.median(times) * 1000,
+            percentiles[8] * 1000,
+            max(times) * 1000,
+        )
+    return output
+
+
+def run_interpreter(python):
+    # seconds to start and exit the interpreter without the library
+    start = perf_counter()
+    subprocess.run([python, "-c", "pass"], check=True)
+    return perf_counter() - start
+
+
+def run_probe(python, code, sock, timeout):
+    # seconds from spawning the probe to receiving its packet (None = lost), probe output
+    start = perf_counter()
+    process = subprocess.Popen(
+        [python, "-c", code],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    received = None
+    try:
+        sock.recvfrom(BUFFER_SIZE)
+        received = perf_counter() - start
+    except socket.timeout:
+        print("no packet received from probe")
+    output, _ = process.communicate(timeout=timeout)
+    if process.returncode != 0:
+        raise RuntimeError("probe failed with exit code {}".format(process.returncode))
+    return received, output
+
+
+def argument_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS, help="number of probe processes to start")
+    parser.add_argument("--python", default=sys.executable, help="python interpreter to run the probes with")
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=DEFAULT_TIMEOUT,
+        help="seconds to wait for the packet of a probe",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = argument_parser()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    sock.settimeout(args.timeout)
+    probe = PROBE.format(port=sock.getsockname()[1])
+
+    interpreter = []
+    imports = []
+    first_packet_sends = []
+    first_packets = []
+    for run in range(args.runs):
+        # interpreter startup without the library for reference
+        interpreter.append(run_interpreter(args.python))
+
+        received, output = run_probe(args.python, probe, sock, args.timeout)
+        import_time, send_time = map(float, output.split())
+        imports.append(import_time)
+        first_packet_sends.append(send_time)
+        if received is not None:
+            first_packets.append(received)
+
+    print("{} runs".format(args.runs))
+    print(format_times("interpreter startup", interpreter))
+    print(format_times("import jamulus", imports))
+    print(format_times("import to first packet", first_packet_sends))
+    print(format_times("spawn to first packet", first_packets))
+    sock.close()
+
+
+def signal_handler(sig, frame):
+    print()
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    signal.signal(signal.SIGINT, signal_handler)
+    main()
@@ -1,8 +1,49 @@
 #!/usr/bin/python3
 
+import socket
+import struct
+import time
 import unittest
 
-from jamulus import JamulusConnector
+import fuzz_decoder
+
+from jamulus import (
+    FORMAT,
+    MAX_GAIN,
+    MAX_PAN,
+    PROT,
+    DecodeError,
+    Dispatcher,
+    AUDIO_CODEC_NONE,
+    AUDIO_CODEC_OPUS64,
+    AUTO_JITT_BUF_SIZE,
+    AudioCodec,
+    ConnectorGroup,
+    JamulusConnector,
+    JitterBuffer,
+    LevelMeter,
+    Message,
+    Metrics,
+    Mixer,
+    OpusCodec,
+    OverloadPolicy,
+    PingResponder,
+    Profiler,
+    RateLimiter,
+    Resolver,
+    ServerAddress,
+    SessionTable,
+    StandInCodec,
+    codec,
+    normalize_address,
+    reduced_server,
+    server_argument,
+)
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 class Test_JamulusConnector(unittest.TestCase):
@@ -16,6 +57,26 @@ class Test_JamulusConnector(unittest.TestCase):
         crc = self.jc.calc_crc(bytearray.fromhex("0000ef03000000"))
         self.assertEqual(crc, 51992)
 
+    def test_calc_crc_reference(self):
+        # bit by bit implementation as in Jamulus
+        def reference_crc(data):
+            crc = 0xFFFF
+            for b in data:
+                for i in range(8):
+                    crc <<= 1
+                    if crc & 0x10000:
+                        crc |= 1
+                    if b & (1 << (7 - i)):
+                        crc ^= 1
+                    if crc & 1:
+                        crc ^= 0x1020
+                    crc &= 0xFFFF
+            return ~crc & 0xFFFF
+
+        for length in range(40):
+            data = bytes((n * 37 + length) & 0xFF for n in range(length))
+            self.assertEqual(self.jc.calc_crc(data), reference_crc(data))
+
     def test_pack(self):
         data = self.jc.pack((("a", "L"), ("b", "H"), ("c", "B")), {"a": 1, "b": 2, "c": 3})
         self.assertEqual(data.hex(), "01000000020003")
@@ -45,6 +106,14 @@ class Test_JamulusConnector(unittest.TestCase):
             # value with wrong type
             data = self.jc.pack((("a", "L"),), {"a": "string"})
 
+        with self.assertRaises(ValueError):
+            # unknown format character
+            data = self.jc.pack((("a", "?!"),), {"a": 1})
+
+        with self.assertRaises(ValueError):
+            # data that is not bytes
+            data = self.jc.pack((("data", "v"),), {"data": "string"})
+
     def test_unpack(self):
         data = (
             bytearray.fromhex("01000000020003")  # {"a": 1, "b": 2, "c": 3}
@@ -72,6 +141,24 @@ class Test_JamulusConnector(unittest.TestCase):
 
         self.assertEqual(offset, len(data))
 
+    def test_unpack_failing(self):
+        with self.assertRaises(DecodeError):
+            # string longer than the data
+            self.jc.unpack((("text", "U"),), bytearray.fromhex("0478797a"))
+
+        with self.assertRaises(DecodeError):
+            # fixed size value longer than the data
+            self.jc.unpack((("a", "L"),), bytearray.fromhex("010000"))
+
+    def test_lazy_tables(self):
+        import jamulus
+
+        self.assertEqual(jamulus.COUNTRY_KEYS[82], "Germany")
+        self.assertIs(jamulus.COUNTRY_KEYS, jamulus.COUNTRY_KEYS)
+        self.assertIn("INSTRUMENT_KEYS", dir(jamulus))
+        with self.assertRaises(AttributeError):
+            jamulus.UNKNOWN_KEYS
+
     def test_prot_pack(self):
         data = self.jc.prot_pack((("a", "B"), ("b", "B"), ("c", "B")), {"a": 1, "b": 2, "c": 3})
         self.assertEqual(data.hex(), "010203")
@@ -86,6 +173,37 @@ class Test_JamulusConnector(unittest.TestCase):
         values = self.jc.prot_unpack((("a", "B"), ("b", "B"), ("c", "B")), bytearray.fromhex("010203040506"), repeat=True)
         self.assertEqual(values, [{"a": 1, "b": 2, "c": 3}, {"a": 4, "b": 5, "c": 6}])
 
+    def test_iter_pack(self):
+        format = (("a", "B"), ("b", "B"))
+        values = iter([{"a": 1, "b": 2}, {"a": 3, "b": 4}, {"a": 5, "b": 6}])
+        data, count, remaining = self.jc.iter_pack(format, values, 5)
+        self.assertEqual(data.hex(), "01020304")
+        self.assertEqual(count, 2)
+        self.assertEqual(list(remaining), [{"a": 5, "b": 6}])
+
+        with self.assertRaises(ValueError):
+            # single data set too large
+            self.jc.iter_pack(format, [{"a": 1, "b": 2}], 1)
+
+    def test_iter_unpack(self):
+        records = list(self.jc.iter_unpack((("a", "B"), ("text", "U")), bytearray.fromhex("010178020179")))
+        self.assertEqual(records, [(0, {"a": 1, "text": "x"}), (3, {"a": 2, "text": "y"})])
+
+    def test_main_pack_pages(self):
+        values = [
+            {"id": i, "country": 0, "instrument": 0, "skill": 0, "zero": 0, "name": "n", "city": ""} for i in range(10)
+        ]
+        pages = list(self.jc.main_pack_pages("CONN_CLIENTS_LIST", values, max_size=60))
+        self.assertEqual([records for data, records in pages], [3, 3, 3, 1])
+
+        decoded = []
+        for count, (data, records) in enumerate(pages):
+            self.assertLessEqual(len(data), 60)
+            key, message_count, page_values = self.jc.main_unpack(data, ackn=False, addr=None)
+            self.assertEqual(message_count, count)
+            decoded += page_values
+        self.assertEqual(decoded, values)
+
     def test_main_pack(self):
         data = self.jc.main_pack("CLM_REQ_SERVER_LIST", values={}, count=0)
         self.assertEqual(data.hex(), "0000ef0300000018cb")
@@ -104,6 +222,770 @@ class Test_JamulusConnector(unittest.TestCase):
         self.assertEqual(count, 0)
         self.assertEqual(values, {"time": 0})
 
+    def test_main_unpack_failing(self):
+        with self.assertRaises(DecodeError) as context:
+            # invalid crc
+            self.jc.main_unpack(bytearray.fromhex("0000ef0300000018cc"), ackn=False, addr=None)
+        self.assertEqual(context.exception.kind, "crc")
+
+        with self.assertRaises(DecodeError) as context:
+            # unknown message ID
+            data = self.jc.pack(FORMAT["MAIN_FRAME"], {"tag": 0, "id": 999, "count": 0, "data": b""})
+            data += self.jc.pack(FORMAT["CRC"], {"crc": self.jc.calc_crc(data)})
+            self.jc.main_unpack(data, ackn=False, addr=None)
+        self.assertEqual(context.exception.kind, "id")
+
+    def test_pack_ipv6(self):
+        # the A format holds IPv4 addresses only
+        with self.assertRaises(ValueError):
+            self.jc.pack(FORMAT["SERVER_IP"], {"ip": "::1"})
+
+
+class Test_Codec(unittest.TestCase):
+    # boundary and typical values per format character
+    SAMPLES = {
+        "B": [0, 1, 255],
+        "H": [0, 0x1234, 0xFFFF],
+        "L": [0, 0x12345678, 0xFFFFFFFF],
+        "A": ["0.0.0.0", "127.0.0.1", "255.255.255.255"],
+        "U": ["", "xyz", "\u00e4" * 127],
+        "V": ["", "Jamulus \u266b", "x" * 1000],
+        "v": [b"", b"\x00\xff", bytes(300)],
+        "z": [b"", b"abc", bytes(range(256))],
+    }
+
+    # values that can't be encoded per format character
+    INVALID = {
+        "B": [256, -1, 1.5, "1"],
+        "H": [0x10000, None],
+        "L": [0x100000000, b"1234"],
+        "A": ["::1", "256.0.0.1", 1],
+        "U": ["\u00e4" * 128, 1],
+        "V": [b"bytes"],
+        "v": ["string", [1, 2]],
+        "z": ["string", memoryview(b"")],
+    }
+
+    def setUp(self):
+        self.jc = JamulusConnector(port=None)
+
+    def assertSameResult(self, expected, actual):
+        try:
+            result = expected()
+        except Exception as error:
+            with self.assertRaises(type(error)) as context:
+                actual()
+            self.assertEqual(str(context.exception), str(error))
+            return
+        self.assertEqual(actual(), result)
+
+    def test_identical(self):
+        for key, prot in PROT.items():
+            format = prot.get("format", ())
+            encode, decode = codec(format)
+            for i in range(3):
+                values = {name: self.SAMPLES[format_char][i] for name, format_char in format}
+                data = self.jc.pack(format, values)
+                self.assertEqual(encode(values), data, key)
+                self.assertEqual(decode(data), self.jc.unpack(format, data), key)
+                prefixed = bytearray(b"\xff" + data)
+                self.assertEqual(decode(prefixed, 1), self.jc.unpack(format, prefixed, 1), key)
+
+    def test_identical_failing(self):
+        for key, prot in PROT.items():
+            format = prot.get("format", ())
+            encode, decode = codec(format)
+            values = {name: self.SAMPLES[format_char][1] for name, format_char in format}
+            for name, format_char in format:
+                # missing and invalid values
+                missing = {k: v for k, v in values.items() if k != name}
+                self.assertSameResult(lambda: self.jc.pack(format, missing), lambda: encode(missing))
+                for value in self.INVALID[format_char]:
+                    invalid = dict(values, **{name: value})
+                    self.assertSameResult(lambda: self.jc.pack(format, invalid), lambda: encode(invalid))
+
+            # truncated and invalid data
+            data = self.jc.pack(format, values)
+            for length in range(len(data)):
+                self.assertSameResult(lambda: self.jc.unpack(format, data[:length]), lambda: decode(data[:length]))
+            for position in range(len(data)):
+                invalid = data[:position] + b"\xff" + data[position + 1 :]
+                self.assertSameResult(lambda: self.jc.unpack(format, invalid), lambda: decode(invalid))
+
+    def test_cached(self):
+        self.assertIs(codec(FORMAT["MAIN_FRAME"]), codec(FORMAT["MAIN_FRAME"]))
+        with self.assertRaises(ValueError):
+            codec((("a", "?!"),))
+
+    def test_modes(self):
+        format = (("a", "B"), ("b", "L"), ("c", "V"))
+        values = {"a": 1, "b": 2, "c": "xyz"}
+        for mode in ["<", ">", "@"]:
+            encode, decode = codec(format, mode)
+            data = self.jc.pack(format, values, mode)
+            self.assertEqual(encode(values), data)
+            self.assertEqual(decode(data), self.jc.unpack(format, data, 0, mode))
+
+
+class Test_Fuzz(unittest.TestCase):
+    def test_obsolete_id(self):
+        # IDs without a protocol format (PING_MS)
+        jc = JamulusConnector(port=None, log=False)
+        data = bytearray.fromhex("000013000000000000")
+        data[-2:] = jc.calc_crc(data[:-2]).to_bytes(2, "little")
+        with self.assertRaises(DecodeError):
+            jc.main_unpack(bytes(data), False, None)
+        with self.assertRaises(DecodeError):
+            Message(jc, bytes(data))
+        self.assertEqual(jc.decode(bytes(data), ("127.0.0.1", 1), ackn=False)[0], "INVALID")
+        self.assertEqual(jc.decode(bytes(data), ("127.0.0.1", 1), ackn=False, payload=False)[0], "PING_MS")
+
+    def test_fuzz(self):
+        fuzzer = fuzz_decoder.Fuzzer(seed=0)
+        fuzzer.run(5000)
+        self.assertEqual(fuzzer.failures, [])
+
+    def test_round_trip(self):
+        fuzzer = fuzz_decoder.Fuzzer(seed=0)
+        fuzzer.round_trip(rounds=10)
+        self.assertEqual(fuzzer.failures, [])
+
+
+class Test_Addresses(unittest.TestCase):
+    def test_normalize_address(self):
+        self.assertEqual(normalize_address(("::ffff:127.0.0.1", 1, 0, 0)), ("127.0.0.1", 1))
+        self.assertEqual(normalize_address(("::1", 1, 0, 0)), ("::1", 1))
+        self.assertEqual(normalize_address(("127.0.0.1", 1)), ("127.0.0.1", 1))
+
+    def test_server_argument(self):
+        self.assertEqual(server_argument("127.0.0.1"), ("127.0.0.1", 22124))
+        self.assertEqual(server_argument("127.0.0.1:1234"), ("127.0.0.1", 1234))
+        self.assertEqual(server_argument("[::1]:1234"), ("::1", 1234))
+        self.assertEqual(server_argument("::1"), ("::1", 22124))
+        self.assertEqual(server_argument("localhost:1234").host, "localhost")
+        with self.assertRaises(ValueError):
+            server_argument("[::1]1234")
+
+    @unittest.skipUnless(socket.has_ipv6, "requires IPv6")
+    def test_dual_stack(self):
+        jc = JamulusConnector(host="", port=0, log=False)
+        if jc.family != socket.AF_INET6:
+            jc.close()
+            self.skipTest("IPv6 is not available")
+
+        # IPv4 peer seen with its IPv4 address
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(("127.0.0.1", 0))
+        jc.sendto(sock.getsockname(), "CLM_PING_MS", {"time": 1})
+        data, addr = sock.recvfrom(100)
+        sock.sendto(data, ("127.0.0.1", jc.sock.getsockname()[1]))
+        self.assertEqual(jc.recvfrom(timeout=1), (sock.getsockname(), "CLM_PING_MS", 0, {"time": 1}))
+        sock.close()
+        jc.close()
+
+
+class Test_ConnectorGroup(unittest.TestCase):
+    def setUp(self):
+        self.connectors = [JamulusConnector(host="127.0.0.1", port=0, log=False) for n in range(2)]
+        self.group = ConnectorGroup(self.connectors)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+
+    def tearDown(self):
+        self.group.close()
+        self.sock.close()
+        for jc in self.connectors:
+            jc.close()
+
+    def send(self, jc, time):
+        self.sock.sendto(jc.main_pack("CLM_PING_MS", {"time": time}, 0), jc.sock.getsockname())
+
+    def test_fair(self):
+        # a busy socket doesn't starve the other one
+        for time in range(3):
+            self.send(self.connectors[0], time)
+        self.send(self.connectors[1], 10)
+        received = [self.group.recvfrom(timeout=1) for n in range(4)]
+        self.assertEqual({jc for jc, addr, key, count, values in received[:2]}, set(self.connectors))
+        with self.assertRaises(TimeoutError):
+            self.group.recv_data(timeout=0.05)
+
+    def test_dispatch(self):
+        received = []
+        dispatcher = Dispatcher(self.connectors[1])
+        dispatcher.add_handler("CLM_PING_MS", lambda addr, key, count, values: received.append(values))
+        self.group.remove(self.connectors[1])
+        self.group.add(self.connectors[1], dispatcher, rcvbuf=65536)
+        self.assertEqual(len(self.group), 2)
+        self.send(self.connectors[1], 5)
+        self.assertTrue(self.group.recv(timeout=1))
+        self.assertEqual(received, [{"time": 5}])
+        self.assertGreaterEqual(self.connectors[1].set_buffer_sizes()[0], 65536)
+
+
+class Test_FrameCache(unittest.TestCase):
+    def setUp(self):
+        self.jc = JamulusConnector(port=None, frame_cache_size=2)
+        self.uncached = JamulusConnector(port=None, frame_cache_size=0)
+
+    def test_cached(self):
+        frame = self.jc.main_pack("CLM_REGISTER_SERVER_RESP", {"status": 0}, 0)
+        self.assertIs(self.jc.main_pack("CLM_REGISTER_SERVER_RESP", {"status": 0}, 0), frame)
+        self.assertEqual(self.jc.frame_cache.hits, 1)
+        self.assertNotEqual(self.jc.main_pack("CLM_REGISTER_SERVER_RESP", {"status": 1}, 0), frame)
+
+    def test_count_patched(self):
+        self.jc.main_pack("REQ_CHANNEL_LEVEL_LIST", {"data": 1}, 0)
+        for count in [1, 255, 128, 0, 7]:
+            frame = self.jc.main_pack("REQ_CHANNEL_LEVEL_LIST", {"data": 1}, count)
+            self.assertEqual(frame, self.uncached.main_pack("REQ_CHANNEL_LEVEL_LIST", {"data": 1}, count))
+        self.assertEqual(self.jc.frame_cache.hits, 5)
+
+    def test_bounded(self):
+        for key in ["CLM_DISCONNECTION", "CLM_EMPTY_MESSAGE", "CLM_REQ_SERVER_LIST"]:
+            self.jc.main_pack(key, None, 0)
+        self.assertEqual(len(self.jc.frame_cache), 2)
+        self.assertIsNone(self.jc.frame_cache.get("CLM_DISCONNECTION", None, 0))
+
+    def test_not_cached(self):
+        self.jc.main_pack("CLM_PING_MS", {"time": 1}, 0)
+        self.jc.main_pack("CONN_CLIENTS_LIST", [], 0)
+        self.jc.main_pack("CHAT_TEXT", {"string": "not cached"}, 0)
+        self.jc.main_pack("JITT_BUF_SIZE", {"blocks": 10}, 0)
+        self.assertEqual(len(self.jc.frame_cache), 0)
+
+    def test_same_errors(self):
+        # equal values of other types are encoded (and fail) as without cache
+        self.jc.main_pack("CLM_REGISTER_SERVER_RESP", {"status": 1}, 0)
+        for values in [{"status": 1.0}, {"status": True}, {"status": 256}, {}]:
+            try:
+                expected = self.uncached.main_pack("CLM_REGISTER_SERVER_RESP", values, 0)
+            except ValueError as error:
+                with self.assertRaises(ValueError) as context:
+                    self.jc.main_pack("CLM_REGISTER_SERVER_RESP", values, 0)
+                self.assertEqual(str(context.exception), str(error))
+            else:
+                self.assertEqual(self.jc.main_pack("CLM_REGISTER_SERVER_RESP", values, 0), expected)
+
+
+class Test_OverloadPolicy(unittest.TestCase):
+    def setUp(self):
+        self.jc = JamulusConnector(host="127.0.0.1", port=0, log=False, rcvbuf=4096)
+        self.policy = OverloadPolicy(self.jc, hold=10)
+        if not self.policy.supported:
+            self.jc.close()
+            self.skipTest("overload detection is not supported")
+        self.addr = ("127.0.0.1", 1)
+
+    def tearDown(self):
+        self.jc.close()
+
+    def test_delay(self):
+        self.jc.recv_timestamp = time.time() - 0.05
+        self.assertFalse(self.policy(self.addr, "AUDIO"))
+        self.assertTrue(self.policy(self.addr, "CLM_REQ_SERVER_LIST"))
+        self.jc.recv_timestamp = time.time() - 1
+        self.assertFalse(self.policy(self.addr, "CLM_REQ_SERVER_LIST"))
+        self.assertTrue(self.policy(self.addr, "CLM_REGISTER_SERVER_EX"))
+        self.jc.recv_timestamp = time.time()
+        self.assertTrue(self.policy(self.addr, "AUDIO"))
+        self.assertEqual(self.policy.shed, {"AUDIO": 1, "CLM_REQ_SERVER_LIST": 1})
+
+    def test_kernel_drops(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        for n in range(200):
+            sock.sendto(bytes(500), self.jc.sock.getsockname())
+        while True:
+            try:
+                self.jc.recv_data(timeout=0.1)
+            except TimeoutError:
+                break
+        # the drop counter comes with datagrams queued after the drops
+        sock.sendto(bytes(500), self.jc.sock.getsockname())
+        self.jc.recv_data(timeout=1)
+        sock.close()
+        self.assertGreater(self.jc.drops, 0)
+        self.assertFalse(self.policy(self.addr, "CLM_REQ_SERVER_LIST"))
+        self.assertTrue(self.policy(self.addr, "CLM_REGISTER_SERVER"))
+
+
+class Test_PingResponder(unittest.TestCase):
+    def setUp(self):
+        self.jc = JamulusConnector(host="127.0.0.1", port=0, log=False)
+        self.dispatcher = Dispatcher(self.jc)
+        self.responder = PingResponder(self.jc, clients=lambda: 7)
+        self.dispatcher.add_fast_path(self.responder)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.settimeout(1)
+        self.server = self.jc.sock.getsockname()
+
+    def tearDown(self):
+        self.sock.close()
+        self.jc.close()
+
+    def ping(self, data):
+        self.sock.sendto(data, self.server)
+        handled = self.dispatcher.recv(timeout=1)
+        return handled, self.sock.recvfrom(100)[0] if handled else None
+
+    def test_ping(self):
+        data = self.jc.main_pack("CLM_PING_MS", {"time": 1234}, 0)
+        self.assertEqual(self.ping(data), (True, data))
+
+    def test_ping_with_clients(self):
+        handled, reply = self.ping(self.jc.main_pack("CLM_PING_MS_WITHNUMCLIENTS", {"time": 1234, "clients": 0}, 0))
+        self.assertTrue(handled)
+        self.assertEqual(reply, self.jc.main_pack("CLM_PING_MS_WITHNUMCLIENTS", {"time": 1234, "clients": 7}, 0))
+        self.assertTrue(self.responder.report().startswith("1 pings answered"))
+
+    def test_invalid_crc(self):
+        data = bytearray(self.jc.main_pack("CLM_PING_MS", {"time": 1234}, 0))
+        data[-1] ^= 0xFF
+        self.sock.sendto(data, self.server)
+        data, addr = self.jc.recv_data(timeout=1)
+        self.assertFalse(self.responder(data, addr))
+
+    def test_timestamps(self):
+        if not self.jc.enable_timestamps():
+            self.skipTest("kernel timestamps are not supported")
+        self.ping(self.jc.main_pack("CLM_PING_MS", {"time": 1}, 0))
+        self.assertIsNotNone(self.jc.recv_timestamp)
+        self.assertEqual(self.responder.turnarounds, 1)
+
+
+class Test_Resolver(unittest.TestCase):
+    def setUp(self):
+        self.records = {"a.example": [("10.0.0.1", 1), ("10.0.0.2", 1)]}
+        self.resolver = Resolver(ttl=10, retry=5, lookup=self.lookup)
+        self.server = ServerAddress("a.example", self.records["a.example"])
+        self.resolver.add(self.server, now=0)
+
+    def tearDown(self):
+        self.resolver.close()
+
+    def lookup(self, host, port):
+        if host not in self.records:
+            raise OSError("unknown host")
+        return self.records[host]
+
+    def wait(self):
+        for resolution in self.resolver.resolutions.values():
+            if resolution.future is not None:
+                resolution.future.exception()
+
+    def test_refresh(self):
+        self.assertEqual(self.resolver.address(self.server, now=5), ("10.0.0.1", 1))
+        self.assertFalse(self.resolver.pending)
+
+        # cached address used while resolving in the background
+        self.records["a.example"] = [("10.0.0.3", 1)]
+        self.assertEqual(self.resolver.address(self.server, now=10), ("10.0.0.1", 1))
+        self.assertTrue(self.resolver.pending)
+        self.wait()
+        self.assertEqual(self.resolver.address(self.server, now=11), ("10.0.0.3", 1))
+        self.assertFalse(self.resolver.pending)
+
+    def test_keep_address(self):
+        self.assertEqual(self.resolver.failover(self.server), ("10.0.0.2", 1))
+        self.records["a.example"] = [("10.0.0.4", 1), ("10.0.0.2", 1)]
+        self.resolver.address(self.server, now=10)
+        self.wait()
+        self.assertEqual(self.resolver.address(self.server, now=11), ("10.0.0.2", 1))
+
+    def test_failover(self):
+        self.assertEqual(self.resolver.addresses(self.server), [("10.0.0.1", 1), ("10.0.0.2", 1)])
+        self.assertEqual(self.resolver.failover(self.server), ("10.0.0.2", 1))
+        self.assertEqual(self.resolver.failover(self.server), ("10.0.0.1", 1))
+
+    def test_lookup_error(self):
+        del self.records["a.example"]
+        self.resolver.address(self.server, now=10)
+        self.wait()
+        self.assertEqual(self.resolver.address(self.server, now=11), ("10.0.0.1", 1))
+        self.assertEqual(self.resolver.resolutions[("a.example", 1)].expires, 16)
+
+
+class Test_Message(unittest.TestCase):
+    def setUp(self):
+        self.jc = JamulusConnector(port=None)
+        self.servers = [
+            {
+                "ip": "0.0.0.0",
+                "port": 0,
+                "country_id": 0,
+                "max_clients": 0,
+                "permanent": 1,
+                "name": "a",
+                "internal_address": "",
+                "city": "",
+            },
+            {
+                "ip": "127.0.0.1",
+                "port": 22124,
+                "country_id": 82,
+                "max_clients": 10,
+                "permanent": 0,
+                "name": "bc",
+                "internal_address": "",
+                "city": "x",
+            },
+        ]
+
+    def tearDown(self):
+        self.jc.close()
+
+    def test_header(self):
+        message = Message(self.jc, self.jc.main_pack("CLM_PING_MS_WITHNUMCLIENTS", {"time": 5, "clients": 2}, count=3))
+        self.assertEqual(message.key, "CLM_PING_MS_WITHNUMCLIENTS")
+        self.assertEqual(message.count, 3)
+        self.assertFalse(message.verified)
+        self.assertEqual(message["clients"], 2)
+        self.assertEqual(message.values, {"time": 5, "clients": 2})
+
+    def test_records(self):
+        message = Message(self.jc, self.jc.main_pack("CLM_SERVER_LIST", self.servers, count=0))
+        self.assertEqual(len(message), 2)
+        self.assertIsNone(message.decoded)
+        self.assertEqual(list(message.records()), self.servers)
+        self.assertEqual(message[1], self.servers[1])
+        self.assertEqual(message.values, self.servers)
+
+    def test_reduced_server(self):
+        data = self.jc.main_pack("CLM_RED_SERVER_LIST", map(reduced_server, self.servers), count=0)
+        message = Message(self.jc, data)
+        self.assertEqual(message.values[1], {"ip": "127.0.0.1", "port": 22124, "name": "bc"})
+
+        server = dict(self.servers[0], name="\u00e4" * 200)
+        self.assertEqual(reduced_server(server)["name"], "\u00e4" * 127)
+
+    def test_failing(self):
+        with self.assertRaises(DecodeError):
+            # invalid length
+            Message(self.jc, bytearray.fromhex("0000e903000500000000006f60"))
+
+        message = Message(self.jc, bytearray.fromhex("0000e903000400000000006f61"))
+        with self.assertRaises(DecodeError) as context:
+            # invalid crc
+            message.values
+        self.assertEqual(context.exception.kind, "crc")
+
+
+class Test_Dispatcher(unittest.TestCase):
+    def setUp(self):
+        self.jc = JamulusConnector(port=None, log=False)
+        self.dispatcher = Dispatcher(self.jc)
+        self.handled = []
+
+    def tearDown(self):
+        self.jc.close()
+
+    def handler(self, addr, key, count, values):
+        self.handled.append((addr, key, values))
+
+    def test_dispatch(self):
+        self.dispatcher.add_handler("CLM_PING_MS", self.handler)
+        self.dispatcher.add_handler("AUDIO", self.handler)
+
+        self.assertTrue(self.dispatcher.dispatch(bytearray.fromhex("0000e903000400000000006f60"), ("a", 1)))
+        self.assertTrue(self.dispatcher.dispatch(b"\x00\xff\xfe", ("a", 1)))
+        self.assertEqual(
+            self.handled,
+            [(("a", 1), "CLM_PING_MS", {"time": 0}), (("a", 1), "AUDIO", {"data": b"\x00\xff\xfe"})],
+        )
+
+        # not handled (and not decoded, the crc is invalid)
+        self.assertFalse(self.dispatcher.dispatch(bytearray.fromhex("0000ef0300000018cc"), ("a", 1)))
+        self.assertEqual(len(self.handled), 2)
+
+    def test_lazy_handler(self):
+        self.dispatcher.add_handler("CLM_PING_MS", self.handler, lazy=True)
+
+        self.assertTrue(self.dispatcher.dispatch(bytearray.fromhex("0000e903000400000000006f60"), ("a", 1)))
+        message = self.handled[0][2]
+        self.assertIsInstance(message, Message)
+        self.assertEqual(message["time"], 0)
+
+    def test_peer_handler(self):
+        self.dispatcher.add_handler("CLM_PING_MS", self.handler, addr=("a", 1))
+
+        self.assertFalse(self.dispatcher.dispatch(bytearray.fromhex("0000e903000400000000006f60"), ("b", 1)))
+        self.assertTrue(self.dispatcher.dispatch(bytearray.fromhex("0000e903000400000000006f60"), ("a", 1)))
+        self.assertEqual(self.handled, [(("a", 1), "CLM_PING_MS", {"time": 0})])
+
+        self.dispatcher.remove_handler("CLM_PING_MS", addr=("a", 1))
+        self.assertFalse(self.dispatcher.dispatch(bytearray.fromhex("0000e903000400000000006f60"), ("a", 1)))
+
+    def test_middleware(self):
+        self.dispatcher.add_handler("CLM_PING_MS", self.handler)
+        self.dispatcher.add_middleware(lambda addr, key: addr != ("b", 1))
+
+        self.assertFalse(self.dispatcher.dispatch(bytearray.fromhex("0000e903000400000000006f60"), ("b", 1)))
+        self.assertTrue(self.dispatcher.dispatch(bytearray.fromhex("0000e903000400000000006f60"), ("a", 1)))
+        self.assertEqual(len(self.handled), 1)
+
+
+class Test_RateLimiter(unittest.TestCase):
+    def test_budget(self):
+        limiter = RateLimiter({"CLM_REQ_SERVER_LIST": (0.001, 2)})
+        results = [limiter(("a", 1), "CLM_REQ_SERVER_LIST") for i in range(4)]
+        self.assertEqual(results, [True, True, False, False])
+        self.assertEqual(limiter.dropped, {"CLM_REQ_SERVER_LIST": 2})
+
+        # other source IP and unlimited keys
+        self.assertTrue(limiter(("b", 1), "CLM_REQ_SERVER_LIST"))
+        self.assertTrue(limiter(("a", 1), "CLM_PING_MS"))
+
+    def test_eviction(self):
+        limiter = RateLimiter({"CLM_REQ_SERVER_LIST": (0.001, 1)}, max_sources=2)
+        results = [limiter((host, 1), "CLM_REQ_SERVER_LIST") for host in ["a", "b", "c"]]
+        # buckets in use are kept, the new source is refused
+        self.assertEqual(results, [True, True, False])
+        self.assertEqual(list(limiter.buckets.keys()), [("a", "CLM_REQ_SERVER_LIST"), ("b", "CLM_REQ_SERVER_LIST")])
+
+        limiter.idle_timeout = 0
+        limiter(("d", 1), "CLM_REQ_SERVER_LIST")
+        self.assertEqual(list(limiter.buckets.keys()), [("d", "CLM_REQ_SERVER_LIST")])
+
+    def test_no_reset_by_cycling(self):
+        # cycling through more sources than the table holds must not refill the exhausted buckets
+        limiter = RateLimiter({"CLM_REQ_SERVER_LIST": (0.001, 1)}, max_sources=2)
+        self.assertTrue(limiter(("a", 1), "CLM_REQ_SERVER_LIST"))
+        for host in ["b", "c", "d", "e"]:
+            limiter((host, 1), "CLM_REQ_SERVER_LIST")
+        self.assertFalse(limiter(("a", 1), "CLM_REQ_SERVER_LIST"))
+        self.assertIn(("a", "CLM_REQ_SERVER_LIST"), limiter.buckets)
+
+
+class Test_SessionTable(unittest.TestCase):
+    def test_ids(self):
+        sessions = SessionTable(max_sessions=3, first_id=1)
+        self.assertEqual([sessions.create(("a", n), now=0).id for n in range(3)], [1, 2, 3])
+        self.assertIsNone(sessions.create(("a", 3), now=0))
+
+        # the lowest free ID is reused
+        sessions.remove(("a", 2))
+        sessions.remove(("a", 1))
+        self.assertEqual(sessions.create(("b", 1), now=0).id, 2)
+        self.assertEqual(len(sessions), 2)
+        self.assertIn(("b", 1), sessions)
+        self.assertNotIn(("a", 1), sessions)
+        self.assertIsNone(sessions.remove(("a", 1)))
+
+    def test_recreate(self):
+        # the session of an address that is created again gets the lowest free ID (its own), also on a full table
+        sessions = SessionTable(max_sessions=3)
+        for n in range(3):
+            sessions.create(("a", n), now=0)
+        self.assertEqual(sessions.create(("a", 0), now=1).id, 0)
+        self.assertEqual(len(sessions), 3)
+
+        sessions.remove(("a", 2))
+        self.assertEqual(sessions.create(("a", 1), now=2).id, 1)
+        self.assertEqual(sorted(session.id for session in sessions), [0, 1])
+
+    def test_expire(self):
+        sessions = SessionTable(timeout=10)
+        for n in range(3):
+            sessions.create(("a", n), now=n)
+        sessions.touch(sessions.get(("a", 0)), now=5)
+
+        expired = sessions.expire(now=12)
+        self.assertEqual([s.addr for s in expired], [("a", 1), ("a", 2)])
+        self.assertEqual([s.id for s in sessions], [0])
+        self.assertEqual(sessions.create(("b", 0), now=12).id, 1)
+
+
+class Test_JitterBuffer(unittest.TestCase):
+    def test_sequence(self):
+        buffer = JitterBuffer(4, frame_period=0.01)
+        # reordered, duplicate and wrapping sequence numbers
+        for sequence in [254, 0, 255, 0, 1]:
+            buffer.put(bytes((sequence,)), sequence, now=0)
+        self.assertEqual(len(buffer), 4)
+        self.assertEqual([buffer.get() for i in range(3)], [b"\xfe", b"\xff", b"\x00"])
+        self.assertEqual(buffer.duplicates, 1)
+
+        # frame 2 lost, frame 3 arrives after it was due
+        buffer.put(b"\x04", 4, now=0)
+        self.assertEqual([buffer.get() for i in range(3)], [b"\x01", None, None])
+        buffer.put(b"\x03", 3, now=0)
+        self.assertEqual(buffer.get(), b"\x04")
+        self.assertEqual((buffer.underruns, buffer.late), (2, 1))
+
+        # buffer ran empty, playing starts again when half filled
+        self.assertIsNone(buffer.get())
+        self.assertEqual(buffer.underruns, 3)
+        buffer.put(b"\x05", 5, now=0)
+        self.assertIsNone(buffer.get())
+        buffer.put(b"\x06", 6, now=0)
+        self.assertEqual(buffer.get(), b"\x05")
+
+    def test_overrun(self):
+        buffer = JitterBuffer(2, frame_period=0.01)
+        for data in [b"a", b"b", b"c"]:
+            buffer.put(data, now=0)
+        self.assertEqual(buffer.overruns, 1)
+        self.assertEqual([buffer.get(), buffer.get()], [b"b", b"c"])
+
+    def test_auto_size(self):
+        buffer = JitterBuffer(AUTO_JITT_BUF_SIZE, frame_period=0.01)
+        for sequence in range(20):
+            buffer.put(b"a", sequence, now=sequence * 0.01)
+        self.assertEqual(buffer.size, 1)
+
+        # frames arriving in bursts
+        for sequence in range(20, 100):
+            buffer.put(b"a", sequence, now=(sequence // 4) * 0.04)
+        self.assertGreater(buffer.size, 4)
+        self.assertGreater(buffer.jitter, 0.01)
+
+
+@unittest.skipUnless(numpy, "requires NumPy")
+class Test_Mixer(unittest.TestCase):
+    def test_mix(self):
+        mixer = Mixer(max_channels=3, frame_samples=2)
+        self.assertTrue(mixer.set_input(0, struct.pack("<2h", 100, 200), 1))
+        self.assertTrue(mixer.set_input(2, struct.pack("<4h", 10, 20, 30, 40), 2))
+        self.assertFalse(mixer.set_input(1, b"\x00", 1))
+
+        # listener 0 hears channel 2 at half gain, listener 2 hears channel 0 on the left
+        mixer.set_gain(0, 2, MAX_GAIN // 2)
+        mixer.set_pan(2, 0, 0)
+        output = mixer.mix([0, 2])
+        self.assertEqual(output[0].tolist(), [[105, 215], [110, 220]])
+        self.assertEqual(output[1].tolist(), [[110, 230], [20, 40]])
+
+        frames = mixer.encode(output, [2, 1])
+        self.assertEqual(frames[0], struct.pack("<4h", 105, 110, 215, 220))
+        self.assertEqual(frames[1], struct.pack("<2h", 65, 135))
+
+        mixer.reset(2)
+        mixer.set_pan(0, 0, MAX_PAN)
+        output = mixer.mix([0, 2])
+        self.assertEqual(output.tolist(), [[[0, 0], [100, 200]], [[100, 200], [100, 200]]])
+
+    def test_encode(self):
+        # clipped, no frames starting with two zero bytes
+        mixer = Mixer(max_channels=1, frame_samples=2)
+        output = numpy.array([[[0, 40000], [0, -40000]]], dtype=numpy.float32)
+        self.assertEqual(mixer.encode(output, [2]), [struct.pack("<4h", 1, 0, 32767, -32768)])
+
+
+class Test_AudioCodec(unittest.TestCase):
+    props = {"base_netw_size": 9, "block_size_fact": 2, "num_chan": 2, "audiocod_type": AUDIO_CODEC_OPUS64}
+
+    def test_stand_in(self):
+        codec = StandInCodec(4, 2, 6)
+        pcm = struct.pack("<8h", 0x100, 0x200, 0x300, 0x400, 0x500, 0x600, 0x700, 0x800)
+        data = codec.encode(pcm)
+        self.assertEqual(data, b"\xff\x01\x02\x05\x06\x00")
+        self.assertEqual(codec.decode(data), struct.pack("<8h", 0x100, 0x200, 0x100, 0x200, 0x500, 0x600, 0x500, 0x600))
+        self.assertEqual(codec.decode(None), bytes(16))
+
+    def test_packets(self):
+        codec = AudioCodec(self.props, StandInCodec)
+        self.assertEqual((codec.samples, codec.packet_bytes), (128, 18))
+        pcm = bytes(range(256)) * 2
+        data = codec.encode(pcm)
+        self.assertEqual(len(data), 18)
+        self.assertEqual(len(codec.decode(data)), 512)
+        # lost and invalid packets
+        self.assertEqual(codec.decode(None), bytes(512))
+        self.assertEqual(codec.decode(data[1:]), bytes(512))
+
+    def test_raw(self):
+        props = dict(self.props, base_netw_size=256, audiocod_type=AUDIO_CODEC_NONE)
+        codec = AudioCodec(props)
+        self.assertEqual(codec.encode(b"a" * 512), b"a" * 512)
+        self.assertEqual(codec.decode(b"a"), bytes(512))
+
+        with self.assertRaises(ValueError):
+            AudioCodec(dict(props, base_netw_size=128))
+        with self.assertRaises(ValueError):
+            AudioCodec(dict(props, audiocod_type=1))
+
+    @unittest.skipUnless(OpusCodec.load(), "requires libopus with custom modes")
+    def test_opus(self):
+        codec = AudioCodec(self.props, OpusCodec)
+        data = codec.encode(bytes(512))
+        self.assertEqual(len(data), 18)
+        self.assertEqual(len(codec.decode(data)), 512)
+        self.assertEqual(len(codec.decode(None)), 512)
+
+
+@unittest.skipUnless(numpy, "requires NumPy")
+class Test_LevelMeter(unittest.TestCase):
+    def test_levels(self):
+        meter = LevelMeter(max_channels=4)
+        meter.add([0, 1, 2], numpy.array([[0, 104], [-32768, 0], [-104, 103]], dtype=numpy.float32))
+        meter.add([2], numpy.array([[1036]], dtype=numpy.float32))
+        # 0 dB, -30 dB, -50 dB
+        levels = meter.levels([3, 1, 2, 0])
+        self.assertEqual(levels.tolist(), [0, 8, 4, 1])
+        self.assertEqual(meter.levels([1]).tolist(), [0])
+
+        data = meter.pack(levels)
+        self.assertEqual(data, b"\x80\x14")
+        self.assertEqual(meter.pack(levels[:3]), b"\x80\x04")
+        self.assertEqual(meter.unpack(data, 3), [0, 8, 4])
+
+    def test_update(self):
+        jc = JamulusConnector(port=None, log=False)
+        sent = []
+        jc.sendto = lambda addr, key, values: sent.append((addr, values["levels"]))
+        meter = LevelMeter(max_channels=2, interval=1)
+        meter.subscribe(("a", 1))
+        meter.subscribe(("b", 1))
+        meter.subscribe(("b", 1), False)
+
+        meter.add([0], numpy.array([[32767]], dtype=numpy.float32))
+        self.assertEqual(meter.update(jc, [0, 1], now=10), 1)
+        # throttled, unchanged levels are not sent again
+        self.assertEqual(meter.update(jc, [0, 1], now=10.5), 0)
+        meter.add([0], numpy.array([[32767]], dtype=numpy.float32))
+        self.assertEqual(meter.update(jc, [0, 1], now=11), 0)
+        self.assertEqual(meter.update(jc, [0, 1], now=12), 1)
+        self.assertEqual(sent, [(("a", 1), b"\x08"), (("a", 1), b"\x00")])
+        jc.close()
+
+
+class Test_Metrics(unittest.TestCase):
+    def test_counters(self):
+        metrics = Metrics()
+        metrics.inc("packets", (("key", "AUDIO"),))
+        metrics.inc("packets", (("key", "AUDIO"),), 2)
+        self.assertEqual(metrics.get("packets", (("key", "AUDIO"),)), 3)
+        self.assertEqual(metrics.get("packets", (("key", "ACKN"),)), 0)
+
+    def test_exposition(self):
+        metrics = Metrics(buckets=(0.001, 0.01))
+        metrics.inc("packets_total", (("key", "ACKN"),))
+        metrics.observe("decode_seconds", 0.005)
+        metrics.observe("decode_seconds", 1)
+
+        lines = metrics.exposition().splitlines()
+        self.assertIn('packets_total{key="ACKN"} 1', lines)
+        self.assertIn('decode_seconds_bucket{le="0.001"} 0', lines)
+        self.assertIn('decode_seconds_bucket{le="0.01"} 1', lines)
+        self.assertIn('decode_seconds_bucket{le="+Inf"} 2', lines)
+        self.assertIn("decode_seconds_count 2", lines)
+
+
+class Test_Profiler(unittest.TestCase):
+    def test_sampling(self):
+        profiler = Profiler(sample_interval=2)
+        for i in range(10):
+            profiler.stop("a", profiler.start())
+        profiler.stop("b", profiler.start())
+
+        stats = {name: (calls, seconds) for name, calls, seconds in profiler.stats()}
+        self.assertEqual(stats["a"][0], 10)
+        self.assertEqual(stats["b"][0], 1)
+        self.assertEqual(profiler.entries["a"][1], 5)
+        self.assertGreater(stats["a"][1], 0)
+        self.assertIn("calls", profiler.report())
+
 
 if __name__ == "__main__":
     unittest.main()